@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""cpkt.core.bitmap 性能基准
+
+用法：
+    python benchmarks/bitmap_bench.py [--sizes 1,64,512] [--repeat 3]
+
+sizes 单位为 MB；每个尺寸先在前 CHECK_BYTES 字节上与逐字节实现的参考结果做交叉校验，再用 timeit 计时
+"""
+import argparse
+import random
+import timeit
+
+from cpkt.core import bitmap
+
+CHECK_BYTES = 256 * 1024  # 参考实现逐位运行，仅在位图前缀上校验
+DENSITY_STEP = 4099  # 每隔多少字节写入一段脏数据，模拟稀疏的差异位图
+
+
+class ReferenceBitMap(object):
+    """逐字节/逐位的参考实现，只用于校验结果"""
+
+    def __init__(self, data, max_bit_num):
+        self.data = data
+        self.max_bit_num = max_bit_num
+
+    def bits(self):
+        return [i for i in range(self.max_bit_num) if self.data[i // 8] & bitmap.BITMASK[i % 8]]
+
+    def count(self):
+        return len(self.bits())
+
+    def runs(self):
+        runs = list()
+        for i in self.bits():
+            if runs and runs[-1][0] + runs[-1][1] == i:
+                runs[-1][1] += 1
+            else:
+                runs.append([i, 1])
+        return [tuple(r) for r in runs]
+
+
+def make_data(size, seed):
+    rnd = random.Random(seed)
+    data = bytearray(size)
+    for offset in range(rnd.randrange(DENSITY_STEP), size, DENSITY_STEP):
+        length = rnd.randint(1, 64)
+        data[offset:offset + length] = bytes(rnd.getrandbits(8) for _ in range(len(data[offset:offset + length])))
+    return data
+
+
+def cross_check(data_a, data_b):
+    """在前缀上对照参考实现校验结果"""
+
+    size = min(len(data_a), CHECK_BYTES)
+    max_bit_num = size * 8 - 3  # 覆盖末尾不完整字节
+    a = bitmap.BitMap(bytearray(data_a[:size]), max_bit_num)
+    b = bitmap.BitMap(bytearray(data_b[:size]), max_bit_num)
+    ref_a = ReferenceBitMap(a.bitmap, max_bit_num)
+    ref_b = ReferenceBitMap(b.bitmap, max_bit_num)
+
+    assert a.count() == ref_a.count(), 'count'
+    assert a.any() == bool(ref_a.bits()), 'any'
+    assert list(a.enum_nonzero()) == ref_a.bits(), 'enum_nonzero'
+    assert list(a.enum_runs()) == ref_a.runs(), 'enum_runs'
+    assert a.count_range(1001, 77777) == len([i for i in ref_a.bits() if 1001 <= i < 1001 + 77777]), 'count_range'
+    assert set((a | b).enum_nonzero()) == set(ref_a.bits()) | set(ref_b.bits()), 'or'
+    assert set((a & b).enum_nonzero()) == set(ref_a.bits()) & set(ref_b.bits()), 'and'
+    assert set(a.difference(b).enum_nonzero()) == set(ref_a.bits()) - set(ref_b.bits()), 'difference'
+
+
+def bench_size(size_mb, repeat):
+    size = size_mb * 1024 * 1024
+    data_a = make_data(size, 1)
+    data_b = make_data(size, 2)
+    cross_check(data_a, data_b)
+
+    a = bitmap.BitMap(data_a)
+    b = bitmap.BitMap(data_b)
+    empty = bitmap.BitMap(bytes(size))
+    extent = 1024 * 1024  # 区间操作：1M 位（4K 块时对应 4GB 数据）
+
+    cases = [
+        ('count', lambda: a.count()),
+        ('any (empty)', lambda: empty.any()),
+        ('enum_nonzero', lambda: sum(1 for _ in a.enum_nonzero())),
+        ('enum_runs', lambda: sum(1 for _ in a.enum_runs())),
+        ('set_range', lambda: a.set_range(12345, extent)),
+        ('reset_range', lambda: a.reset_range(12345, extent)),
+        ('count_range', lambda: a.count_range(12345, extent)),
+        ('a | b', lambda: a | b),
+        ('a |= b', lambda: a.__ior__(b)),
+        ('a.difference(b)', lambda: a.difference(b)),
+    ]
+
+    print('--- {} MB ---'.format(size_mb))
+    for name, fn in cases:
+        seconds = min(timeit.repeat(fn, number=1, repeat=repeat))
+        print('{:<20}{:>10.4f} s'.format(name, seconds))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='cpkt.core.bitmap benchmark')
+    parser.add_argument('--sizes', default='1,64,512', help='bitmap sizes in MB, comma separated')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    for size_mb in [int(x) for x in args.sizes.split(',')]:
+        bench_size(size_mb, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""cpkt.core.rwlock 性能基准
+
+用法：
+    python benchmarks/rwlock_bench.py [--threads 1,2,4,8,16,32,64] [--seconds 1] [--write-ratio 0.1]
+
+每个线程循环获取读锁/写锁（按 write-ratio 比例）并立即释放，统计固定时长内所有线程完成的获取次数；
+线程数为 1 时即为无竞争开销
+"""
+import argparse
+import random
+import threading
+import time
+
+from cpkt.core import rwlock
+
+LOCK_CLASSES = [
+    rwlock.RWLockRead, rwlock.RWLockWrite, rwlock.RWLockFair,
+    rwlock.RWLockReadC, rwlock.RWLockWriteC, rwlock.RWLockFairC, rwlock.RWLockReentrant,
+]
+
+
+def run_case(lock_class, thread_num, seconds, write_ratio):
+    lock = lock_class()
+    stop = threading.Event()
+    counts = [0] * thread_num
+
+    def worker(idx):
+        rnd = random.Random(idx)
+        r_lock, w_lock = lock.gen_rlock(), lock.gen_wlock()
+        n = 0
+        while not stop.is_set():
+            for _ in range(100):
+                with (w_lock if rnd.random() < write_ratio else r_lock):
+                    pass
+            n += 100
+        counts[idx] = n
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(thread_num)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    return sum(counts) / seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description='cpkt.core.rwlock benchmark')
+    parser.add_argument('--threads', default='1,2,4,8,16,32,64')
+    parser.add_argument('--seconds', type=float, default=1.0)
+    parser.add_argument('--write-ratio', type=float, default=0.1)
+    args = parser.parse_args()
+
+    thread_nums = [int(x) for x in args.threads.split(',')]
+    print('{:<14}'.format('ops/s') + ''.join('{:>12}'.format('{} thr'.format(n)) for n in thread_nums))
+    for lock_class in LOCK_CLASSES:
+        line = '{:<14}'.format(lock_class.__name__)
+        for n in thread_nums:
+            line += '{:>12.0f}'.format(run_case(lock_class, n, args.seconds, args.write_ratio))
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
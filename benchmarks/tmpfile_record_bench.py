@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""cpkt.tmpfile 记录编解码性能基准：文本格式（RECORD_VERSION）与二进制格式（RECORD_VERSION_BINARY）
+
+用法：
+    python benchmarks/tmpfile_record_bench.py [--number 20000] [--repeat 3]
+
+先校验两种格式的解析结果一致、原地补丁与整条重写结果一致，再用 timeit 计时；输出每秒处理的记录数
+"""
+import argparse
+import timeit
+
+from cpkt.tmpfile import common
+
+RECORD_PARAMS = dict(index=4097, delete_timestamp=common.EMPTY_TIMESTAMP_STR, create_timestamp=1700000000,
+                     status=common.STATUS_UNKNOWN, change_timestamp=common.EMPTY_TIMESTAMP_STR, pid=123456,
+                     pid_create_timestamp=1690000000, file_path='/home/aio/tmp/' + 'x' * 64 + '.qcow2',
+                     caller_msg='cpkt/store/nfs_api.py.add_nfs_server_dir(231)')
+
+CHANGE = dict(status=common.STATUS_WAIT_DELETE, change_timestamp=1700000001, delete_timestamp=1700000121)
+
+
+def text_change(record):
+    """文本格式修改状态：解析后整条重写"""
+
+    record_dict = common.RecordManipulate.record_parse(record)
+    record_dict.update(CHANGE)
+    return common.RecordManipulate.dict2record(record_dict)
+
+
+def binary_change(record):
+    """二进制格式修改状态：原地补丁"""
+
+    buf = bytearray(record)
+    for offset, data in common.RecordManipulate.record_patch(record, **CHANGE):
+        buf[offset:offset + len(data)] = data
+    return buf
+
+
+def cross_check(text, binary):
+    text_dict = common.RecordManipulate.record_parse(text)
+    binary_dict = common.RecordManipulate.record_parse(binary)
+    assert text_dict.pop('version') == common.RECORD_VERSION, 'text version'
+    assert binary_dict.pop('version') == common.RECORD_VERSION_BINARY, 'binary version'
+    assert text_dict == binary_dict, 'parse'
+
+    changed = common.RecordManipulate.record_parse(text_change(text))
+    assert changed == dict(common.RecordManipulate.record_parse(text), **CHANGE), 'text change'
+    expected = common.RecordManipulate.record_format(
+        version=common.RECORD_VERSION_BINARY, **dict(RECORD_PARAMS, **CHANGE))
+    assert bytes(binary_change(binary)) == expected, 'binary change'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='cpkt.tmpfile record codec benchmark')
+    parser.add_argument('--number', type=int, default=20000, help='records per timing')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    text = common.RecordManipulate.record_format(version=common.RECORD_VERSION, **RECORD_PARAMS)
+    binary = common.RecordManipulate.record_format(version=common.RECORD_VERSION_BINARY, **RECORD_PARAMS)
+    cross_check(text, binary)
+
+    cases = [
+        ('parse text', lambda: common.RecordManipulate.record_parse(text)),
+        ('parse binary', lambda: common.RecordManipulate.record_parse(binary)),
+        ('format text', lambda: common.RecordManipulate.record_format(version=common.RECORD_VERSION,
+                                                                      **RECORD_PARAMS)),
+        ('format binary', lambda: common.RecordManipulate.record_format(version=common.RECORD_VERSION_BINARY,
+                                                                        **RECORD_PARAMS)),
+        ('change text', lambda: text_change(text)),
+        ('change binary', lambda: binary_change(binary)),
+    ]
+
+    for name, fn in cases:
+        seconds = min(timeit.repeat(fn, number=args.number, repeat=args.repeat))
+        print('{:<20}{:>12.0f} records/s'.format(name, args.number / seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+"""Read Write Lock for asyncio.
+
+Same preference policies as cpkt.core.rwlock, but waiting suspends the task instead of blocking the
+event loop thread:
+
+    lock = AsyncRWLockWrite()
+    async with lock.gen_rlock():
+        ...
+    w = lock.gen_wlock()
+    if await w.acquire(timeout=1):
+        try:
+            ...
+        finally:
+            w.release()
+
+The locks are not thread-safe: all tasks using one lock must run on the same event loop.
+"""
+
+import abc
+import asyncio
+import collections
+from types import TracebackType
+from typing import Optional
+from typing import Type
+
+
+class _AsyncRWLockBase(abc.ABC):
+    """Base of the asyncio Read/Write locks.
+
+    Waiters are queued in arrival order as [is_writer, future]; whenever the lock state changes
+    _wake() grants waiters according to the policy of the subclass by resolving their futures.
+    """
+
+    def __init__(self) -> None:
+        """Init."""
+        self.v_read_count = 0
+        self.v_writer = False
+        self.c_waiters = collections.deque()
+        self.v_write_waiting = 0
+
+    @abc.abstractmethod
+    def _can_read(self) -> bool:
+        raise NotImplementedError()
+
+    def _can_write(self) -> bool:
+        return not self.v_writer and 0 == self.v_read_count and not self.c_waiters
+
+    @abc.abstractmethod
+    def _wake(self) -> None:
+        raise NotImplementedError()
+
+    def _grant(self, p_waiter: list) -> None:
+        self.c_waiters.remove(p_waiter)
+        if p_waiter[0]:
+            self.v_write_waiting -= 1
+            self.v_writer = True
+        else:
+            self.v_read_count += 1
+        p_waiter[1].set_result(True)
+
+    def _release_read(self) -> None:
+        self.v_read_count -= 1
+        if 0 == self.v_read_count:
+            self._wake()
+
+    def _release_write(self) -> None:
+        self.v_writer = False
+        self._wake()
+
+    async def _acquire(self, p_writer: bool, blocking: bool, timeout: float) -> bool:
+        if self._can_write() if p_writer else self._can_read():
+            if p_writer:
+                self.v_writer = True
+            else:
+                self.v_read_count += 1
+            return True
+        if not blocking:
+            return False
+
+        c_waiter = [p_writer, asyncio.get_event_loop().create_future()]
+        self.c_waiters.append(c_waiter)
+        self.v_write_waiting += p_writer
+        try:
+            await asyncio.wait_for(c_waiter[1], None if timeout < 0 else timeout)
+            return True
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if c_waiter[1].done() and not c_waiter[1].cancelled():
+                # 授予与超时/取消同时发生：已计入持有者，归还后按失败处理
+                if p_writer:
+                    self._release_write()
+                else:
+                    self._release_read()
+            else:
+                self.c_waiters.remove(c_waiter)
+                self.v_write_waiting -= p_writer
+                self._wake()  # 离开队列的写者可能正阻挡着读者
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            return False
+
+    class _aReader(object):
+        def __init__(self, p_RWLock: "_AsyncRWLockBase") -> None:
+            self.c_rw_lock = p_RWLock
+            self.v_locked = False
+
+        async def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+            """Acquire a lock."""
+            self.v_locked = await self.c_rw_lock._acquire(False, blocking, timeout)
+            return self.v_locked
+
+        def release(self) -> None:
+            """Release the lock."""
+            if not self.v_locked: raise RuntimeError("cannot release un-acquired lock")
+            self.v_locked = False
+            self.c_rw_lock._release_read()
+
+        def locked(self) -> bool:
+            """Answer to 'is it currently locked?'."""
+            return self.v_locked
+
+        async def __aenter__(self) -> None:
+            await self.acquire()
+
+        async def __aexit__(self, exc_type: Optional[Type[BaseException]], exc_val: Optional[Exception],
+                            exc_tb: Optional[TracebackType]) -> bool:
+            self.release()
+            return False
+
+    class _aWriter(object):
+        def __init__(self, p_RWLock: "_AsyncRWLockBase") -> None:
+            self.c_rw_lock = p_RWLock
+            self.v_locked = False
+
+        async def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+            """Acquire a lock."""
+            self.v_locked = await self.c_rw_lock._acquire(True, blocking, timeout)
+            return self.v_locked
+
+        def release(self) -> None:
+            """Release the lock."""
+            if not self.v_locked: raise RuntimeError("cannot release un-acquired lock")
+            self.v_locked = False
+            self.c_rw_lock._release_write()
+
+        def locked(self) -> bool:
+            """Answer to 'is it currently locked?'."""
+            return self.v_locked
+
+        async def __aenter__(self) -> None:
+            await self.acquire()
+
+        async def __aexit__(self, exc_type: Optional[Type[BaseException]], exc_val: Optional[Exception],
+                            exc_tb: Optional[TracebackType]) -> bool:
+            self.release()
+            return False
+
+    def gen_rlock(self) -> "_AsyncRWLockBase._aReader":
+        """Generate a reader lock."""
+        return _AsyncRWLockBase._aReader(self)
+
+    def gen_wlock(self) -> "_AsyncRWLockBase._aWriter":
+        """Generate a writer lock."""
+        return _AsyncRWLockBase._aWriter(self)
+
+
+class AsyncRWLockRead(_AsyncRWLockBase):
+    """An asyncio Read/Write lock giving preference to Reader."""
+
+    def _can_read(self) -> bool:
+        return not self.v_writer
+
+    def _wake(self) -> None:
+        if self.v_writer:
+            return
+        if len(self.c_waiters) > self.v_write_waiting:
+            c_readers = [w for w in self.c_waiters if not w[0]]
+            self.c_waiters = collections.deque(w for w in self.c_waiters if w[0])
+            self.v_read_count += len(c_readers)
+            for c_waiter in c_readers:
+                c_waiter[1].set_result(True)
+        elif 0 == self.v_read_count and self.c_waiters:
+            self._grant(self.c_waiters[0])
+
+
+class AsyncRWLockWrite(_AsyncRWLockBase):
+    """An asyncio Read/Write lock giving preference to Writer."""
+
+    def _can_read(self) -> bool:
+        return not self.v_writer and 0 == self.v_write_waiting
+
+    def _wake(self) -> None:
+        if self.v_writer:
+            return
+        if self.v_write_waiting:
+            if 0 == self.v_read_count:
+                self._grant(next(w for w in self.c_waiters if w[0]))
+            return
+        while self.c_waiters:
+            self._grant(self.c_waiters[0])
+
+
+class AsyncRWLockFair(_AsyncRWLockBase):
+    """An asyncio Read/Write lock giving fairness to both Reader and Writer.
+
+    Waiters are served strictly in arrival order; consecutive readers enter together.
+    """
+
+    def _can_read(self) -> bool:
+        return not self.v_writer and not self.c_waiters
+
+    def _wake(self) -> None:
+        while self.c_waiters and not self.v_writer:
+            if self.c_waiters[0][0]:
+                if 0 == self.v_read_count:
+                    self._grant(self.c_waiters[0])
+                return
+            self._grant(self.c_waiters[0])
@@ -1,6 +1,70 @@
+import array
+import bisect
+import io
+import mmap
+import multiprocessing
+import operator
+import os
+import re
+import struct
+import sys
+import tempfile
+import zlib
+
 BITMASK = [0x01, 0x02, 0x04, 0x08, 0x10, 0x20, 0x40, 0x80]
 BIT_CNT = [bin(i).count("1") for i in range(256)]
 
+WORD_BYTES = 8  # 按 64 位字处理
+CHUNK_BYTES = 64 * 1024  # 批量扫描时每次取出的字节数，须为 WORD_BYTES 的整数倍
+
+_ZERO_CHUNK = bytes(CHUNK_BYTES)
+_FULL_CHUNK = b'\xff' * CHUNK_BYTES
+_NONZERO_BYTES_RE = re.compile(b'[^\x00]+')
+_NOT_FULL_BYTES_RE = re.compile(b'[^\xff]+')
+
+SUMMARY_BLOCK_BYTES = 4096  # IndexedBitMap 摘要中每块覆盖的字节数
+SUMMARY_BLOCK_BITS = SUMMARY_BLOCK_BYTES * 8
+
+CONTAINER_BITS = 1 << 16  # RoaringBitMap 每个容器覆盖的位数
+CONTAINER_BYTES = CONTAINER_BITS // 8
+ARRAY_MAX_SIZE = 4096  # 数组容器的最大元素个数，此时与位集容器内存占用相当
+
+PARALLEL_MIN_BYTES = 4 * 1024 * 1024  # 小于该字节数时并行的进程开销大于收益，直接在当前进程计算
+PARALLEL_OPS = {
+    'and': operator.and_,
+    'or': operator.or_,
+    'xor': operator.xor,
+    'andnot': None,  # 第一个位图减去其余所有位图
+}
+
+# 序列化格式：头部 | 若干帧（4 字节长度 + 数据，长度为 0 表示结束）| 所有帧数据的 crc32
+SERIAL_MAGIC = b'CBMP'
+SERIAL_VERSION = 1
+ENCODINGS = ('raw', 'rle', 'zlib', 'roaring')
+_SERIAL_HEADER = struct.Struct('<4sBBxxQ')  # magic, version, encoding, max_bit_num
+_FRAME_LENGTH = struct.Struct('<I')
+_ROARING_CONTAINER_HEADER = struct.Struct('<IBI')  # high, kind, n
+
+
+def _range_edges(start, count):
+    """
+    Return (first_byte, last_byte, head_mask, tail_mask) of bits [start, start + count), count > 0
+    """
+    end = start + count - 1
+    return start // 8, end // 8, (0xFF << (start % 8)) & 0xFF, 0xFF >> (7 - end % 8)
+
+
+def _and_not(a, b):
+    return a & ~b
+
+
+if hasattr(int, 'bit_count'):
+    def _popcount(x):
+        return x.bit_count()
+else:
+    def _popcount(x):
+        return bin(x).count('1')
+
 
 class BitMap(object):
     """
@@ -17,6 +81,129 @@ class BitMap(object):
         assert self.max_bytes_num >= (self.max_bit_num + 7) // 8
         self.bit_in_last_byte = self.max_bit_num % 8  # 0 表示正好字节对齐，非0表示最后一个字节中仅有前 n 个位有意义
 
+    @classmethod
+    def open_mmap(cls, path, max_bit_num, writable=False):
+        """
+        Create a BitMap backed by a mmap of the file at path
+
+        页面按需由内核换入，多个进程映射同一文件时共享同一份物理内存；
+        writable 为 True 时文件不足 max_bit_num 位则以 0 补齐，修改需调用 flush 才保证落盘
+        """
+        max_bytes_num = (max_bit_num + 7) // 8
+        with open(path, 'r+b' if writable else 'rb') as f:
+            file_size = os.fstat(f.fileno()).st_size
+            if file_size < max_bytes_num:
+                if not writable:
+                    raise ValueError('bitmap file {} too small: {} < {} bytes'.format(path, file_size, max_bytes_num))
+                f.truncate(max_bytes_num)
+            mmap_handle = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+        return cls(mmap_handle, max_bit_num)
+
+    def flush(self, start=0, count=None):
+        """
+        Flush bits@[start, start + count) to the backing file, count None means up to the end
+
+        仅对 open_mmap 创建的 BitMap 有效；刷新范围按页对齐
+        """
+        if not isinstance(self.bitmap, mmap.mmap):
+            return
+        end_byte = self.max_bytes_num if count is None else min((start + count + 7) // 8, self.max_bytes_num)
+        begin_byte = start // 8 // mmap.ALLOCATIONGRANULARITY * mmap.ALLOCATIONGRANULARITY
+        if end_byte > begin_byte:
+            self.bitmap.flush(begin_byte, end_byte - begin_byte)
+
+    def close(self):
+        """
+        Release the mmap created by open_mmap
+        """
+        if isinstance(self.bitmap, mmap.mmap):
+            self.bitmap.close()
+
+    def to_bytes(self, encoding='raw'):
+        """
+        Serialize into bytes, see write_to
+        """
+        f = io.BytesIO()
+        self.write_to(f, encoding)
+        return f.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Create a BitMap from bytes produced by to_bytes
+        """
+        return cls.read_from(io.BytesIO(data))
+
+    def write_to(self, fp, encoding='raw'):
+        """
+        Serialize into the binary file object fp
+
+        encoding:
+            raw      原始字节
+            rle      置位 run 的 (间隔, 长度) 变长整数序列，适合连续的稀疏位图
+            zlib     原始字节经 zlib 压缩
+            roaring  RoaringBitMap 容器序列，适合离散的稀疏位图
+        按 CHUNK_BYTES 分帧写入，除 roaring 外不会产生与位图等大的临时对象
+        """
+        if encoding not in ENCODINGS:
+            raise ValueError('unknown bitmap encoding {}'.format(encoding))
+        fp.write(_SERIAL_HEADER.pack(SERIAL_MAGIC, SERIAL_VERSION, ENCODINGS.index(encoding), self.max_bit_num))
+        writer = _FrameWriter(fp)
+        if encoding == 'rle':
+            _write_rle_frames(writer, self.enum_runs())
+        elif encoding == 'roaring':
+            _write_roaring_frames(writer, RoaringBitMap.from_bitmap(self))
+        else:
+            compressor = zlib.compressobj() if encoding == 'zlib' else None
+            for begin in range(0, self.max_bytes_num, CHUNK_BYTES):
+                end = min(begin + CHUNK_BYTES, self.max_bytes_num)
+                chunk = self._chunk_int(begin, end).to_bytes(end - begin, 'little')
+                writer.write(compressor.compress(chunk) if compressor else chunk)
+            if compressor:
+                writer.write(compressor.flush())
+        writer.close()
+
+    @classmethod
+    def read_from(cls, fp):
+        """
+        Create a BitMap backed by a bytearray from the binary file object fp written by write_to
+
+        :raise ValueError: 格式错误或校验失败
+        """
+        header = fp.read(_SERIAL_HEADER.size)
+        if len(header) != _SERIAL_HEADER.size:
+            raise ValueError('bitmap stream truncated')
+        magic, version, encoding_id, max_bit_num = _SERIAL_HEADER.unpack(header)
+        if magic != SERIAL_MAGIC or version != SERIAL_VERSION or encoding_id >= len(ENCODINGS):
+            raise ValueError('bad bitmap stream header {}'.format(header))
+        encoding = ENCODINGS[encoding_id]
+
+        result = cls(bytearray((max_bit_num + 7) // 8), max_bit_num)
+        frames = _iter_frames(fp)
+        try:
+            if encoding == 'rle':
+                for start, length in _iter_rle_runs(frames):
+                    result.set_range(start, length)
+            elif encoding == 'roaring':
+                for high, container in _iter_roaring_containers(frames):
+                    _fill_container(result, high, container)
+            else:
+                decompressor = zlib.decompressobj() if encoding == 'zlib' else None
+                offset = 0
+                for frame in frames:
+                    data = decompressor.decompress(frame) if decompressor else frame
+                    result.bitmap[offset:offset + len(data)] = data
+                    offset += len(data)
+                if decompressor:
+                    data = decompressor.flush()
+                    result.bitmap[offset:offset + len(data)] = data
+                    offset += len(data)
+                if offset != result.max_bytes_num:
+                    raise ValueError('bitmap stream size mismatch {} != {}'.format(offset, result.max_bytes_num))
+        except (zlib.error, struct.error, IndexError, OverflowError) as e:
+            raise ValueError('bitmap stream corrupted: {}'.format(e))
+        return result
+
     def __del__(self):
         """
         Destroy the BitMap
@@ -45,19 +232,77 @@ class BitMap(object):
         """
         Count bits set
         """
-        count = 0
-        if self.bit_in_last_byte:
-            for x in self.bitmap[:self.max_bytes_num - 1]:
-                count += BIT_CNT[x]
-            x = self.bitmap[self.max_bytes_num - 1]
-            for i in range(8):
-                if i >= self.bit_in_last_byte:
-                    x = ~BITMASK[i]
-            count += BIT_CNT[x]
+        return self._count_bytes(0, self._full_bytes_num()) + BIT_CNT[self._last_byte_value()]
+
+    def set_range(self, start, count):
+        """
+        Set the value of bits@[start, start + count) to 1
+        """
+        self._fill_range(start, count, True)
+
+    def reset_range(self, start, count):
+        """
+        Reset the value of bits@[start, start + count) to 0
+        """
+        self._fill_range(start, count, False)
+
+    def test_range_any(self, start, count):
+        """
+        Test if any bit@[start, start + count) is set
+        """
+        if count <= 0:
+            return False
+        first, last, head_mask, tail_mask = _range_edges(start, count)
+        if first == last:
+            return (self.bitmap[first] & head_mask & tail_mask) != 0
+        return ((self.bitmap[first] & head_mask) != 0 or (self.bitmap[last] & tail_mask) != 0
+                or not self._bytes_equal(first + 1, last, _ZERO_CHUNK))
+
+    def test_range_all(self, start, count):
+        """
+        Test if all bits@[start, start + count) are set
+        """
+        if count <= 0:
+            return True
+        first, last, head_mask, tail_mask = _range_edges(start, count)
+        if first == last:
+            return (self.bitmap[first] & head_mask & tail_mask) == head_mask & tail_mask
+        return ((self.bitmap[first] & head_mask) == head_mask and (self.bitmap[last] & tail_mask) == tail_mask
+                and self._bytes_equal(first + 1, last, _FULL_CHUNK))
+
+    def count_range(self, start, count):
+        """
+        Count bits set in [start, start + count)
+        """
+        if count <= 0:
+            return 0
+        first, last, head_mask, tail_mask = _range_edges(start, count)
+        if first == last:
+            return BIT_CNT[self.bitmap[first] & head_mask & tail_mask]
+        return (BIT_CNT[self.bitmap[first] & head_mask] + BIT_CNT[self.bitmap[last] & tail_mask]
+                + self._count_bytes(first + 1, last))
+
+    def _fill_range(self, start, count, value):
+        """
+        Set bits@[start, start + count) to value，中间的整字节通过切片赋值一次写入，只对首尾字节做位运算
+        """
+        if count <= 0:
+            return
+        first, last, head_mask, tail_mask = _range_edges(start, count)
+        if first == last:
+            head_mask &= tail_mask
+        if value:
+            self.bitmap[first] |= head_mask
         else:
-            for x in self.bitmap[:self.max_bytes_num]:
-                count += BIT_CNT[x]
-        return count
+            self.bitmap[first] &= ~head_mask & 0xFF
+        if first == last:
+            return
+        if value:
+            self.bitmap[last] |= tail_mask
+        else:
+            self.bitmap[last] &= ~tail_mask & 0xFF
+        if last - first > 1:
+            self.bitmap[first + 1:last] = (b'\xff' if value else b'\x00') * (last - first - 1)
 
     def size(self):
         """
@@ -75,75 +320,763 @@ class BitMap(object):
         """
         Test if any bit is set
         """
-        if self.bit_in_last_byte:
-            for x in self.bitmap[:self.max_bytes_num - 1]:
-                if x:
-                    return True
-            x = self.bitmap[self.max_bytes_num - 1]
-            for i in range(8):
-                if i < self.bit_in_last_byte:
-                    if (x & BITMASK[i]) != 0:
-                        return True
-        else:
-            for x in self.bitmap[:self.max_bytes_num]:
-                if x:
-                    return True
-        return False
+        return not self.none()
 
     def none(self):
         """
         Test if no bit is set
         """
-        if self.bit_in_last_byte:
-            for x in self.bitmap[:self.max_bytes_num - 1]:
-                if x:
-                    return False
-            x = self.bitmap[self.max_bytes_num - 1]
-            for i in range(8):
-                if i < self.bit_in_last_byte:
-                    if (x & BITMASK[i]) != 0:
-                        return False
-        else:
-            for x in self.bitmap[:self.max_bytes_num]:
-                if x:
-                    return False
-        return True
+        if not self._bytes_equal(0, self._full_bytes_num(), _ZERO_CHUNK):
+            return False
+        return self._last_byte_value() == 0
 
     def all(self):
         """
         Test if all bits are set
         """
-        if self.bit_in_last_byte:
-            for x in self.bitmap[:self.max_bytes_num - 1]:
-                if x != 0xFF:
-                    return False
-            x = self.bitmap[self.max_bytes_num - 1]
-            for i in range(8):
-                if i < self.bit_in_last_byte:
-                    if (x & BITMASK[i]) == 0:
-                        return False
+        if not self._bytes_equal(0, self._full_bytes_num(), _FULL_CHUNK):
+            return False
+        return self._last_byte_value() == self._last_byte_mask()
+
+    def enum_nonzero(self):
+        """
+        Get all non-zero bits
+        """
+        for bit_base, word in self._iter_nonzero_words(0, self.max_bytes_num):
+            while word:
+                low = word & -word
+                bit_offset = bit_base + low.bit_length() - 1
+                if bit_offset >= self.max_bit_num:
+                    return
+                yield bit_offset
+                word ^= low
+
+    def enum_runs(self, value=True):
+        """
+        Get all runs of bits equal to value as (start_bit, length)
+        """
+        return self.enum_runs_between(0, self.max_bit_num, value)
+
+    def enum_runs_between(self, lo, hi, value=True):
+        """
+        Get runs of bits equal to value inside [lo, hi) as (start_bit, length)
+
+        相邻的 run 总是被合并，因此可直接转换为连续的磁盘区间；
+        与 value 相反的整块/整字节被整体跳过，与 value 相同的整块被整体合并
+        """
+        lo = max(lo, 0)
+        hi = min(hi, self.max_bit_num)
+        if lo >= hi:
+            return
+
+        skip_chunk, fill_chunk = (_ZERO_CHUNK, _FULL_CHUNK) if value else (_FULL_CHUNK, _ZERO_CHUNK)
+        span_re = _NONZERO_BYTES_RE if value else _NOT_FULL_BYTES_RE
+        run_start = run_end = None
+
+        for offset, chunk in self._iter_chunks(lo // 8, (hi + 7) // 8):
+            if chunk == skip_chunk:
+                continue
+            if chunk == fill_chunk:
+                segments = ((max(offset * 8, lo), min((offset + CHUNK_BYTES) * 8, hi)),)
+            else:
+                segments = self._iter_word_segments(offset, chunk, span_re, value, lo, hi)
+
+            for seg_start, seg_end in segments:
+                if seg_start == run_end:
+                    run_end = seg_end
+                    continue
+                if run_start is not None:
+                    yield run_start, run_end - run_start
+                run_start, run_end = seg_start, seg_end
+
+        if run_start is not None:
+            yield run_start, run_end - run_start
+
+    @staticmethod
+    def _iter_word_segments(offset, chunk, span_re, value, lo, hi):
+        """
+        Yield [seg_start, seg_end) bit segments equal to value inside chunk, clipped to [lo, hi)
+
+        offset 为 chunk 首字节在位图中的字节偏移；span_re 定位不全为“相反值”的字节段，段外字节无需检查
+        """
+        for m in span_re.finditer(chunk):
+            span_begin, span_end = m.span()
+            for i in range(span_begin, span_end, WORD_BYTES):
+                word_bytes = chunk[i:min(i + WORD_BYTES, span_end)]
+                nbits = len(word_bytes) * 8
+                base = (offset + i) * 8
+                word = int.from_bytes(word_bytes, 'little')
+                if not value:
+                    word ^= (1 << nbits) - 1
+                if base < lo:
+                    word &= ~((1 << (lo - base)) - 1)
+                if base + nbits > hi:
+                    word &= (1 << max(hi - base, 0)) - 1
+                while word:
+                    start = (word & -word).bit_length() - 1
+                    ones = word >> start
+                    length = (ones ^ (ones + 1)).bit_length() - 1
+                    yield base + start, base + start + length
+                    word = (ones >> length) << (start + length)
+
+    def find_next_set(self, pos):
+        """
+        Return the first set bit at or after pos, -1 if none
+        """
+        return self._find_next(pos, self.max_bit_num, True)
+
+    def find_next_clear(self, pos):
+        """
+        Return the first clear bit at or after pos, -1 if none
+        """
+        return self._find_next(pos, self.max_bit_num, False)
+
+    def find_prev_set(self, pos):
+        """
+        Return the last set bit at or before pos, -1 if none
+        """
+        return self._find_prev_set(0, pos + 1)
+
+    def _find_next(self, lo, hi, value):
+        """
+        Return the first bit equal to value inside [lo, hi), -1 if none
+        """
+        for start, _ in self.enum_runs_between(lo, hi, value):
+            return start
+        return -1
+
+    def _find_prev_set(self, lo, hi):
+        """
+        Return the last set bit inside [lo, hi), -1 if none
+        """
+        lo = max(lo, 0)
+        hi = min(hi, self.max_bit_num)
+        if lo >= hi:
+            return -1
+        begin_byte = lo // 8
+        end_byte = (hi + 7) // 8
+        for chunk_end in range(end_byte, begin_byte, -CHUNK_BYTES):
+            chunk_begin = max(chunk_end - CHUNK_BYTES, begin_byte)
+            chunk = bytearray(self.bitmap[chunk_begin:chunk_end])
+            if chunk_end == end_byte and hi % 8:
+                chunk[-1] &= (1 << (hi % 8)) - 1
+            if chunk_begin == begin_byte:
+                chunk[0] &= (0xFF << (lo % 8)) & 0xFF
+            size = len(chunk.rstrip(b'\x00'))
+            if size:
+                return (chunk_begin + size - 1) * 8 + chunk[size - 1].bit_length() - 1
+        return -1
+
+    def __and__(self, other):
+        """
+        Return a new BitMap of bits set in both
+        """
+        return self._combine(other, operator.and_, max(self.max_bit_num, other.max_bit_num))
+
+    def __or__(self, other):
+        """
+        Return a new BitMap of bits set in either
+        """
+        return self._combine(other, operator.or_, max(self.max_bit_num, other.max_bit_num))
+
+    def __xor__(self, other):
+        """
+        Return a new BitMap of bits set in exactly one
+        """
+        return self._combine(other, operator.xor, max(self.max_bit_num, other.max_bit_num))
+
+    def difference(self, other):
+        """
+        Return a new BitMap of bits set in self but not in other
+        """
+        return self._combine(other, _and_not, self.max_bit_num)
+
+    def __iand__(self, other):
+        """
+        Keep only bits also set in other
+        """
+        self._combine_into(other, operator.and_)
+        return self
+
+    def __ior__(self, other):
+        """
+        Set bits set in other
+        """
+        self._combine_into(other, operator.or_)
+        return self
+
+    def __ixor__(self, other):
+        """
+        Flip bits set in other
+        """
+        self._combine_into(other, operator.xor)
+        return self
+
+    def difference_update(self, other):
+        """
+        Reset bits set in other
+        """
+        self._combine_into(other, _and_not)
+        return self
+
+    def _combine(self, other, op, max_bit_num):
+        """
+        Apply op chunk by chunk to both bitmaps and return the result as a new BitMap with max_bit_num bits
+
+        两者长度不同时，较短一方超出部分按 0 处理；末尾不完整字节中的无效位不参与计算
+        """
+        result = type(self)(bytearray((max_bit_num + 7) // 8), max_bit_num)
+        result._combine_into(other, op, self)
+        return result
+
+    def _combine_into(self, other, op, source=None):
+        """
+        self = op(source, other) chunk by chunk, source defaults to self; bits of other beyond self are ignored
+        """
+        source = self if source is None else source
+        for begin in range(0, self.max_bytes_num, CHUNK_BYTES):
+            end = min(begin + CHUNK_BYTES, self.max_bytes_num)
+            y = other._chunk_int(begin, end)
+            if not y and source is self and op is not operator.and_:
+                continue  # 与全零块做 or/xor/andnot 不改变结果
+            x = op(source._chunk_int(begin, end), y) & self._chunk_mask(begin, end)
+            self.bitmap[begin:end] = x.to_bytes(end - begin, 'little')
+
+    def _chunk_int(self, begin, end):
+        """
+        Meaningful bits of bytes [begin, end) as a little-endian int, bytes beyond the bitmap read as 0
+        """
+        if begin >= self.max_bytes_num:
+            return 0
+        x = int.from_bytes(self.bitmap[begin:min(end, self.max_bytes_num)], 'little')
+        if end * 8 > self.max_bit_num:
+            x &= self._chunk_mask(begin, end)
+        return x
+
+    def _chunk_mask(self, begin, end):
+        """
+        Mask of the meaningful bits in bytes [begin, end)
+        """
+        nbits = min(end * 8, self.max_bit_num) - begin * 8
+        return (1 << nbits) - 1 if nbits > 0 else 0
+
+    def _full_bytes_num(self):
+        """
+        Number of leading bytes whose 8 bits are all meaningful
+        """
+        return self.max_bytes_num - 1 if self.bit_in_last_byte else self.max_bytes_num
+
+    def _last_byte_mask(self):
+        """
+        Mask of the meaningful bits in the partial last byte, 0 if byte aligned
+        """
+        return (1 << self.bit_in_last_byte) - 1
+
+    def _last_byte_value(self):
+        """
+        Meaningful bits of the partial last byte, 0 if byte aligned
+        """
+        if not self.bit_in_last_byte:
+            return 0
+        return self.bitmap[self.max_bytes_num - 1] & self._last_byte_mask()
+
+    def _iter_chunks(self, begin, end):
+        """
+        Yield (byte_offset, chunk) covering bytes [begin, end) in CHUNK_BYTES pieces
+        """
+        for offset in range(begin, end, CHUNK_BYTES):
+            yield offset, self.bitmap[offset:min(offset + CHUNK_BYTES, end)]
+
+    def _bytes_equal(self, begin, end, pattern):
+        """
+        Test if every byte in [begin, end) equals the byte repeated in pattern
+        """
+        for _, chunk in self._iter_chunks(begin, end):
+            if chunk != (pattern if len(chunk) == CHUNK_BYTES else pattern[:len(chunk)]):
+                return False
+        return True
+
+    def _count_bytes(self, begin, end):
+        """
+        Count bits set in bytes [begin, end)
+        """
+        count = 0
+        for _, chunk in self._iter_chunks(begin, end):
+            if chunk != _ZERO_CHUNK:
+                count += _popcount(int.from_bytes(chunk, 'little'))
+        return count
+
+    def _iter_nonzero_words(self, begin, end):
+        """
+        Yield (bit_base, word) for non-zero words (at most 64 bits, little-endian) in bytes [begin, end)
+
+        全零的块整体跳过，块内用正则在 C 层面定位连续的非零字节段，bit_base + i 即为 word 中第 i 位对应的位偏移
+        """
+        for offset, chunk in self._iter_chunks(begin, end):
+            if chunk == _ZERO_CHUNK:
+                continue
+            for m in _NONZERO_BYTES_RE.finditer(chunk):
+                span_begin, span_end = m.span()
+                for i in range(span_begin, span_end, WORD_BYTES):
+                    yield (offset + i) * 8, int.from_bytes(chunk[i:min(i + WORD_BYTES, span_end)], 'little')
+
+    def __getitem__(self, item):
+        """
+        Return a bit when indexing like a array
+        """
+        return self.test(item)
+
+    def __setitem__(self, key, value):
+        """
+        Sets a bit when indexing like a array
+        """
+        if value is True:
+            self.set(key)
+        elif value is False:
+            self.reset(key)
         else:
-            for x in self.bitmap[:self.max_bytes_num]:
-                if x != 0xFF:
-                    return False
+            raise Exception("Use a boolean value to assign to a bitfield")
+
+
+class IndexedBitMap(BitMap):
+    """
+    BitMap with a per-block summary for fast skip scanning
+
+    每 SUMMARY_BLOCK_BYTES 字节为一块，记录块内置位数，并以字节标志记录“块非空”“块全满”，
+    find_next_set/find_next_clear/find_prev_set 先在标志上用 bytes.find 定位块，再仅扫描命中的块；
+    摘要由本对象的 set/reset/flip/区间操作/原地集合运算维护，其他对象（或其他进程经 mmap）的修改需调用 rebuild_summary
+    """
+
+    def __init__(self, bitmap, max_bit_num=None):
+        """
+        Create an IndexedBitMap
+        """
+        super(IndexedBitMap, self).__init__(bitmap, max_bit_num)
+        self._block_num = (self.max_bit_num + SUMMARY_BLOCK_BITS - 1) // SUMMARY_BLOCK_BITS
+        self._block_counts = array.array('L', bytes(self._block_num * array.array('L').itemsize))
+        self._nonzero_blocks = bytearray(self._block_num)
+        self._full_blocks = bytearray(self._block_num)
+        self.rebuild_summary()
+
+    def rebuild_summary(self):
+        """
+        Recount every block
+        """
+        self._refresh_blocks(0, self._block_num)
+
+    def set(self, pos):
+        """
+        Set the value of bit@pos to 1
+        """
+        if pos < self.max_bit_num and not self.test(pos):
+            super(IndexedBitMap, self).set(pos)
+            self._add_to_block(pos // SUMMARY_BLOCK_BITS, 1)
+
+    def reset(self, pos):
+        """
+        Reset the value of bit@pos to 0
+        """
+        if pos < self.max_bit_num and self.test(pos):
+            super(IndexedBitMap, self).reset(pos)
+            self._add_to_block(pos // SUMMARY_BLOCK_BITS, -1)
+
+    def flip(self, pos):
+        """
+        Flip the value of bit@pos
+        """
+        if pos < self.max_bit_num:
+            self._add_to_block(pos // SUMMARY_BLOCK_BITS, -1 if self.test(pos) else 1)
+        super(IndexedBitMap, self).flip(pos)
+
+    def count(self):
+        """
+        Count bits set
+        """
+        return sum(self._block_counts)
+
+    def any(self):
+        """
+        Test if any bit is set
+        """
+        return self._nonzero_blocks.find(1) >= 0
+
+    def none(self):
+        """
+        Test if no bit is set
+        """
+        return self._nonzero_blocks.find(1) < 0
+
+    def all(self):
+        """
+        Test if all bits are set
+        """
+        return self._full_blocks.find(0) < 0
+
+    def find_next_set(self, pos):
+        """
+        Return the first set bit at or after pos, -1 if none
+        """
+        return self._find_next_by_blocks(pos, True, self._nonzero_blocks, 1)
+
+    def find_next_clear(self, pos):
+        """
+        Return the first clear bit at or after pos, -1 if none
+        """
+        return self._find_next_by_blocks(pos, False, self._full_blocks, 0)
+
+    def find_prev_set(self, pos):
+        """
+        Return the last set bit at or before pos, -1 if none
+        """
+        pos = min(pos, self.max_bit_num - 1)
+        if pos < 0:
+            return -1
+        block = pos // SUMMARY_BLOCK_BITS
+        if self._nonzero_blocks[block]:
+            found = self._find_prev_set(block * SUMMARY_BLOCK_BITS, pos + 1)
+            if found >= 0:
+                return found
+        block = self._nonzero_blocks.rfind(1, 0, block)
+        if block < 0:
+            return -1
+        return self._find_prev_set(block * SUMMARY_BLOCK_BITS, (block + 1) * SUMMARY_BLOCK_BITS)
+
+    def _find_next_by_blocks(self, pos, value, flags, flag):
+        """
+        Find the first bit equal to value at or after pos, only scanning blocks whose flag equals flag
+        """
+        pos = max(pos, 0)
+        if pos >= self.max_bit_num:
+            return -1
+        block = pos // SUMMARY_BLOCK_BITS
+        if flags[block] == flag:
+            found = self._find_next(pos, (block + 1) * SUMMARY_BLOCK_BITS, value)
+            if found >= 0:
+                return found
+        block = flags.find(flag, block + 1)
+        if block < 0:
+            return -1
+        return self._find_next(block * SUMMARY_BLOCK_BITS, (block + 1) * SUMMARY_BLOCK_BITS, value)
+
+    def _fill_range(self, start, count, value):
+        super(IndexedBitMap, self)._fill_range(start, count, value)
+        if count > 0:
+            self._refresh_blocks(start // SUMMARY_BLOCK_BITS, (start + count - 1) // SUMMARY_BLOCK_BITS + 1)
+
+    def _combine_into(self, other, op, source=None):
+        super(IndexedBitMap, self)._combine_into(other, op, source)
+        self.rebuild_summary()
+
+    def _block_bits(self, block):
+        """
+        Number of meaningful bits in block
+        """
+        return min(SUMMARY_BLOCK_BITS, self.max_bit_num - block * SUMMARY_BLOCK_BITS)
+
+    def _refresh_blocks(self, begin, end):
+        """
+        Recount blocks [begin, end)
+        """
+        for block in range(begin, min(end, self._block_num)):
+            self._block_counts[block] = 0
+            self._add_to_block(block, self.count_range(block * SUMMARY_BLOCK_BITS, self._block_bits(block)))
+
+    def _add_to_block(self, block, delta):
+        count = self._block_counts[block] + delta
+        self._block_counts[block] = count
+        self._nonzero_blocks[block] = 1 if count else 0
+        self._full_blocks[block] = 1 if count == self._block_bits(block) else 0
+
+
+class _ArrayContainer(object):
+    """
+    Sparse container: sorted 16-bit offsets
+    """
+
+    def __init__(self, lows=()):
+        self.lows = array.array('H', lows)
+
+    def cardinality(self):
+        return len(self.lows)
+
+    def nbytes(self):
+        return len(self.lows) * self.lows.itemsize
+
+    def contains(self, low):
+        i = bisect.bisect_left(self.lows, low)
+        return i < len(self.lows) and self.lows[i] == low
+
+    def add(self, low):
+        i = bisect.bisect_left(self.lows, low)
+        if i < len(self.lows) and self.lows[i] == low:
+            return False
+        self.lows.insert(i, low)
+        return True
+
+    def discard(self, low):
+        i = bisect.bisect_left(self.lows, low)
+        if i < len(self.lows) and self.lows[i] == low:
+            del self.lows[i]
+            return True
+        return False
+
+    def iter_lows(self):
+        return iter(self.lows)
+
+    def iter_runs(self):
+        start = prev = None
+        for low in self.lows:
+            if low - 1 != prev:
+                if start is not None:
+                    yield start, prev - start + 1
+                start = low
+            prev = low
+        if start is not None:
+            yield start, prev - start + 1
+
+
+class _BitsetContainer(object):
+    """
+    Dense container: a flat 8 KiB BitMap
+    """
+
+    def __init__(self, runs=()):
+        self.bits = BitMap(bytearray(CONTAINER_BYTES))
+        self.card = 0
+        for start, length in runs:
+            self.bits.set_range(start, length)
+            self.card += length
+
+    def cardinality(self):
+        return self.card
+
+    def nbytes(self):
+        return CONTAINER_BYTES
+
+    def contains(self, low):
+        return self.bits.test(low)
+
+    def add(self, low):
+        if self.bits.test(low):
+            return False
+        self.bits.set(low)
+        self.card += 1
         return True
 
+    def discard(self, low):
+        if not self.bits.test(low):
+            return False
+        self.bits.reset(low)
+        self.card -= 1
+        return True
+
+    def iter_lows(self):
+        return self.bits.enum_nonzero()
+
+    def iter_runs(self):
+        return self.bits.enum_runs()
+
+
+class _RunContainer(object):
+    """
+    Run container: sorted (start, length - 1) pairs, read only
+    """
+
+    def __init__(self, runs=()):
+        self.starts = array.array('H')
+        self.lengths = array.array('H')  # 存储 length - 1，以便一个 run 覆盖整个容器
+        for start, length in runs:
+            self.starts.append(start)
+            self.lengths.append(length - 1)
+
+    def cardinality(self):
+        return sum(self.lengths) + len(self.lengths)
+
+    def nbytes(self):
+        return len(self.starts) * self.starts.itemsize * 2
+
+    def contains(self, low):
+        i = bisect.bisect_right(self.starts, low) - 1
+        return i >= 0 and low <= self.starts[i] + self.lengths[i]
+
+    def iter_lows(self):
+        for start, length in zip(self.starts, self.lengths):
+            yield from range(start, start + length + 1)
+
+    def iter_runs(self):
+        for start, length in zip(self.starts, self.lengths):
+            yield start, length + 1
+
+
+def _make_container(runs, card, allow_run=True):
+    """
+    Build the smallest container holding runs (list of (start, length)) with card bits set
+    """
+    run_bytes = len(runs) * 4 if allow_run else CONTAINER_BYTES + 1
+    if card <= ARRAY_MAX_SIZE and card * 2 <= run_bytes:
+        container = _ArrayContainer()
+        for start, length in runs:
+            container.lows.extend(range(start, start + length))
+        return container
+    if run_bytes < CONTAINER_BYTES:
+        return _RunContainer(runs)
+    return _BitsetContainer(runs)
+
+
+class RoaringBitMap(object):
+    """
+    Compressed BitMap
+
+    按 CONTAINER_BITS 位分块，每块按密度使用数组、位集或 run 容器，全零的块不占内存；
+    set/reset/test/count/enum_nonzero 与 BitMap 语义一致，开销与置位数（而非位图总长度）成正比
+    """
+
+    def __init__(self, max_bit_num):
+        """
+        Create an empty RoaringBitMap
+        """
+        self.max_bit_num = max_bit_num
+        self._containers = dict()
+
+    @classmethod
+    def from_bitmap(cls, bitmap):
+        """
+        Create a RoaringBitMap from a flat BitMap
+        """
+        result = cls(bitmap.max_bit_num)
+        runs, card, key = list(), 0, None
+        for start, length in bitmap.enum_runs():
+            while length:
+                high, low = divmod(start, CONTAINER_BITS)
+                piece = min(length, CONTAINER_BITS - low)
+                if high != key:
+                    if runs:
+                        result._containers[key] = _make_container(runs, card)
+                    runs, card, key = list(), 0, high
+                runs.append((low, piece))
+                card += piece
+                start += piece
+                length -= piece
+        if runs:
+            result._containers[key] = _make_container(runs, card)
+        return result
+
+    def to_bitmap(self):
+        """
+        Expand into a flat BitMap backed by a bytearray
+        """
+        result = BitMap(bytearray((self.max_bit_num + 7) // 8), self.max_bit_num)
+        for high, container in self._containers.items():
+            _fill_container(result, high, container)
+        return result
+
+    def set(self, pos):
+        """
+        Set the value of bit@pos to 1
+        """
+        high, low = divmod(pos, CONTAINER_BITS)
+        container = self._containers.get(high)
+        if container is None:
+            container = self._containers[high] = _ArrayContainer()
+        elif isinstance(container, _RunContainer):
+            container = self._containers[high] = self._thaw(container)
+        if container.add(low) and isinstance(container, _ArrayContainer) and len(container.lows) > ARRAY_MAX_SIZE:
+            self._containers[high] = _BitsetContainer(container.iter_runs())
+
+    def reset(self, pos):
+        """
+        Reset the value of bit@pos to 0
+        """
+        high, low = divmod(pos, CONTAINER_BITS)
+        container = self._containers.get(high)
+        if container is None:
+            return
+        if isinstance(container, _RunContainer):
+            container = self._containers[high] = self._thaw(container)
+        if not container.discard(low):
+            return
+        if not container.cardinality():
+            del self._containers[high]
+        elif isinstance(container, _BitsetContainer) and container.card <= ARRAY_MAX_SIZE:
+            self._containers[high] = _ArrayContainer(container.iter_lows())
+
+    def test(self, pos):
+        """
+        Return bit value
+        """
+        high, low = divmod(pos, CONTAINER_BITS)
+        container = self._containers.get(high)
+        return container is not None and container.contains(low)
+
+    def count(self):
+        """
+        Count bits set
+        """
+        return sum(container.cardinality() for container in self._containers.values())
+
+    def size(self):
+        """
+        Return size
+        """
+        return self.max_bit_num
+
+    def any(self):
+        """
+        Test if any bit is set
+        """
+        return bool(self._containers)
+
+    def none(self):
+        """
+        Test if no bit is set
+        """
+        return not self._containers
+
     def enum_nonzero(self):
         """
         Get all non-zero bits
         """
-        for byte_offset in range(self.max_bytes_num):
-            if not self.bitmap[byte_offset]:
-                continue
+        for high in sorted(self._containers):
+            base = high * CONTAINER_BITS
+            for low in self._containers[high].iter_lows():
+                yield base + low
+
+    def enum_runs(self):
+        """
+        Get all runs of set bits as (start_bit, length)
+        """
+        run_start = run_end = None
+        for high in sorted(self._containers):
+            base = high * CONTAINER_BITS
+            for start, length in self._containers[high].iter_runs():
+                if base + start == run_end:
+                    run_end += length
+                    continue
+                if run_start is not None:
+                    yield run_start, run_end - run_start
+                run_start, run_end = base + start, base + start + length
+        if run_start is not None:
+            yield run_start, run_end - run_start
+
+    def optimize(self):
+        """
+        Convert every container to its smallest representation, typically called after bulk set
+        """
+        for high, container in self._containers.items():
+            self._containers[high] = _make_container(list(container.iter_runs()), container.cardinality())
 
-            x = self.bitmap[byte_offset]
-            for i in range(8):
-                if (x & BITMASK[i]) != 0:
-                    bit_offset = byte_offset * 8 + i
-                    if bit_offset >= self.max_bit_num:
-                        break
-                    else:
-                        yield bit_offset
+    def nbytes(self):
+        """
+        Approximate payload size of all containers in bytes
+        """
+        return sum(container.nbytes() for container in self._containers.values())
+
+    @staticmethod
+    def _thaw(container):
+        """
+        Convert a read only run container to an array or bitset container
+        """
+        return _make_container(list(container.iter_runs()), container.cardinality(), allow_run=False)
 
     def __getitem__(self, item):
         """
@@ -161,3 +1094,322 @@ class BitMap(object):
             self.reset(key)
         else:
             raise Exception("Use a boolean value to assign to a bitfield")
+
+
+def _fill_container(flat, high, container):
+    """
+    Set the bits of a RoaringBitMap container into the flat BitMap
+    """
+    base = high * CONTAINER_BITS
+    if isinstance(container, _BitsetContainer):
+        begin = base // 8
+        size = len(flat.bitmap[begin:begin + CONTAINER_BYTES])
+        flat.bitmap[begin:begin + size] = container.bits.bitmap[:size]
+    else:
+        for start, length in container.iter_runs():
+            flat.set_range(base + start, length)
+
+
+class _FrameWriter(object):
+    """
+    Write length prefixed frames followed by an end mark and the crc32 of all frame data
+    """
+
+    def __init__(self, fp):
+        self.fp = fp
+        self.crc = 0
+
+    def write(self, data):
+        if not data:
+            return
+        self.fp.write(_FRAME_LENGTH.pack(len(data)))
+        self.fp.write(data)
+        self.crc = zlib.crc32(data, self.crc)
+
+    def close(self):
+        self.fp.write(_FRAME_LENGTH.pack(0))
+        self.fp.write(_FRAME_LENGTH.pack(self.crc & 0xFFFFFFFF))
+
+
+def _iter_frames(fp):
+    """
+    Yield frames written by _FrameWriter, verify the crc32 after the last one
+    """
+    crc = 0
+    while True:
+        length = _read_exactly(fp, _FRAME_LENGTH.size)
+        length, = _FRAME_LENGTH.unpack(length)
+        if not length:
+            break
+        frame = _read_exactly(fp, length)
+        crc = zlib.crc32(frame, crc)
+        yield frame
+    expected, = _FRAME_LENGTH.unpack(_read_exactly(fp, _FRAME_LENGTH.size))
+    if expected != crc & 0xFFFFFFFF:
+        raise ValueError('bitmap stream checksum mismatch')
+
+
+def _read_exactly(fp, size):
+    data = fp.read(size)
+    if len(data) != size:
+        raise ValueError('bitmap stream truncated')
+    return data
+
+
+def _write_varint(buf, value):
+    while value >= 0x80:
+        buf.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buf.append(value)
+
+
+def _write_rle_frames(writer, runs):
+    """
+    Encode runs as (gap from previous run end, length) varint pairs
+    """
+    buf = bytearray()
+    prev_end = 0
+    for start, length in runs:
+        _write_varint(buf, start - prev_end)
+        _write_varint(buf, length)
+        prev_end = start + length
+        if len(buf) >= CHUNK_BYTES:
+            writer.write(bytes(buf))
+            buf = bytearray()
+    writer.write(bytes(buf))
+
+
+def _iter_rle_runs(frames):
+    """
+    Decode frames written by _write_rle_frames into (start, length), varints may span frames
+    """
+    values = list()
+    value = shift = 0
+    prev_end = 0
+    for frame in frames:
+        for byte in frame:
+            value |= (byte & 0x7F) << shift
+            if byte & 0x80:
+                shift += 7
+                continue
+            values.append(value)
+            value = shift = 0
+            if len(values) == 2:
+                start = prev_end + values[0]
+                prev_end = start + values[1]
+                yield start, values[1]
+                values = list()
+    if values or shift:
+        raise ValueError('bitmap stream rle data truncated')
+
+
+def _le_array_bytes(arr):
+    """
+    Bytes of an array in little-endian order
+    """
+    if sys.byteorder == 'big':
+        arr = array.array(arr.typecode, arr)
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def _le_array(typecode, data):
+    arr = array.array(typecode)
+    arr.frombytes(data)
+    if sys.byteorder == 'big':
+        arr.byteswap()
+    return arr
+
+
+def _write_roaring_frames(writer, roaring):
+    """
+    Write one frame per container: (high, kind, n) followed by the container payload
+    """
+    for high in sorted(roaring._containers):
+        container = roaring._containers[high]
+        if isinstance(container, _ArrayContainer):
+            payload = (0, len(container.lows), _le_array_bytes(container.lows))
+        elif isinstance(container, _BitsetContainer):
+            payload = (1, container.card, bytes(container.bits.bitmap))
+        else:
+            payload = (2, len(container.starts), _le_array_bytes(container.starts) + _le_array_bytes(container.lengths))
+        writer.write(_ROARING_CONTAINER_HEADER.pack(high, payload[0], payload[1]) + payload[2])
+
+
+def _iter_roaring_containers(frames):
+    """
+    Decode frames written by _write_roaring_frames into (high, container)
+    """
+    for frame in frames:
+        high, kind, n = _ROARING_CONTAINER_HEADER.unpack_from(frame)
+        data = frame[_ROARING_CONTAINER_HEADER.size:]
+        if kind == 0:
+            container = _ArrayContainer(_le_array('H', data))
+        elif kind == 1:
+            container = _BitsetContainer()
+            container.bits.bitmap[:] = data
+            container.card = n
+        elif kind == 2:
+            container = _RunContainer()
+            container.starts = _le_array('H', data[:n * 2])
+            container.lengths = _le_array('H', data[n * 2:])
+        else:
+            raise ValueError('unknown roaring container kind {}'.format(kind))
+        yield high, container
+
+
+_SHARED_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else None  # 并行计算时位图的共享文件所在目录（tmpfs）
+
+
+def _parallel_context():
+    """
+    multiprocessing context of the worker processes, None if the platform does not support forkserver
+
+    不使用 fork：调用者（如 tmpfile/RPC 服务）通常有多个线程，fork 出的子进程可能继承其它线程持有的锁（如 logging）而死锁；
+    forkserver 的子进程由单线程的服务进程 fork 而来
+    """
+    if 'forkserver' not in multiprocessing.get_all_start_methods():
+        return None
+    return multiprocessing.get_context('forkserver')
+
+
+def _split_bytes(byte_num, workers):
+    """
+    Split [0, byte_num) into CHUNK_BYTES aligned slices, several per worker for load balancing
+    """
+    step = max(CHUNK_BYTES, (byte_num // (workers * 4) + CHUNK_BYTES - 1) // CHUNK_BYTES * CHUNK_BYTES)
+    return [(begin, min(begin + step, byte_num)) for begin in range(0, byte_num, step)]
+
+
+def _create_shared(max_bit_num, source=None):
+    """
+    Create a file in _SHARED_DIR holding the bytes of source (zeros if None), return its path
+    """
+    max_bytes_num = (max_bit_num + 7) // 8
+    with tempfile.NamedTemporaryFile(prefix='bitmap_', dir=_SHARED_DIR, delete=False) as f:
+        if source is None:
+            f.truncate(max_bytes_num)
+        else:
+            for offset, chunk in source._iter_chunks(0, max_bytes_num):
+                f.write(chunk)
+        return f.name
+
+
+def _open_shared(shared, writable=False):
+    path, max_bit_num = shared
+    return BitMap.open_mmap(path, max_bit_num, writable)
+
+
+def _remove_shared(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _count_slice(bitmap, begin, end):
+    return bitmap._count_bytes(begin, end)
+
+
+def _reduce_slice(bitmaps, op, result, begin, end):
+    x = bitmaps[0]._chunk_int(begin, end)
+    if op is None:
+        for bitmap in bitmaps[1:]:
+            x &= ~bitmap._chunk_int(begin, end)
+    else:
+        for bitmap in bitmaps[1:]:
+            x = op(x, bitmap._chunk_int(begin, end))
+    result.bitmap[begin:end] = (x & result._chunk_mask(begin, end)).to_bytes(end - begin, 'little')
+
+
+def _count_job(args):
+    """
+    Worker process: count bits set in a byte range of a shared bitmap file
+    """
+    shared, begin, end = args
+    bitmap = _open_shared(shared)
+    try:
+        return _count_slice(bitmap, begin, end)
+    finally:
+        bitmap.bitmap.close()
+
+
+def _reduce_job(args):
+    """
+    Worker process: reduce a byte range of shared bitmap files into the shared result file
+    """
+    shared_list, op, shared_result, begin, end = args
+    bitmaps = [_open_shared(shared) for shared in shared_list]
+    result = _open_shared(shared_result, True)
+    try:
+        _reduce_slice(bitmaps, PARALLEL_OPS[op], result, begin, end)
+    finally:
+        for bitmap in bitmaps + [result]:
+            bitmap.bitmap.close()
+
+
+def _pool_map(ctx, fn, jobs, workers):
+    with ctx.Pool(min(workers, len(jobs))) as pool:
+        return pool.map(fn, jobs)
+
+
+def parallel_count(bitmap, workers=None):
+    """
+    Count bits set using a process pool
+
+    :param workers: 进程数，默认为 CPU 核数
+    :remark:
+        位图先复制到 tmpfs 上的临时文件，子进程以只读 mmap 映射同一份物理内存；
+        不支持 forkserver 的平台或位图较小时退化为 bitmap.count()
+    """
+    workers = workers or multiprocessing.cpu_count()
+    full_bytes_num = bitmap._full_bytes_num()
+    ctx = _parallel_context()
+    slices = _split_bytes(full_bytes_num, workers)
+    if full_bytes_num < PARALLEL_MIN_BYTES or workers <= 1 or ctx is None or len(slices) <= 1:
+        return bitmap.count()
+
+    shared = (_create_shared(bitmap.max_bit_num, bitmap), bitmap.max_bit_num)
+    try:
+        counts = _pool_map(ctx, _count_job, [(shared, begin, end) for begin, end in slices], workers)
+    finally:
+        _remove_shared([shared[0]])
+    return sum(counts) + BIT_CNT[bitmap._last_byte_value()]
+
+
+def parallel_reduce(bitmaps, op, workers=None):
+    """
+    Reduce bitmaps with op using a process pool, return the merged BitMap
+
+    :param op: PARALLEL_OPS 中的 'and'/'or'/'xor'/'andnot'（第一个位图减去其余位图）
+    :param workers: 进程数，默认为 CPU 核数
+    :return: 结果位图的长度为各位图中最长者（andnot 时与第一个位图相同），
+        并行时底层为 tmpfs 上已删除的临时文件的 mmap，子进程直接写入各自的字节区间，无需回传数据
+    """
+    if op not in PARALLEL_OPS:
+        raise ValueError('unknown parallel op {}'.format(op))
+    bitmaps = list(bitmaps)
+    workers = workers or multiprocessing.cpu_count()
+    max_bit_num = bitmaps[0].max_bit_num if op == 'andnot' else max(b.max_bit_num for b in bitmaps)
+    max_bytes_num = (max_bit_num + 7) // 8
+    ctx = _parallel_context()
+    slices = _split_bytes(max_bytes_num, workers)
+    if max_bytes_num < PARALLEL_MIN_BYTES or workers <= 1 or ctx is None or len(slices) <= 1:
+        result = BitMap(bytearray(max_bytes_num), max_bit_num)
+        for begin, end in slices:
+            _reduce_slice(bitmaps, PARALLEL_OPS[op], result, begin, end)
+        return result
+
+    paths = list()
+    try:
+        shared_list = list()
+        for b in bitmaps:
+            paths.append(_create_shared(b.max_bit_num, b))
+            shared_list.append((paths[-1], b.max_bit_num))
+        paths.append(_create_shared(max_bit_num))
+        shared_result = (paths[-1], max_bit_num)
+        _pool_map(ctx, _reduce_job, [(shared_list, op, shared_result, begin, end) for begin, end in slices], workers)
+        return _open_shared(shared_result, True)
+    finally:
+        _remove_shared(paths)
@@ -5,6 +5,8 @@ import time
 import threading
 import sys
 
+from cpkt.core import rwlock
+
 
 '''不再使用。
 # 这个类不是线程安全的，不能多线程使用同一个类。
@@ -112,47 +114,209 @@ class file_ex_lock(object):
 '''
 
 
+def _flock_nb(fd, operation):
+    try:
+        fcntl.flock(fd, operation | fcntl.LOCK_NB)
+        return True
+    except BlockingIOError:
+        return False
+
+
+def flock_wait(fd, operation, timeout=None):
+    """阻塞获取 flock，内核在锁释放时立即唤醒，没有轮询延迟
+
+    阻塞的 flock 无法取消，因此只有一直等待时才阻塞；限时等待在同一 fd 上以短间隔退避轮询，超时返回时不残留线程和 fd
+
+    :param timeout: None 表示一直等待
+    :return: True 表示获得锁；False 表示超时，此时 fd 已被关闭，调用者不能再使用（抛出异常时同样已关闭）
+    """
+    if timeout is not None:
+        return flock_backoff(fd, operation, timeout, max_secs=0.05)
+    try:
+        fcntl.flock(fd, operation)
+        return True
+    except OSError:
+        os.close(fd)
+        raise
+
+
+def flock_backoff(fd, operation, timeout=None, min_secs=0.001, max_secs=1.0):
+    """以指数退避的非阻塞尝试获取 flock，用于 NFS 等阻塞等待唤醒很慢的文件系统
+
+    :return: True 表示获得锁；False 表示超时，此时 fd 已被关闭，调用者不能再使用
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    interval = min_secs
+    while True:
+        try:
+            if _flock_nb(fd, operation):
+                return True
+        except OSError:
+            os.close(fd)
+            raise
+        if deadline is None:
+            time.sleep(interval)
+        else:
+            remain = deadline - time.monotonic()
+            if remain <= 0:
+                os.close(fd)
+                return False
+            time.sleep(min(interval, remain))
+        interval = min(interval * 2, max_secs)
+
+
+class _InodeLock(object):
+    """同一进程内对同一文件（dev, inode）的所有 FileExLockV2 共享一个 _InodeLock
+
+    进程内先通过可重入读写锁排队，只有第一个持有者对内核加 flock，其余持有者只增加计数；最后一个持有者释放 flock
+    """
+
+    def __init__(self):
+        self.refs = 0  # 引用本对象的 FileExLockV2 获取操作数，由 _inodes_locker 保护
+        self.rw_lock = rwlock.RWLockReentrant()
+        self.locker = threading.Lock()  # 保护以下字段，并串行化进程内对内核的加锁
+        self.fd = 0
+        self.count = 0
+
+
+_inodes = dict()  # (dev, inode) -> _InodeLock
+_inodes_locker = threading.Lock()
+_inodes_pid = os.getpid()
+
+
+def _ref_inode(key):
+    global _inodes, _inodes_pid
+    with _inodes_locker:
+        if _inodes_pid != os.getpid():  # fork 后子进程不继承父进程持有的锁
+            _inodes, _inodes_pid = dict(), os.getpid()
+        inode_lock = _inodes.get(key)
+        if inode_lock is None:
+            inode_lock = _inodes[key] = _InodeLock()
+        inode_lock.refs += 1
+        return inode_lock
+
+
+def _unref_inode(key, inode_lock):
+    with _inodes_locker:
+        inode_lock.refs -= 1
+        if 0 == inode_lock.refs and _inodes.get(key) is inode_lock:
+            del _inodes[key]
+
+
 class FileExLockV2(object):
-    def __init__(self, filename):
+    """基于 flock 的文件锁
+
+    - exclusive=False 时为共享锁（LOCK_SH），读者之间不互斥
+    - 同一进程内按 (dev, inode) 识别同一文件：同一线程可重入（持有排它锁时可再取共享锁，反之会抛出 RuntimeError）；
+      其它线程在进程内排队，不会各自访问内核
+    - 可用 acquire(timeout) 限时等待
+    """
+
+    WAIT_POLL = 'poll'  # 在同一 fd 上每隔 1 秒尝试加锁
+    WAIT_BLOCK = 'block'  # 一直等待时在同一 fd 上阻塞，锁释放后立即获得；限时等待时以短间隔退避轮询；适用于本地文件系统
+    WAIT_BACKOFF = 'backoff'  # 在同一 fd 上以指数退避轮询；适用于 NFS
+    WAIT_MODES = (WAIT_POLL, WAIT_BLOCK, WAIT_BACKOFF)
+
+    def __init__(self, filename, wait_mode=WAIT_POLL, exclusive=True):
+        if wait_mode not in self.WAIT_MODES:
+            raise ValueError('wait_mode must be one of {}, got {!r}'.format(self.WAIT_MODES, wait_mode))
         self.__filename = copy.copy(filename)
-        self.__fd = 0
+        self.__wait_mode = wait_mode
+        self.__exclusive = exclusive
+        self.__held = list()  # [(key, _InodeLock, 进程内读写锁对象), ...]，支持同一对象嵌套获取
 
     def __enter__(self):
-        count = 0
-        while True:
-            count += 1
-            if self.try_lock():
-                break
-            if count == 10:
-                # _logger.warning('{} get lock failed, will retry'.format(self))
-                count = 0
-            time.sleep(1)
-        # _logger.debug('{} get lock successful'.format(self))
+        self.acquire()
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.release()
 
-    def try_lock(self):
-        mode = os.O_RDWR | os.O_CREAT
-        self.__fd = os.open(self.__filename, mode, 0o666)
-        if self.__fd <= 0:
-            return False
+    def acquire(self, timeout=None):
+        """获取锁
+
+        :param timeout: 秒，None 表示一直等待
+        :return: 是否获得锁
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        # 共享锁只需读权限，flock 不区分 fd 的读写模式
+        fd = os.open(self.__filename, (os.O_RDWR if self.__exclusive else os.O_RDONLY) | os.O_CREAT, 0o666)
         try:
-            fcntl.flock(self.__fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
-            return True
-        except:
-            pass
-        os.close(self.__fd)
-        self.__fd = 0
-        return False
+            st = os.fstat(fd)
+        except OSError:
+            os.close(fd)
+            raise
+        key = (st.st_dev, st.st_ino)
+        inode_lock = _ref_inode(key)
+        local_lock = None
+        locked = False
+        try:
+            local_lock = inode_lock.rw_lock.gen_wlock() if self.__exclusive else inode_lock.rw_lock.gen_rlock()
+            if local_lock.acquire(timeout=_remain(deadline)):
+                owned_fd, fd = fd, 0  # 出现异常时 fd 已由 _lock_kernel 关闭
+                fd, locked = self._lock_kernel(inode_lock, owned_fd, deadline)
+        finally:
+            if fd:
+                os.close(fd)
+            if not locked:
+                if local_lock is not None and local_lock.locked():
+                    local_lock.release()
+                _unref_inode(key, inode_lock)
+        if locked:
+            self.__held.append((key, inode_lock, local_lock))
+        return locked
+
+    def _lock_kernel(self, inode_lock, fd, deadline):
+        """已在进程内获得锁，若进程尚未持有 flock 则加锁
+
+        :return: (仍归调用者关闭的 fd 或 0, 是否获得锁)
+        """
+        if not inode_lock.locker.acquire(timeout=_remain(deadline)):
+            return fd, False
+        try:
+            if inode_lock.count:
+                os.close(fd)
+                inode_lock.count += 1
+                return 0, True
+            operation = fcntl.LOCK_EX if self.__exclusive else fcntl.LOCK_SH
+            timeout = None if deadline is None else max(0, deadline - time.monotonic())
+            if self.__wait_mode == self.WAIT_BLOCK:
+                locked = flock_wait(fd, operation, timeout)
+            elif self.__wait_mode == self.WAIT_BACKOFF:
+                locked = flock_backoff(fd, operation, timeout)
+            else:
+                locked = flock_backoff(fd, operation, timeout, min_secs=1, max_secs=1)
+            if locked:  # 否则 fd 已被关闭
+                inode_lock.fd = fd
+                inode_lock.count = 1
+            return 0, locked
+        finally:
+            inode_lock.locker.release()
+
+    def try_lock(self):
+        return self.acquire(timeout=0)
 
     def release(self):
-        if self.__fd > 0:
-            os.close(self.__fd)
-            self.__fd = 0
+        if not self.__held:
+            return
+        key, inode_lock, local_lock = self.__held.pop()
+        with inode_lock.locker:
+            inode_lock.count -= 1
+            if 0 == inode_lock.count:
+                os.close(inode_lock.fd)
+                inode_lock.fd = 0
+        local_lock.release()
+        _unref_inode(key, inode_lock)
+
+    def locked(self):
+        return bool(self.__held)
 
     def __str__(self):
-        return '<FileExLockV2 {} {}>'.format(self.__filename, self.__fd)
+        return '<FileExLockV2 {} {}>'.format(self.__filename, self.__held[-1][1].fd if self.__held else 0)
+
+
+def _remain(deadline):
+    """换算为 threading 风格的 timeout 参数，-1 表示一直等待"""
+    return -1 if deadline is None else max(0, deadline - time.monotonic())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,146 @@
+"""按 key 加锁
+
+不相关的操作（如不同磁盘、不同快照）不再共用一把全局锁，可以并行执行；相同 key 的操作仍然互斥
+
+用法：
+    disk_locks = KeyedLocks(64)
+    with disk_locks.lock_for(disk_id):
+        ...
+
+    @disk_locks.keyed_lock(lambda disk_id, *args, **kv: disk_id)
+    def resize(disk_id, size): ...
+
+    snapshot_locks = KeyedLocks(kind='rw', exact=True)
+    with snapshot_locks.lock_for(snapshot_id).gen_rlock():
+        ...
+
+两种模式：
+    条带模式（默认）：key 按 hash 映射到固定数量的锁上，没有额外开销；不同 key 可能落在同一条带上而互相等待
+    精确模式（exact=True）：每个 key 一把锁，按引用计数在空闲时释放
+同一线程同时持有多个 key 的锁时，需按固定顺序获取以免死锁；条带模式下两个 key 可能映射到同一把锁，此时应使用 RLock
+"""
+import functools
+import threading
+
+from cpkt.core import rwlock
+
+KINDS = ('mutex', 'rw')
+
+
+class _ExactLock(object):
+    """精确模式下的锁对象：获取前登记引用，释放后撤销引用，引用归零时删除该 key 的锁"""
+
+    def __init__(self, keyed_locks, key, gen_lock):
+        self._keyed_locks = keyed_locks
+        self._key = key
+        self._gen_lock = gen_lock  # 由 key 的底层锁生成本次要获取的锁对象
+        self._lock = None
+
+    def acquire(self, blocking=True, timeout=-1):
+        lock = self._gen_lock(self._keyed_locks._ref(self._key))
+        if not lock.acquire(blocking, timeout):
+            self._keyed_locks._unref(self._key)
+            return False
+        self._lock = lock
+        return True
+
+    def release(self):
+        if self._lock is None: raise RuntimeError("cannot release un-acquired lock")
+        lock, self._lock = self._lock, None
+        lock.release()
+        self._keyed_locks._unref(self._key)
+
+    def locked(self):
+        return self._lock is not None
+
+    def __enter__(self):
+        self.acquire()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+        return False
+
+
+class _ExactRWLock(object):
+    def __init__(self, keyed_locks, key):
+        self._keyed_locks = keyed_locks
+        self._key = key
+
+    def gen_rlock(self):
+        return _ExactLock(self._keyed_locks, self._key, lambda lock: lock.gen_rlock())
+
+    def gen_wlock(self):
+        return _ExactLock(self._keyed_locks, self._key, lambda lock: lock.gen_wlock())
+
+
+class KeyedLocks(object):
+    def __init__(self, n_stripes=64, kind='mutex', exact=False,
+                 lock_factory=threading.Lock, rw_lock_class=rwlock.RWLockWriteC):
+        """
+        :param n_stripes: 条带模式下锁的数量
+        :param kind: 'mutex' 时 lock_for 返回互斥锁；'rw' 时返回读写锁，通过 gen_rlock/gen_wlock 使用
+        :param exact: True 时每个 key 一把锁，空闲时释放
+        :param lock_factory: 互斥锁的构造函数
+        :param rw_lock_class: 读写锁的类型，见 cpkt.core.rwlock
+        """
+        if kind not in KINDS:
+            raise ValueError('kind must be one of {}, got {!r}'.format(KINDS, kind))
+        if n_stripes < 1:
+            raise ValueError('n_stripes must be positive, got {}'.format(n_stripes))
+
+        self.kind = kind
+        self.exact = exact
+        self._new_lock = lock_factory if kind == 'mutex' else rw_lock_class
+        self._stripes = None if exact else [self._new_lock() for _ in range(n_stripes)]
+        self._locker = threading.Lock()
+        self._entries = dict()  # 精确模式：key -> [锁, 引用数]
+
+    def lock_for(self, key):
+        """返回 key 对应的锁
+
+        条带模式下返回的是共享的底层锁；精确模式下每次返回新的锁对象，需成对 acquire/release
+        """
+        if not self.exact:
+            return self._stripes[hash(key) % len(self._stripes)]
+        if self.kind == 'mutex':
+            return _ExactLock(self, key, lambda lock: lock)
+        return _ExactRWLock(self, key)
+
+    def keyed_lock(self, key_fn, write=True):
+        """装饰器，与 rt.LockDecorator 类似，按 key_fn(*args, **kv) 计算出的 key 加锁
+
+        :param write: kind 为 'rw' 时，True 加写锁，False 加读锁
+        """
+
+        def _real_decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kv):
+                lock = self.lock_for(key_fn(*args, **kv))
+                if self.kind == 'rw':
+                    lock = lock.gen_wlock() if write else lock.gen_rlock()
+                with lock:
+                    return fn(*args, **kv)
+
+            return wrapper
+
+        return _real_decorator
+
+    def active_keys(self):
+        """精确模式下当前持有或等待锁的 key"""
+        with self._locker:
+            return list(self._entries)
+
+    def _ref(self, key):
+        with self._locker:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = [self._new_lock(), 0]
+            entry[1] += 1
+            return entry[0]
+
+    def _unref(self, key):
+        with self._locker:
+            entry = self._entries[key]
+            entry[1] -= 1
+            if 0 == entry[1]:
+                del self._entries[key]
@@ -0,0 +1,167 @@
+"""基于租约的集群锁
+
+NFS 等共享存储上的 flock 在持有者节点宕机后依赖锁恢复，释放通知也很慢；租约锁不依赖这些：
+    持有者在共享存储上写入租约记录（节点、进程、进程创建时间、到期时间），并由后台线程定期续约
+    其它节点发现租约到期（或同一节点上的持有进程已不存在）后即可抢占，抢占延迟不超过租约时长 ttl
+    读写租约记录时短暂持有 FileExLockV2，保证检查与写入原子完成
+
+用法：
+    lease = LeaseLock('/home/mnt/nodes/xxx/task.lease', ttl=30)
+    with lease:
+        while lease.is_held():
+            ...
+
+注意：到期时间使用各节点的系统时间，要求集群内时钟同步（误差应远小于 ttl）
+"""
+import contextlib
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+
+from cpkt.core import filelockv2
+from cpkt.core import rt
+from cpkt.core import xlogging as lg
+
+_logger = lg.get_logger(__name__)
+
+GUARD_TIMEOUT_SECS = 10  # 等待记录文件锁的最长时间
+
+
+class LeaseLock(object):
+    def __init__(self, path, ttl=30, node_id=None, renew_interval=None):
+        """
+        :param path: 租约记录文件的路径，记录文件锁为 path + '.lock'
+        :param ttl: 租约时长（秒），未续约的租约在到期后可被抢占
+        :param node_id: 节点标识，默认为主机名
+        :param renew_interval: 续约间隔（秒），默认为 ttl 的三分之一
+        """
+        self.path = path
+        self.ttl = ttl
+        self.node_id = node_id if node_id is not None else socket.gethostname()
+        self.renew_interval = renew_interval if renew_interval is not None else ttl / 3
+        self._token = None
+        self._expire = 0
+        self._stop = threading.Event()
+        self._renew_thread = None
+
+    def __enter__(self):
+        self.acquire()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+    def acquire(self, timeout=None):
+        """获取租约
+
+        :param timeout: 秒，None 表示一直等待
+        :return: 是否获得租约
+        """
+        if self._token is not None:
+            raise RuntimeError('{} already acquired'.format(self))
+        deadline = None if timeout is None else time.monotonic() + timeout
+        token = uuid.uuid4().hex
+        while True:
+            if self._try_take(token):
+                break
+            remain = None if deadline is None else deadline - time.monotonic()
+            if remain is not None and remain <= 0:
+                return False
+            wait = min(self.renew_interval, 1)
+            time.sleep(wait if remain is None else min(wait, remain))
+
+        self._token = token
+        self._stop.clear()
+        self._renew_thread = threading.Thread(
+            target=self._renew_loop, args=(token,), name='lease_renew', daemon=True)
+        self._renew_thread.start()
+        return True
+
+    def release(self):
+        """停止续约并删除自己的租约记录"""
+        token, self._token = self._token, None
+        if token is None:
+            return
+        self._stop.set()
+        self._renew_thread.join()
+        self._renew_thread = None
+        with self._guarded():
+            record = self._read()
+            if record is not None and record.get('token') == token:
+                os.remove(self.path)
+
+    def is_held(self):
+        """是否仍持有租约；续约失败且租约已到期、或租约被抢占后返回 False"""
+        return self._token is not None and time.time() < self._expire
+
+    def holder(self):
+        """返回当前的租约记录，无人持有时返回 None"""
+        with self._guarded():
+            return self._read()
+
+    def _try_take(self, token):
+        with self._guarded():
+            record = self._read()
+            if record is not None and not self._is_stale(record):
+                return False
+            self._write(token)
+            return True
+
+    def _is_stale(self, record):
+        if record.get('expire', 0) < time.time():
+            return True
+        if record.get('node') == self.node_id:  # 同一节点上持有进程已退出时无需等待到期
+            return not rt.PidReplier.is_pid_exists(record.get('pid', 0), record.get('pid_ts', 0))
+        return False
+
+    def _renew_loop(self, token):
+        while not self._stop.wait(self.renew_interval):
+            try:
+                with self._guarded():
+                    record = self._read()
+                    if record is None or record.get('token') != token:
+                        _logger.warning('{} lost, now held by {}'.format(self, record))
+                        self._expire = 0
+                        return
+                    self._write(token)
+            except Exception as e:
+                # 暂时无法访问共享存储：继续重试，租约到期后 is_held 返回 False
+                _logger.warning('{} renew failed : {}'.format(self, e))
+
+    @contextlib.contextmanager
+    def _guarded(self):
+        guard = filelockv2.FileExLockV2(self.path + '.lock', filelockv2.FileExLockV2.WAIT_BACKOFF)
+        if not guard.acquire(timeout=GUARD_TIMEOUT_SECS):
+            raise TimeoutError('lock {}.lock timeout'.format(self.path))
+        try:
+            yield
+        finally:
+            guard.release()
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except ValueError as e:
+            _logger.warning('{} invalid record : {}'.format(self, e))  # 写入中途失败，视为无人持有
+            return None
+
+    def _write(self, token):
+        pid, pid_ts = rt.PidReplier.get_current_pid_and_create_timestamp()
+        expire = time.time() + self.ttl
+        record = {'node': self.node_id, 'pid': pid, 'pid_ts': pid_ts, 'expire': expire, 'token': token}
+        tmp_path = '{}.{}.{}.tmp'.format(self.path, self.node_id, pid)
+        with open(tmp_path, 'w') as f:
+            json.dump(record, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._expire = expire
+
+    def __str__(self):
+        return '<LeaseLock {} {}>'.format(self.path, self.node_id)
+
@@ -0,0 +1,246 @@
+"""锁竞争统计
+
+按需开启，记录每把锁的等待时间直方图、持有时间直方图、获取次数、超时次数以及当前持有者线程名
+
+用法：
+    rw = rwlock.RWLockWrite()
+    lockstat.instrument(rw, 'cfg_rw')      # 此后 gen_rlock/gen_wlock 生成的锁均被统计
+
+    locker = lockstat.InstrumentedLock(threading.Lock(), 'proxy_locker')
+    @rt.LockDecorator(locker)
+    def fn(): ...
+
+    lockstat.dump(sys.stdout)              # 或由 XDebugHelper 通过 dump_lock_stat 标记文件触发
+
+未开启时，rwlock 仅多一次属性判断
+"""
+import threading
+import time
+
+HIST_BUCKETS = 32  # 第 i 个桶统计 [2^(i-1), 2^i) 微秒，末桶包含更大值
+
+_registry = dict()  # name -> LockStat
+_registry_locker = threading.Lock()
+
+
+def _bucket(secs):
+    return min(int(secs * 1000000).bit_length(), HIST_BUCKETS - 1)
+
+
+def _format_hist(hist):
+    return ' '.join('<{}us:{}'.format(1 << i, n) for i, n in enumerate(hist) if n)
+
+
+class _ModeStat(object):
+    def __init__(self):
+        self.acquires = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.hold_total = 0.0
+        self.wait_hist = [0] * HIST_BUCKETS
+        self.hold_hist = [0] * HIST_BUCKETS
+
+
+class LockStat(object):
+    """一把锁的统计数据，mode 区分读锁/写锁等不同的获取方式"""
+
+    def __init__(self, name):
+        self.name = name
+        self._locker = threading.Lock()
+        self._modes = dict()  # mode -> _ModeStat
+        self._holders = dict()  # id(锁对象) -> (mode, 线程名, 获得时间)
+
+    def _mode(self, mode):
+        stat = self._modes.get(mode)
+        if stat is None:
+            stat = self._modes[mode] = _ModeStat()
+        return stat
+
+    def on_acquire(self, key, mode, wait_secs, ok):
+        with self._locker:
+            stat = self._mode(mode)
+            stat.wait_total += wait_secs
+            stat.wait_hist[_bucket(wait_secs)] += 1
+            if ok:
+                stat.acquires += 1
+                self._holders[key] = (mode, threading.current_thread().name, time.monotonic())
+            else:
+                stat.timeouts += 1
+
+    def on_release(self, key):
+        with self._locker:
+            mode, _, since = self._holders.pop(key)
+            hold_secs = time.monotonic() - since
+            stat = self._mode(mode)
+            stat.hold_total += hold_secs
+            stat.hold_hist[_bucket(hold_secs)] += 1
+
+    def snapshot(self):
+        """返回统计数据的副本
+
+        :return: {'name': 名称, 'modes': {mode: {acquires, timeouts, wait_total, hold_total, wait_hist, hold_hist}},
+                  'holders': [(mode, 线程名, 已持有秒数), ...]}
+        """
+        now = time.monotonic()
+        with self._locker:
+            modes = dict((mode, {'acquires': s.acquires, 'timeouts': s.timeouts,
+                                 'wait_total': s.wait_total, 'hold_total': s.hold_total,
+                                 'wait_hist': list(s.wait_hist), 'hold_hist': list(s.hold_hist)})
+                         for mode, s in self._modes.items())
+            holders = [(mode, name, now - since) for mode, name, since in self._holders.values()]
+        return {'name': self.name, 'modes': modes, 'holders': holders}
+
+    def reset(self):
+        with self._locker:
+            self._modes = dict()
+
+    def format(self):
+        snapshot = self.snapshot()
+        lines = ['lock {}'.format(self.name)]
+        for mode, s in sorted(snapshot['modes'].items()):
+            lines.append('  [{}] acquires:{} timeouts:{} wait_total:{:.6f}s hold_total:{:.6f}s'.format(
+                mode, s['acquires'], s['timeouts'], s['wait_total'], s['hold_total']))
+            lines.append('    wait: {}'.format(_format_hist(s['wait_hist'])))
+            lines.append('    hold: {}'.format(_format_hist(s['hold_hist'])))
+        for mode, name, secs in snapshot['holders']:
+            lines.append('  holder [{}] {} for {:.6f}s'.format(mode, name, secs))
+        return '\n'.join(lines)
+
+
+class StatLock(object):
+    """包装一个锁对象，在 acquire/release 时记录统计数据；其它属性（如 upgrade）透传
+
+    同一个锁对象可重入（如 RWLockReentrant 的读锁），每层获取分别统计；持有记录按线程区分，
+    释放时先更新统计再释放底层锁，避免其它线程在两者之间获得锁
+    """
+
+    def __init__(self, locker, stat, mode='x'):
+        self._locker = locker
+        self._stat = stat
+        self._mode = mode
+        self._keys = dict()  # 线程 id -> [每层获取在 LockStat 中的 key, ...]，后进先出
+        self._downgraded = False
+
+    def acquire(self, blocking=True, timeout=-1):
+        begin = time.monotonic()
+        ok = self._locker.acquire(blocking, timeout)
+        self._on_acquire(time.monotonic() - begin, ok)
+        return ok
+
+    def release(self):
+        self._pop_key()
+        self._locker.release()
+
+    def locked(self):
+        return self._locker.locked()
+
+    def downgrade(self):
+        result = self._locker.downgrade()
+        if self._keys.get(threading.get_ident()) and not self._locker.locked():  # 写锁降级为读锁后不再持有写锁
+            self._pop_key()
+            self._downgraded = True
+        if result is not None:  # 降级得到的读锁同样统计
+            reader = StatLock(result, self._stat, 'r')
+            reader._on_acquire(0, True)
+            return reader
+        return result
+
+    def _on_acquire(self, wait_secs, ok):
+        tid = threading.get_ident()
+        keys = self._keys.get(tid, ())
+        key = (id(self), tid, len(keys))
+        self._stat.on_acquire(key, self._mode, wait_secs, ok)
+        if ok:
+            self._keys[tid] = list(keys) + [key]
+
+    def _pop_key(self):
+        """撤销当前线程最近一层获取的持有记录；当前线程未持有时不做统计，由底层锁报告错误"""
+        tid = threading.get_ident()
+        keys = self._keys.get(tid)
+        if not keys:
+            return
+        self._stat.on_release(keys.pop())
+        if not keys:
+            del self._keys[tid]
+
+    def __getattr__(self, item):
+        return getattr(self._locker, item)
+
+    def __enter__(self):
+        self.acquire()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self._keys.get(threading.get_ident()) or not self._downgraded:  # 可能已被 downgrade
+            self.release()
+        return False
+
+
+class InstrumentedLock(StatLock):
+    """统计普通锁（threading.Lock 等），可直接用于 rt.LockDecorator 或 with 语句
+
+    注意：同一个 InstrumentedLock 对象不支持重入（RLock）时的逐层统计，重入时仅记录最外层
+    """
+
+    def __init__(self, locker, name):
+        super(InstrumentedLock, self).__init__(locker, register(name))
+        self._depth = 0
+        self._stat_owner = None
+
+    def acquire(self, blocking=True, timeout=-1):
+        if self._depth and self._stat_owner == threading.get_ident():
+            ok = self._locker.acquire(blocking, timeout)
+            if ok:
+                self._depth += 1
+            return ok
+        ok = super(InstrumentedLock, self).acquire(blocking, timeout)
+        if ok:
+            self._stat_owner = threading.get_ident()
+            self._depth = 1
+        return ok
+
+    def release(self):
+        self._depth -= 1
+        if self._depth:
+            self._locker.release()
+        else:
+            self._stat_owner = None
+            super(InstrumentedLock, self).release()
+
+    def __enter__(self):
+        return self.acquire()  # 与 threading.Lock 一致
+
+
+def register(name):
+    """获取（不存在时创建）指定名称的统计对象"""
+    with _registry_locker:
+        stat = _registry.get(name)
+        if stat is None:
+            stat = _registry[name] = LockStat(name)
+        return stat
+
+
+def unregister(name):
+    with _registry_locker:
+        _registry.pop(name, None)
+
+
+def instrument(rw_lock, name):
+    """为 rwlock 中的读写锁开启统计，之后 gen_*lock 生成的锁会被统计；返回统计对象"""
+    rw_lock.c_stat = register(name)
+    return rw_lock.c_stat
+
+
+def uninstrument(rw_lock):
+    rw_lock.c_stat = None
+
+
+def all_stats():
+    with _registry_locker:
+        return [_registry[name] for name in sorted(_registry)]
+
+
+def dump(w):
+    """将所有已注册锁的统计数据写入文本流 w"""
+    for stat in all_stats():
+        w.write(stat.format())
+        w.write('\n')
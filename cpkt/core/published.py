@@ -0,0 +1,81 @@
+"""读多写少数据的发布容器（RCU 风格）
+
+读者通过 get() 取得当前快照，只是一次属性读取，永不阻塞；快照不可修改，读者看到的总是某次发布的完整数据
+写者通过 update(fn) 在写锁内基于当前值的副本生成新值，再整体替换快照（copy-on-write），版本号随之加一
+
+用法：
+    _cfg = Published(dict())
+    _cfg.get().get('key')                       # 读
+    _cfg.update(lambda cfg: cfg.update(a=1))    # 写：修改副本，返回 None 时发布修改后的副本
+    _cfg.update(lambda cfg: dict(b=2))          # 写：返回值即为新值
+    _cfg.publish(dict(c=3))                     # 写：直接发布新值
+"""
+import copy
+import threading
+import types
+
+
+def freeze(value):
+    """将常见的可变容器转换为只读形式：dict -> MappingProxyType，list -> tuple，set -> frozenset
+
+    dict 会先复制一份，之后调用者修改原 dict 不影响快照
+    """
+    if isinstance(value, dict):
+        return types.MappingProxyType(dict(value))
+    if isinstance(value, list):
+        return tuple(value)
+    if isinstance(value, set):
+        return frozenset(value)
+    return value
+
+
+def _thaw(snapshot):
+    """返回快照的可变浅拷贝，供写者修改"""
+    if isinstance(snapshot, types.MappingProxyType):
+        return dict(snapshot)
+    if isinstance(snapshot, tuple):
+        return list(snapshot)
+    if isinstance(snapshot, frozenset):
+        return set(snapshot)
+    return copy.copy(snapshot)
+
+
+class Published(object):
+    def __init__(self, value=None):
+        self._writer = threading.Lock()
+        self._state = (0, freeze(value))  # (版本号, 快照)，整体替换保证两者一致
+
+    def get(self):
+        """返回当前快照"""
+        return self._state[1]
+
+    def get_with_version(self):
+        """返回 (版本号, 快照)"""
+        return self._state
+
+    @property
+    def version(self):
+        return self._state[0]
+
+    def update(self, fn):
+        """以当前值的可变浅拷贝调用 fn，发布其返回值（返回 None 时发布该拷贝）
+
+        fn 在写锁内执行，多个写者依次进行，不会丢失更新；fn 抛出异常时不发布
+        :return: 新的快照
+        """
+        with self._writer:
+            version, snapshot = self._state
+            value = _thaw(snapshot)
+            new_value = fn(value)
+            self._state = (version + 1, freeze(value if new_value is None else new_value))
+            return self._state[1]
+
+    def publish(self, value):
+        """直接发布新值，返回新的快照"""
+        with self._writer:
+            self._state = (self._state[0] + 1, freeze(value))
+            return self._state[1]
+
+    def __repr__(self):
+        version, snapshot = self._state
+        return '<Published v{} {!r}>'.format(version, snapshot)
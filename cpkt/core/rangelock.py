@@ -0,0 +1,147 @@
+"""文件字节区间锁
+
+多个进程可同时锁定同一文件的不同区间（例如日志文件中不同的 512 字节记录），不再需要整个文件的全局锁
+
+用法：
+    locker = RangeLock('/run/xxx.log')
+    with locker.range(index * 512, 512):
+        ...
+    if locker.acquire(0, 512, shared=True, timeout=1):
+        try:
+            ...
+        finally:
+            locker.release(0, 512)
+
+实现：
+    优先使用 Linux 的 OFD 锁（F_OFD_SETLK），锁属于打开的文件描述（open file description）：
+    同一进程内不同 RangeLock 对象（各自 open）之间同样互斥，关闭其它 fd 也不会误释放
+    不支持 OFD 锁时退化为 fcntl.lockf（POSIX 记录锁），锁属于进程：同一进程内不互斥，且进程关闭该文件的任一 fd 都会释放全部锁
+"""
+import errno
+import fcntl
+import os
+import struct
+import sys
+import time
+
+# Python 3.9 之前 fcntl 模块没有导出 OFD 锁常量，使用 Linux 的取值
+F_OFD_GETLK = getattr(fcntl, 'F_OFD_GETLK', 36 if sys.platform.startswith('linux') else None)
+F_OFD_SETLK = getattr(fcntl, 'F_OFD_SETLK', 37 if sys.platform.startswith('linux') else None)
+F_OFD_SETLKW = getattr(fcntl, 'F_OFD_SETLKW', 38 if sys.platform.startswith('linux') else None)
+
+# struct flock { short l_type; short l_whence; off_t l_start; off_t l_len; pid_t l_pid; }，OFD 锁要求 l_pid 为 0
+_FLOCK = struct.Struct('hhqqi4x')
+
+POLL_MIN_SECS = 0.001
+POLL_MAX_SECS = 0.05
+
+
+def _ofd_supported():
+    if F_OFD_SETLK is None:
+        return False
+    fd = os.open(os.devnull, os.O_RDWR)
+    try:
+        fcntl.fcntl(fd, F_OFD_GETLK, _FLOCK.pack(fcntl.F_WRLCK, os.SEEK_SET, 0, 0, 0))
+        return True
+    except OSError:
+        return False
+    finally:
+        os.close(fd)
+
+
+_use_ofd = None  # 首次使用时检测
+
+
+class RangeLock(object):
+    def __init__(self, path_or_fd):
+        """
+        :param path_or_fd: 文件路径（不存在时创建，由本对象打开与关闭）或已打开的 fd（由调用者关闭）
+        """
+        global _use_ofd
+        if _use_ofd is None:
+            _use_ofd = _ofd_supported()
+
+        if isinstance(path_or_fd, int):
+            self.fd = path_or_fd
+            self._own_fd = False
+        else:
+            self.fd = os.open(path_or_fd, os.O_RDWR | os.O_CREAT, 0o666)
+            self._own_fd = True
+        self.ofd = _use_ofd
+
+    def acquire(self, offset, length, shared=False, timeout=None):
+        """锁定 [offset, offset + length) 区间，length 为 0 表示直到文件末尾（包括之后追加的部分）
+
+        :param shared: True 时为共享锁，与其它共享锁不互斥
+        :param timeout: 秒，None 表示阻塞等待；否则以指数退避的非阻塞尝试等待，避免放弃等待后仍残留锁
+        :return: 是否获得锁
+        """
+        if offset < 0 or length < 0:
+            raise ValueError('invalid range offset={} length={}'.format(offset, length))
+
+        if timeout is None:
+            self._lock(offset, length, shared, True)
+            return True
+
+        deadline = time.monotonic() + timeout
+        interval = POLL_MIN_SECS
+        while not self._lock(offset, length, shared, False):
+            remain = deadline - time.monotonic()
+            if remain <= 0:
+                return False
+            time.sleep(min(interval, remain))
+            interval = min(interval * 2, POLL_MAX_SECS)
+        return True
+
+    def release(self, offset, length):
+        if self.ofd:
+            fcntl.fcntl(self.fd, F_OFD_SETLK, _FLOCK.pack(fcntl.F_UNLCK, os.SEEK_SET, offset, length, 0))
+        else:
+            fcntl.lockf(self.fd, fcntl.LOCK_UN, length, offset, os.SEEK_SET)
+
+    def range(self, offset, length, shared=False):
+        """用于 with 语句，阻塞等待锁定区间"""
+        return _Range(self, offset, length, shared)
+
+    def close(self):
+        """关闭自己打开的 fd，该 fd 上的锁随之释放"""
+        if self._own_fd and self.fd >= 0:
+            os.close(self.fd)
+        self.fd = -1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _lock(self, offset, length, shared, wait):
+        try:
+            if self.ofd:
+                fcntl.fcntl(self.fd, F_OFD_SETLKW if wait else F_OFD_SETLK,
+                            _FLOCK.pack(fcntl.F_RDLCK if shared else fcntl.F_WRLCK, os.SEEK_SET, offset, length, 0))
+            else:
+                cmd = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+                fcntl.lockf(self.fd, cmd if wait else cmd | fcntl.LOCK_NB, length, offset, os.SEEK_SET)
+            return True
+        except OSError as e:
+            if not wait and e.errno in (errno.EACCES, errno.EAGAIN):
+                return False
+            raise
+
+    def __str__(self):
+        return '<RangeLock fd:{} ofd:{}>'.format(self.fd, self.ofd)
+
+
+class _Range(object):
+    def __init__(self, locker, offset, length, shared):
+        self.locker = locker
+        self.offset = offset
+        self.length = length
+        self.shared = shared
+
+    def __enter__(self):
+        self.locker.acquire(self.offset, self.length, self.shared)
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.locker.release(self.offset, self.length)
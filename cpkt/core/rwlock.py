@@ -1,5 +1,6 @@
 """Read Write Lock."""
 
+import abc
 import threading
 import time
 from types import TracebackType
@@ -7,10 +8,14 @@ from typing import Callable
 from typing import Optional
 from typing import Type
 
+from cpkt.core import lockstat
+
 
 class RWLockRead(object):
     """A Read/Write lock giving preference to Reader."""
 
+    c_stat = None  # type: lockstat.LockStat  # 由 lockstat.instrument 开启统计
+
     def __init__(self, lock_factory: Callable[[], threading.Lock] = threading.Lock) -> None:
         """Init."""
         self.v_read_count = 0
@@ -92,16 +97,24 @@ class RWLockRead(object):
 
     def gen_rlock(self) -> "RWLockRead._aReader":
         """Generate a reader lock."""
-        return RWLockRead._aReader(self)
+        v_lock = RWLockRead._aReader(self)
+        if self.c_stat is not None:
+            return lockstat.StatLock(v_lock, self.c_stat, 'r')
+        return v_lock
 
     def gen_wlock(self) -> "RWLockRead._aWriter":
         """Generate a writer lock."""
-        return RWLockRead._aWriter(self)
+        v_lock = RWLockRead._aWriter(self)
+        if self.c_stat is not None:
+            return lockstat.StatLock(v_lock, self.c_stat, 'w')
+        return v_lock
 
 
 class RWLockWrite(object):
     """A Read/Write lock giving preference to Writer."""
 
+    c_stat = None  # type: lockstat.LockStat  # 由 lockstat.instrument 开启统计
+
     def __init__(self, lock_factory: Callable[[], threading.Lock] = threading.Lock) -> None:
         """Init."""
         self.v_read_count = 0
@@ -226,16 +239,24 @@ class RWLockWrite(object):
 
     def gen_rlock(self) -> "RWLockWrite._aReader":
         """Generate a reader lock."""
-        return RWLockWrite._aReader(self)
+        v_lock = RWLockWrite._aReader(self)
+        if self.c_stat is not None:
+            return lockstat.StatLock(v_lock, self.c_stat, 'r')
+        return v_lock
 
     def gen_wlock(self) -> "RWLockWrite._aWriter":
         """Generate a writer lock."""
-        return RWLockWrite._aWriter(self)
+        v_lock = RWLockWrite._aWriter(self)
+        if self.c_stat is not None:
+            return lockstat.StatLock(v_lock, self.c_stat, 'w')
+        return v_lock
 
 
 class RWLockFair(object):
     """A Read/Write lock giving fairness to both Reader and Writer."""
 
+    c_stat = None  # type: lockstat.LockStat  # 由 lockstat.instrument 开启统计
+
     def __init__(self, lock_factory: Callable[[], threading.Lock] = threading.Lock) -> None:
         """Init."""
         self.v_read_count = 0
@@ -334,8 +355,463 @@ class RWLockFair(object):
 
     def gen_rlock(self) -> "RWLockFair._aReader":
         """Generate a reader lock."""
-        return RWLockFair._aReader(self)
+        v_lock = RWLockFair._aReader(self)
+        if self.c_stat is not None:
+            return lockstat.StatLock(v_lock, self.c_stat, 'r')
+        return v_lock
 
     def gen_wlock(self) -> "RWLockFair._aWriter":
         """Generate a writer lock."""
-        return RWLockFair._aWriter(self)
+        v_lock = RWLockFair._aWriter(self)
+        if self.c_stat is not None:
+            return lockstat.StatLock(v_lock, self.c_stat, 'w')
+        return v_lock
+
+
+class _RWLockCondBase(abc.ABC):
+    """Base of the Read/Write locks built on a single Condition.
+
+    Every acquire/release takes the condition lock once; deadlines use time.monotonic().
+    """
+
+    c_stat = None  # type: lockstat.LockStat  # 由 lockstat.instrument 开启统计
+
+    def __init__(self, lock_factory: Callable[[], threading.Lock] = threading.Lock) -> None:
+        """Init."""
+        self.v_read_count = 0
+        self.v_writer = False
+        self.c_lock = lock_factory()
+        self.c_cond = threading.Condition(self.c_lock)
+
+    @abc.abstractmethod
+    def _acquire_read(self, timeout: Optional[float]) -> bool:
+        raise NotImplementedError()
+
+    def _release_read(self) -> None:
+        self.v_read_count -= 1
+        if 0 == self.v_read_count:
+            self.c_cond.notify_all()
+
+    @abc.abstractmethod
+    def _acquire_write(self, timeout: Optional[float]) -> bool:
+        raise NotImplementedError()
+
+    def _release_write(self) -> None:
+        self.v_writer = False
+        self.c_cond.notify_all()
+
+    class _aReader(object):
+        def __init__(self, p_RWLock: "_RWLockCondBase") -> None:
+            self.c_rw_lock = p_RWLock
+            self.v_locked = False
+
+        def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+            """Acquire a lock."""
+            p_timeout = None if (blocking and timeout < 0) else (timeout if blocking else 0)
+            with self.c_rw_lock.c_lock:
+                self.v_locked = self.c_rw_lock._acquire_read(p_timeout)
+            return self.v_locked
+
+        def release(self) -> None:
+            """Release the lock."""
+            if not self.v_locked: raise RuntimeError("cannot release un-acquired lock")
+            self.v_locked = False
+            with self.c_rw_lock.c_lock:
+                self.c_rw_lock._release_read()
+
+        def locked(self) -> bool:
+            """Answer to 'is it currently locked?'."""
+            return self.v_locked
+
+        def __enter__(self) -> None:
+            self.acquire()
+
+        def __exit__(self, exc_type: Optional[Type[BaseException]], exc_val: Optional[Exception],
+                     exc_tb: Optional[TracebackType]) -> bool:
+            self.release()
+            return False
+
+    class _aWriter(object):
+        def __init__(self, p_RWLock: "_RWLockCondBase") -> None:
+            self.c_rw_lock = p_RWLock
+            self.v_locked = False
+
+        def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+            """Acquire a lock."""
+            p_timeout = None if (blocking and timeout < 0) else (timeout if blocking else 0)
+            with self.c_rw_lock.c_lock:
+                self.v_locked = self.c_rw_lock._acquire_write(p_timeout)
+            return self.v_locked
+
+        def release(self) -> None:
+            """Release the lock."""
+            if not self.v_locked: raise RuntimeError("cannot release un-acquired lock")
+            self.v_locked = False
+            with self.c_rw_lock.c_lock:
+                self.c_rw_lock._release_write()
+
+        def locked(self) -> bool:
+            """Answer to 'is it currently locked?'."""
+            return self.v_locked
+
+        def __enter__(self) -> None:
+            self.acquire()
+
+        def __exit__(self, exc_type: Optional[Type[BaseException]], exc_val: Optional[Exception],
+                     exc_tb: Optional[TracebackType]) -> bool:
+            self.release()
+            return False
+
+    def gen_rlock(self) -> "_RWLockCondBase._aReader":
+        """Generate a reader lock."""
+        v_lock = _RWLockCondBase._aReader(self)
+        if self.c_stat is not None:
+            return lockstat.StatLock(v_lock, self.c_stat, 'r')
+        return v_lock
+
+    def gen_wlock(self) -> "_RWLockCondBase._aWriter":
+        """Generate a writer lock."""
+        v_lock = _RWLockCondBase._aWriter(self)
+        if self.c_stat is not None:
+            return lockstat.StatLock(v_lock, self.c_stat, 'w')
+        return v_lock
+
+
+class RWLockReadC(_RWLockCondBase):
+    """A Read/Write lock giving preference to Reader, built on a single Condition."""
+
+    def _acquire_read(self, timeout: Optional[float]) -> bool:
+        if self.v_writer and not self.c_cond.wait_for(lambda: not self.v_writer, timeout):
+            return False
+        self.v_read_count += 1
+        return True
+
+    def _acquire_write(self, timeout: Optional[float]) -> bool:
+        if ((self.v_writer or self.v_read_count)
+                and not self.c_cond.wait_for(lambda: not self.v_writer and 0 == self.v_read_count, timeout)):
+            return False
+        self.v_writer = True
+        return True
+
+
+class RWLockWriteC(_RWLockCondBase):
+    """A Read/Write lock giving preference to Writer, built on a single Condition."""
+
+    def __init__(self, lock_factory: Callable[[], threading.Lock] = threading.Lock) -> None:
+        """Init."""
+        super(RWLockWriteC, self).__init__(lock_factory)
+        self.v_write_waiting = 0
+
+    def _acquire_read(self, timeout: Optional[float]) -> bool:
+        if ((self.v_writer or self.v_write_waiting)
+                and not self.c_cond.wait_for(lambda: not self.v_writer and 0 == self.v_write_waiting, timeout)):
+            return False
+        self.v_read_count += 1
+        return True
+
+    def _acquire_write(self, timeout: Optional[float]) -> bool:
+        if self.v_writer or self.v_read_count:
+            self.v_write_waiting += 1
+            try:
+                if not self.c_cond.wait_for(lambda: not self.v_writer and 0 == self.v_read_count, timeout):
+                    self.c_cond.notify_all()  # 放行被本写者阻挡的读者
+                    return False
+            finally:
+                self.v_write_waiting -= 1
+        self.v_writer = True
+        return True
+
+
+class RWLockFairC(_RWLockCondBase):
+    """A Read/Write lock giving fairness to both Reader and Writer, built on a single Condition.
+
+    Phase fair: a waiting writer blocks new readers, and the readers that waited for a writer
+    are admitted before the next writer, so neither side can starve the other.
+    """
+
+    def __init__(self, lock_factory: Callable[[], threading.Lock] = threading.Lock) -> None:
+        """Init."""
+        super(RWLockFairC, self).__init__(lock_factory)
+        self.v_write_waiting = 0
+        self.v_read_waiting = 0
+        self.v_read_turn = 0  # 写者释放时等待中的读者数，这些读者先于下一个写者进入
+
+    def _can_read(self) -> bool:
+        return not self.v_writer and (0 == self.v_write_waiting or self.v_read_turn > 0)
+
+    def _acquire_read(self, timeout: Optional[float]) -> bool:
+        if not self._can_read():
+            self.v_read_waiting += 1
+            try:
+                if not self.c_cond.wait_for(self._can_read, timeout):
+                    self.v_read_turn = min(self.v_read_turn, self.v_read_waiting - 1)
+                    self.c_cond.notify_all()  # v_read_turn 可能已减为 0，放行等待的写者
+                    return False
+            finally:
+                self.v_read_waiting -= 1
+        if self.v_read_turn > 0:
+            self.v_read_turn -= 1
+        self.v_read_count += 1
+        return True
+
+    def _acquire_write(self, timeout: Optional[float]) -> bool:
+        if self.v_writer or self.v_read_count or self.v_read_turn:
+            self.v_write_waiting += 1
+            try:
+                if not self.c_cond.wait_for(
+                        lambda: not self.v_writer and 0 == self.v_read_count and 0 == self.v_read_turn, timeout):
+                    self.c_cond.notify_all()  # 放行被本写者阻挡的读者
+                    return False
+            finally:
+                self.v_write_waiting -= 1
+        self.v_writer = True
+        return True
+
+    def _release_write(self) -> None:
+        self.v_writer = False
+        self.v_read_turn = self.v_read_waiting
+        self.c_cond.notify_all()
+
+
+class RWLockReentrant(_RWLockCondBase):
+    """A reentrant Read/Write lock giving preference to Writer, with an upgradable reader mode.
+
+    - Every lock kind may be nested by the thread holding it; the writer may also take reader locks.
+    - gen_ulock(): at most one upgradable reader at a time, coexisting with plain readers;
+      upgrade() atomically turns it into the writer once other readers drained, since no other
+      writer can slip in while it is held, so state read under it stays valid after upgrading.
+    - gen_wlock().downgrade() atomically turns the writer into a reader.
+    - Acquiring a writer lock while holding only a plain reader lock raises RuntimeError instead of
+      deadlocking; take an upgradable lock instead.
+    """
+
+    def __init__(self, lock_factory: Callable[[], threading.Lock] = threading.Lock) -> None:
+        """Init."""
+        super(RWLockReentrant, self).__init__(lock_factory)
+        self.v_readers = dict()  # 线程 id -> 重入深度
+        self.v_writer = None  # 写者线程 id
+        self.v_write_depth = 0
+        self.v_upgrader = None  # 可升级读者线程 id
+        self.v_upgrade_depth = 0
+        self.v_write_waiting = 0
+
+    def _acquire_read(self, timeout: Optional[float]) -> bool:
+        v_tid = threading.get_ident()
+        if v_tid not in self.v_readers and self.v_writer != v_tid and self.v_upgrader != v_tid:
+            if not self.c_cond.wait_for(lambda: self.v_writer is None and 0 == self.v_write_waiting, timeout):
+                return False
+        self.v_readers[v_tid] = self.v_readers.get(v_tid, 0) + 1
+        return True
+
+    def _release_read(self) -> None:
+        v_tid = threading.get_ident()
+        v_depth = self.v_readers.get(v_tid, 0) - 1
+        if v_depth < 0: raise RuntimeError("cannot release un-acquired lock")
+        if v_depth:
+            self.v_readers[v_tid] = v_depth
+        else:
+            del self.v_readers[v_tid]
+            self.c_cond.notify_all()
+
+    def _acquire_write(self, timeout: Optional[float]) -> bool:
+        v_tid = threading.get_ident()
+        if self.v_writer == v_tid:
+            self.v_write_depth += 1
+            return True
+        if v_tid in self.v_readers and self.v_upgrader != v_tid:
+            raise RuntimeError("cannot acquire writer lock while holding reader lock, use gen_ulock()")
+
+        def p_ready() -> bool:
+            return (self.v_writer is None and self.v_upgrader in (None, v_tid)
+                    and len(self.v_readers) == (1 if v_tid in self.v_readers else 0))
+
+        if not p_ready():
+            self.v_write_waiting += 1
+            try:
+                if not self.c_cond.wait_for(p_ready, timeout):
+                    self.c_cond.notify_all()  # 放行被本写者阻挡的读者
+                    return False
+            finally:
+                self.v_write_waiting -= 1
+        self.v_writer = v_tid
+        self.v_write_depth = 1
+        return True
+
+    def _release_write(self) -> None:
+        if self.v_writer != threading.get_ident(): raise RuntimeError("cannot release un-acquired lock")
+        self.v_write_depth -= 1
+        if 0 == self.v_write_depth:
+            self.v_writer = None
+            self.c_cond.notify_all()
+
+    def _acquire_upgradable(self, timeout: Optional[float]) -> bool:
+        v_tid = threading.get_ident()
+        if self.v_upgrader != v_tid and self.v_writer != v_tid:
+            if not self.c_cond.wait_for(
+                    lambda: self.v_writer is None and self.v_upgrader is None and 0 == self.v_write_waiting, timeout):
+                return False
+        self.v_upgrader = v_tid
+        self.v_upgrade_depth += 1
+        return True
+
+    def _release_upgradable(self) -> None:
+        if self.v_upgrader != threading.get_ident(): raise RuntimeError("cannot release un-acquired lock")
+        self.v_upgrade_depth -= 1
+        if 0 == self.v_upgrade_depth:
+            self.v_upgrader = None
+            self.c_cond.notify_all()
+
+    class _aReader(object):
+        def __init__(self, p_RWLock: "RWLockReentrant", p_depth: int = 0) -> None:
+            self.c_rw_lock = p_RWLock
+            self.v_depth = p_depth
+
+        def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+            """Acquire a lock."""
+            p_timeout = None if (blocking and timeout < 0) else (timeout if blocking else 0)
+            with self.c_rw_lock.c_lock:
+                if not self.c_rw_lock._acquire_read(p_timeout):
+                    return False
+            self.v_depth += 1
+            return True
+
+        def release(self) -> None:
+            """Release the lock."""
+            if not self.v_depth: raise RuntimeError("cannot release un-acquired lock")
+            with self.c_rw_lock.c_lock:
+                self.c_rw_lock._release_read()
+            self.v_depth -= 1
+
+        def locked(self) -> bool:
+            """Answer to 'is it currently locked?'."""
+            return self.v_depth > 0
+
+        def __enter__(self) -> None:
+            self.acquire()
+
+        def __exit__(self, exc_type: Optional[Type[BaseException]], exc_val: Optional[Exception],
+                     exc_tb: Optional[TracebackType]) -> bool:
+            self.release()
+            return False
+
+    class _aWriter(object):
+        def __init__(self, p_RWLock: "RWLockReentrant") -> None:
+            self.c_rw_lock = p_RWLock
+            self.v_depth = 0
+
+        def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+            """Acquire a lock."""
+            p_timeout = None if (blocking and timeout < 0) else (timeout if blocking else 0)
+            with self.c_rw_lock.c_lock:
+                if not self.c_rw_lock._acquire_write(p_timeout):
+                    return False
+            self.v_depth += 1
+            return True
+
+        def release(self) -> None:
+            """Release the lock."""
+            if not self.v_depth: raise RuntimeError("cannot release un-acquired lock")
+            with self.c_rw_lock.c_lock:
+                self.c_rw_lock._release_write()
+            self.v_depth -= 1
+
+        def downgrade(self) -> "RWLockReentrant._aReader":
+            """Atomically turn this writer lock into a reader lock, return the acquired reader lock."""
+            if 1 != self.v_depth: raise RuntimeError("can only downgrade a writer lock acquired once")
+            with self.c_rw_lock.c_lock:
+                v_tid = threading.get_ident()
+                self.c_rw_lock.v_readers[v_tid] = self.c_rw_lock.v_readers.get(v_tid, 0) + 1
+                self.c_rw_lock._release_write()
+            self.v_depth = 0
+            return RWLockReentrant._aReader(self.c_rw_lock, 1)
+
+        def locked(self) -> bool:
+            """Answer to 'is it currently locked?'."""
+            return self.v_depth > 0
+
+        def __enter__(self) -> None:
+            self.acquire()
+
+        def __exit__(self, exc_type: Optional[Type[BaseException]], exc_val: Optional[Exception],
+                     exc_tb: Optional[TracebackType]) -> bool:
+            if self.v_depth:  # 可能已被 downgrade
+                self.release()
+            return False
+
+    class _aUpgrader(object):
+        def __init__(self, p_RWLock: "RWLockReentrant") -> None:
+            self.c_rw_lock = p_RWLock
+            self.v_depth = 0
+            self.v_upgraded = False
+
+        def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+            """Acquire a lock."""
+            p_timeout = None if (blocking and timeout < 0) else (timeout if blocking else 0)
+            with self.c_rw_lock.c_lock:
+                if not self.c_rw_lock._acquire_upgradable(p_timeout):
+                    return False
+            self.v_depth += 1
+            return True
+
+        def release(self) -> None:
+            """Release the lock, downgrading first if upgraded."""
+            if not self.v_depth: raise RuntimeError("cannot release un-acquired lock")
+            with self.c_rw_lock.c_lock:
+                if self.v_upgraded and 1 == self.v_depth:
+                    self.c_rw_lock._release_write()
+                    self.v_upgraded = False
+                self.c_rw_lock._release_upgradable()
+            self.v_depth -= 1
+
+        def upgrade(self, blocking: bool = True, timeout: float = -1) -> bool:
+            """Atomically become the writer once all other readers have released."""
+            if not self.v_depth: raise RuntimeError("cannot upgrade un-acquired lock")
+            if self.v_upgraded: raise RuntimeError("lock already upgraded")
+            p_timeout = None if (blocking and timeout < 0) else (timeout if blocking else 0)
+            with self.c_rw_lock.c_lock:
+                self.v_upgraded = self.c_rw_lock._acquire_write(p_timeout)
+            return self.v_upgraded
+
+        def downgrade(self) -> None:
+            """Atomically go back from writer to upgradable reader."""
+            if not self.v_upgraded: raise RuntimeError("lock not upgraded")
+            with self.c_rw_lock.c_lock:
+                self.c_rw_lock._release_write()
+            self.v_upgraded = False
+
+        def upgraded(self) -> bool:
+            """Answer to 'is it currently upgraded to writer?'."""
+            return self.v_upgraded
+
+        def locked(self) -> bool:
+            """Answer to 'is it currently locked?'."""
+            return self.v_depth > 0
+
+        def __enter__(self) -> None:
+            self.acquire()
+
+        def __exit__(self, exc_type: Optional[Type[BaseException]], exc_val: Optional[Exception],
+                     exc_tb: Optional[TracebackType]) -> bool:
+            self.release()
+            return False
+
+    def gen_rlock(self) -> "RWLockReentrant._aReader":
+        """Generate a reader lock."""
+        v_lock = RWLockReentrant._aReader(self)
+        if self.c_stat is not None:
+            return lockstat.StatLock(v_lock, self.c_stat, 'r')
+        return v_lock
+
+    def gen_wlock(self) -> "RWLockReentrant._aWriter":
+        """Generate a writer lock."""
+        v_lock = RWLockReentrant._aWriter(self)
+        if self.c_stat is not None:
+            return lockstat.StatLock(v_lock, self.c_stat, 'w')
+        return v_lock
+
+    def gen_ulock(self) -> "RWLockReentrant._aUpgrader":
+        """Generate an upgradable reader lock."""
+        v_lock = RWLockReentrant._aUpgrader(self)
+        if self.c_stat is not None:
+            return lockstat.StatLock(v_lock, self.c_stat, 'u')
+        return v_lock
@@ -7,19 +7,21 @@ import time
 import traceback
 from datetime import datetime
 
+from cpkt.core import lockstat
+from cpkt.core import published
 from cpkt.core import rt
 from cpkt.core import xlogging as lg
 
 _logger = lg.get_logger(__name__)
 
-_flags = None  # type: list
+_flags = published.Published(None)  # 调试开关的只读快照（tuple），无开关时为 None
 
 XDEBUG_THREAD_NAME = 'xdebug'
 
 
 def flag_on():
     """使用前缀比较，来判断对应调用者的调试开关是否存在（开启）"""
-    flags = _flags
+    flags = _flags.get()
     if flags is None:
         return False
 
@@ -34,7 +36,7 @@ def flag_on():
 
 def flag_exist():
     """判断对应调用者的调试开关是否存在（开启）"""
-    flags = _flags
+    flags = _flags.get()
     if flags is None:
         return False
 
@@ -43,7 +45,7 @@ def flag_exist():
 
 
 def flag_name_exist(flag_name):
-    flags = _flags
+    flags = _flags.get()
     if flags is None:
         return False
     return flag_name in flags
@@ -60,7 +62,10 @@ class XDebugHelper(threading.Thread):
             1. 死锁类现场的调试
                 在目录下创建文件 dump_thread，开启记录线程调用栈的功能
                 记录线程调用栈的文件 为 dump_thread.txt
-            2. 更新调试开关
+            2. 锁竞争类问题的调试
+                在目录下创建文件 dump_lock_stat，开启记录锁统计数据的功能（锁需先通过 lockstat 开启统计）
+                记录锁统计数据的文件 为 dump_lock_stat.txt
+            3. 更新调试开关
                 在目录下创建文件 flags.txt
                 在 flags.txt 文件中，每一行可记录一个调试开关；调试开关的格式 类似 a.b.c
                 在 python 对应的文件或函数或类的方法中，调用 flag_on 方法可判断 flags.txt 文件中是否有对应的调试开关
@@ -71,6 +76,8 @@ class XDebugHelper(threading.Thread):
         self.dir_path = dir_path
         self.dump_thread_flag_path = os.path.join(dir_path, 'dump_thread')
         self.dump_thread_file_path = self.dump_thread_flag_path + '.txt'
+        self.dump_lock_stat_flag_path = os.path.join(dir_path, 'dump_lock_stat')
+        self.dump_lock_stat_file_path = self.dump_lock_stat_flag_path + '.txt'
 
         self.flags_file_path = os.path.join(dir_path, 'flags.txt')
 
@@ -80,27 +87,35 @@ class XDebugHelper(threading.Thread):
                 time.sleep(self.TIMER_INTERVAL_SECS)
                 self.load_flags()
                 self.dump_thread_logic()
+                self.dump_lock_stat_logic()
             except Exception as e:
                 _logger.error('XDebugHelper thread Exception : {}\n{}'.format(e, lg.format_exception(e)))
 
     def load_flags(self):
-        global _flags
         try:
             with open(self.flags_file_path) as f:
                 new_flags = [l.strip() for l in f.readlines()]
                 if new_flags:
-                    _flags = new_flags
+                    _flags.publish(new_flags)
                 else:
-                    _flags = None
+                    _flags.publish(None)
         except Exception as e:
             _ = e
-            _flags = None
+            _flags.publish(None)
 
     def dump_thread_logic(self):
         if not os.path.exists(self.dump_thread_flag_path):
             return
         self.dump_all_thread_stack()
 
+    def dump_lock_stat_logic(self):
+        if not os.path.exists(self.dump_lock_stat_flag_path):
+            return
+        with open(self.dump_lock_stat_file_path, 'w') as w:
+            w.write('=== begin {} ===\n'.format(datetime.now().strftime("%y-%m-%d (%H:%M:%S.%f)")))
+            lockstat.dump(w)
+            w.write('=== end {} ===\n'.format(datetime.now().strftime("%y-%m-%d (%H:%M:%S.%f)")))
+
     def dump_all_thread_stack(self):
         with open(self.dump_thread_file_path, 'w') as w:
             w.write('=== begin {} ===\n'.format(datetime.now().strftime("%y-%m-%d (%H:%M:%S.%f)")))
@@ -1,5 +1,7 @@
 import json
 
+from cpkt.core import published
+
 CFG_PATH = '/etc/aio/cluster.json'
 """
 {
@@ -21,12 +23,12 @@ CFG_PATH = '/etc/aio/cluster.json'
 }
 """
 
-_cfg = None
+_cfg = published.Published(None)  # 加载后为只读的 dict 快照
 
 
 def _fetch_from_cfg_file(key, default):
     load_cfg_file_only_once()
-    return _cfg.get(key, default)
+    return _cfg.get().get(key, default)
 
 
 def fetch_from_cfg(key, default):
@@ -49,14 +51,17 @@ def is_cluster_mode() -> bool:
 
 
 def load_cfg_file_only_once():
-    global _cfg
-
-    if _cfg is not None:
+    if _cfg.get() is not None:
         return
 
-    try:
-        with open(CFG_PATH) as f:
-            _cfg = json.load(f)
-    except Exception as e:
-        _ = e
-        _cfg = dict()
+    def _load(cfg):
+        if cfg is not None:  # 其它线程已加载
+            return cfg
+        try:
+            with open(CFG_PATH) as f:
+                return json.load(f)
+        except Exception as e:
+            _ = e
+            return dict()
+
+    _cfg.update(_load)
@@ -1,6 +1,6 @@
-import threading
 import re
 
+from cpkt.core import published
 from cpkt.rpc import ice
 
 
@@ -58,8 +58,7 @@ class ProxyHelper(object):
 
     def __init__(self, communicator):
         self._communicator = communicator
-        self._proxy_cache = dict()
-        self._locker = threading.RLock()
+        self._proxy_cache = published.Published(dict())
 
     def _get_proxy_info(self, ident):
         """获取代理信息
@@ -86,15 +85,13 @@ class ProxyHelper(object):
             return info['factory_func'], ident
 
     def get_proxy(self, ident):
-        with self._locker:
-            prx = self._proxy_cache.get(ident)
-            if prx:
-                return prx
+        prx = self._proxy_cache.get().get(ident)
+        if prx:
+            return prx
 
         factory_func, proxy_str = self._get_proxy_info(ident)
         prx = factory_func(self._communicator.stringToProxy(proxy_str))
-        with self._locker:
-            self._proxy_cache[ident] = prx
+        self._proxy_cache.update(lambda cache: cache.update({ident: prx}))
         return prx
 
     @staticmethod
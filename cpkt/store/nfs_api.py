@@ -55,7 +55,8 @@ def reload_nfs_config():
 
 def get_export_dir_from_cfg_file():
     _guid_list = list()
-    with open("/etc/exports", 'r') as f:
+    with filelockv2.FileExLockV2("/etc/exports", filelockv2.FileExLockV2.WAIT_BLOCK, exclusive=False), \
+            open("/etc/exports", 'r') as f:
         _lines = f.readlines()
         for _l in _lines:
             _l = _l.strip().split()
@@ -67,8 +68,11 @@ def get_export_dir_from_cfg_file():
 
 
 def add_nfs_server_dir(src_dir: str, nfs_flag: str):
+    if src_dir in get_export_dir_from_cfg_file():
+        #  已经加过了，只需共享锁即可判断。
+        return
 
-    with filelockv2.FileExLockV2("/etc/exports"):
+    with filelockv2.FileExLockV2("/etc/exports", filelockv2.FileExLockV2.WAIT_BLOCK):
         _logger.info("add_nfs_server_dir({},{})".format(src_dir, nfs_flag))
         _old_dir_list = get_export_dir_from_cfg_file()
         if src_dir in _old_dir_list:
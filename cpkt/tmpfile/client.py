@@ -45,30 +45,44 @@ class TmpFile(object):
             1）获取server的返回值
             2）通过mmap与任务日志文件建立映射 fn：__get_mmap_handle
 
+        4、批量创建 fn：create_many，一次调用服务端添加所有任务，返回共享一个mmap映射的 TmpFileSet
+
     属性:
         file_path：临时文件路径
         caller_msg：调用者信息（包含：创建"临时文件"的代码路径以及所在代码行号），可为空
     """
 
     def __init__(self, file_path: str, delay_delete_seconds: int, caller_msg=None):
+        if not caller_msg:
+            caller_msg = '{2}.{0}({1})'.format(*rt.get_back_function_info(1))
+        self.__setup(file_path, delay_delete_seconds, caller_msg)
+
+        self.__attach(*self._parse_server_return(self.__json_params))  # 获取服务端返回值，获取mmap句柄
+
+    def __setup(self, file_path: str, delay_delete_seconds: int, caller_msg: str):
+        """初始化添加任务前的属性，__init__ 与 create_many 共用"""
+
         self.mmap_handle = None
+        self.owner = None  # 由 create_many 创建时为所属的 TmpFileSet：共享其映射、不负责关闭，并保证映射在本实例释放前不被关闭
         self.is_changed = False  # 当前任务默认未被操作
 
         self.file_path = os.path.realpath(file_path)  # 传入的临时文件路径一律转为真实路径
         assert len(self.file_path) <= common.FILE_PATH_MAX_LENGTH
 
         self.delay_delete_seconds = delay_delete_seconds  # 延迟删除时间(秒)
+        self.caller_msg = caller_msg
 
-        if not caller_msg:
-            self.caller_msg = '{2}.{0}({1})'.format(*rt.get_back_function_info(1))
-        else:
-            self.caller_msg = caller_msg
-
-        self.index, self.logfile_path = self._parse_server_return(self.__json_params)  # 获取服务端返回值
+        self.record_manipulate = common.RecordManipulate()  # 实例:字段解析器
 
-        self.__create_mmap_handle()  # 获取mmap句柄
+    def __attach(self, index: int, logfile_path: str, owner=None):
+        """记录服务端返回值，建立mmap映射；owner 不为 None 时共享其映射，__init__ 与 create_many 共用"""
 
-        self.record_manipulate = common.RecordManipulate()  # 实例:字段解析器
+        self.index, self.logfile_path = index, logfile_path
+        if owner is None:
+            self.__create_mmap_handle()
+        else:
+            self.mmap_handle = owner.mmap_handle
+            self.owner = owner
 
     def __del__(self):
         self.__destroy_mmap_handle()
@@ -85,17 +99,46 @@ class TmpFile(object):
         finally:
             self.__destroy_mmap_handle()
 
+    @classmethod
+    def create_many(cls, file_paths: list, delay_delete_seconds: int, caller_msg=None) -> 'TmpFileSet':
+        """批量添加临时文件任务：一次调用服务端，所有任务共享一个mmap映射
+
+        :return: TmpFileSet，与 file_paths 一一对应
+        """
+
+        if not caller_msg:
+            caller_msg = '{2}.{0}({1})'.format(*rt.get_back_function_info(1))
+        tmp_files = list()
+        for file_path in file_paths:
+            tmp_file = cls.__new__(cls)
+            tmp_file.__setup(file_path, delay_delete_seconds, caller_msg)
+            tmp_files.append(tmp_file)
+
+        param_dict = {
+            "pid": pid,
+            "file_paths": [tmp_file.file_path for tmp_file in tmp_files],
+            "caller_msg": caller_msg,
+            "pid_create_timestamp": pid_create_timestamp,
+            "delete_timestamp": common.EMPTY_TIMESTAMP_STR
+        }
+        indexes, logfile_path = cls._parse_server_return_many(json.dumps(param_dict))
+        assert len(indexes) == len(tmp_files)
+
+        tmp_file_set = TmpFileSet(tmp_files, _open_mmap(logfile_path))
+        for tmp_file, index in zip(tmp_files, indexes):
+            tmp_file.__attach(index, logfile_path, tmp_file_set)
+        return tmp_file_set
+
     def __create_mmap_handle(self):
         """获取映射句柄"""
 
         assert not self.mmap_handle
-        with open(self.logfile_path, "r+b") as f:
-            mmap_handle = mmap.mmap(f.fileno(), 0)
-            self.mmap_handle = mmap_handle
+        self.mmap_handle = _open_mmap(self.logfile_path)
 
     def __destroy_mmap_handle(self):
         if self.mmap_handle:
-            self.mmap_handle.close()
+            if self.owner is None:
+                self.mmap_handle.close()
             self.mmap_handle = None
 
     def __set_changed(self):
@@ -132,16 +175,47 @@ class TmpFile(object):
         _logger.debug("服务端返回值：index={}，logfile_path={}".format(index, logfile_path))
         return index, logfile_path
 
-    def __write(self, new_record):
-        """优先写入状态位(第0位字符)后面的字符"""
+    @staticmethod
+    def _parse_server_return_many(json_params: json):
+        """批量添加：解析服务端返回值（服务端接口 addDelayDelItems 对应 ApiForClient.add_many）"""
+
+        server_return = delaydel_prx.addDelayDelItems(json_params)
+        server_return = json.loads(server_return)
+        indexes = server_return['indexes']
+        logfile_path = server_return['logfile_path']
+        _logger.debug("服务端返回值：{}个index，logfile_path={}".format(len(indexes), logfile_path))
+        return indexes, logfile_path
+
+    def __changes(self, status, change_timestamp, delete_timestamp=None) -> list:
+        """生成修改状态与时间戳要写入的 [(偏移, 新字节), ...]，状态位在最后
+
+        二进制记录只写入变化的字节，文本记录整条重写（状态位为第0位字符）
+        """
+
+        begin_offset, end_offset = common.calc_offset(self.index)
+        record = self.mmap_handle[begin_offset:end_offset]
+        patches = self.record_manipulate.record_patch(record, status, change_timestamp, delete_timestamp)
+        if patches is not None:
+            return [(begin_offset + offset, data) for offset, data in patches]
+
+        record_dict = self.record_manipulate.record_parse(record)
+        record_dict['status'] = status
+        record_dict['change_timestamp'] = change_timestamp
+        if delete_timestamp is not None:
+            record_dict['delete_timestamp'] = delete_timestamp
+        new_record = self.record_manipulate.dict2record(record_dict)
+        return [(begin_offset + 1, new_record[1:]), (begin_offset, new_record[:1])]
+
+    def _delete_changes(self) -> list:
+        """设置删除状态要写入的字节：状态改为 STATUS_WAIT_DELETE，并设置删除时间"""
+
+        set_timestamp = int(time.time())  # 当前操作的时间戳
+        return self.__changes(common.STATUS_WAIT_DELETE, set_timestamp, set_timestamp + self.delay_delete_seconds)
 
-        begin_offset = common.RECORD_LENGTH * (self.index - 1)
-        end_offset = begin_offset + common.RECORD_LENGTH
+    def _cancel_changes(self) -> list:
+        """取消删除要写入的字节：状态改为 STATUS_NOT_DELETE"""
 
-        self.mmap_handle[(begin_offset + 1):end_offset] = new_record[1:]
-        self.mmap_handle.flush()
-        self.mmap_handle[begin_offset] = new_record[0]
-        self.mmap_handle.flush()
+        return self.__changes(common.STATUS_NOT_DELETE, int(time.time()))
 
     def __set_delete(self):
         """自动设置删除状态（当前任务未作任何操作时调用该方法）：日志状态改为 STATUS_WAIT_DELETE"""
@@ -149,14 +223,7 @@ class TmpFile(object):
         # 确保未作修改
         assert not self.is_changed
 
-        set_timestamp = int(time.time())  # 当前操作的时间戳
-        record_dict = self.get_record_dict()
-        record_dict['status'] = common.STATUS_WAIT_DELETE
-        record_dict['change_timestamp'] = set_timestamp
-        record_dict['delete_timestamp'] = set_timestamp + self.delay_delete_seconds  # 设置删除时间
-
-        new_record = self.record_manipulate.dict2record(record_dict)
-        self.__write(new_record)
+        _write_changes(self.mmap_handle, [self._delete_changes()])
         _logger.debug("文件(index{}):{}，已设置为删除状态".format(self.index, self.file_path))
 
     def cancel_delete(self):
@@ -165,12 +232,7 @@ class TmpFile(object):
         self.__set_changed()  # 记录操作状态
 
         # 设置取消状态
-        record_dict = self.get_record_dict()
-        record_dict['status'] = common.STATUS_NOT_DELETE
-        record_dict['change_timestamp'] = int(time.time())
-
-        new_record = self.record_manipulate.dict2record(record_dict)
-        self.__write(new_record)
+        _write_changes(self.mmap_handle, [self._cancel_changes()])
         _logger.debug("文件(index{}):{}，已取消删除".format(self.index, self.file_path))
 
     def confirm_delete(self):
@@ -178,3 +240,97 @@ class TmpFile(object):
 
         self.__set_delete()  # 设置删除状态
         self.__set_changed()  # 记录操作状态
+
+
+class TmpFileSet(object):
+    """TmpFile.create_many 返回的一组临时文件任务，共享一个mmap映射
+
+    描述：
+        1、可迭代、可按下标访问其中的 TmpFile，单个 TmpFile 的操作接口照常可用
+        2、批量操作接口：confirm_delete、cancel_delete，所有记录一起写入，只刷新两次
+        3、with 上下文退出时，未作任何修改的任务自动设置为删除状态，然后关闭mmap映射
+        4、其中的 TmpFile 引用本对象，未显式 close 时映射在本对象及所有 TmpFile 都被释放后才关闭
+    """
+
+    def __init__(self, tmp_files: list, mmap_handle):
+        self.tmp_files = tmp_files
+        self.mmap_handle = mmap_handle
+
+    def __len__(self):
+        return len(self.tmp_files)
+
+    def __iter__(self):
+        return iter(self.tmp_files)
+
+    def __getitem__(self, item):
+        return self.tmp_files[item]
+
+    def __del__(self):
+        self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            self.__set_delete([tmp_file for tmp_file in self.tmp_files if not tmp_file.is_changed])
+        finally:
+            self.close()
+
+    def close(self):
+        """关闭共享的mmap映射，之后不能再操作其中的任务"""
+
+        if self.mmap_handle:
+            for tmp_file in self.tmp_files:
+                tmp_file.mmap_handle = None
+            self.mmap_handle.close()
+            self.mmap_handle = None
+
+    def __set_delete(self, tmp_files):
+        if tmp_files:
+            _write_changes(self.mmap_handle, [tmp_file._delete_changes() for tmp_file in tmp_files])
+            _logger.debug("{}个文件已设置为删除状态".format(len(tmp_files)))
+
+    def cancel_delete(self):
+        """批量取消删除：日志状态改为 STATUS_NOT_DELETE"""
+
+        assert not any(tmp_file.is_changed for tmp_file in self.tmp_files)
+        _write_changes(self.mmap_handle, [tmp_file._cancel_changes() for tmp_file in self.tmp_files])
+        for tmp_file in self.tmp_files:
+            tmp_file.is_changed = True
+        _logger.debug("{}个文件已取消删除".format(len(self.tmp_files)))
+
+    def confirm_delete(self):
+        """批量确认删除：日志状态改为 STATUS_WAIT_DELETE"""
+
+        assert not any(tmp_file.is_changed for tmp_file in self.tmp_files)
+        self.__set_delete(self.tmp_files)
+        for tmp_file in self.tmp_files:
+            tmp_file.is_changed = True
+
+
+def _open_mmap(logfile_path):
+    with open(logfile_path, "r+b") as f:
+        return mmap.mmap(f.fileno(), 0)
+
+
+def _write_changes(mmap_handle, changes_list):
+    """写入若干条记录的修改：先写入状态位以外的字节并刷新，再写入状态位并刷新
+
+    :param changes_list: [[(偏移, 新字节), ...], ...]，每条记录的状态位在最后
+    """
+
+    if not changes_list:
+        return
+
+    begin_offset = min(offset for changes in changes_list for offset, _ in changes)
+    end_offset = max(offset + len(data) for changes in changes_list for offset, data in changes)
+
+    for changes in changes_list:
+        for offset, data in changes[:-1]:
+            mmap_handle[offset:(offset + len(data))] = data
+    common.flush_range(mmap_handle, begin_offset, end_offset)
+    for changes in changes_list:
+        offset, data = changes[-1]
+        mmap_handle[offset:(offset + len(data))] = data
+    common.flush_range(mmap_handle, begin_offset, end_offset)
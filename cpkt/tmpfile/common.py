@@ -1,4 +1,8 @@
 # -*- coding: utf-8 -*-
+import mmap
+import struct
+import threading
+import time
 
 MIN_INDEX = 1  # 日志文件最小记录数
 MAX_INDEX = 40960  # 日志文件最大记录数，20MBytes
@@ -6,14 +10,17 @@ MAX_INDEX = 40960  # 日志文件最大记录数，20MBytes
 PLACE_HOLDER_CHAR = " "  # 空字符
 PLACE_HOLDER_BINARY = PLACE_HOLDER_CHAR.encode('utf-8')[0]
 
-SLEEP_TIME = 120  # 日志扫描周期
+SLEEP_TIME = 120  # 日志扫描周期；无法处理的记录（如挂载目录未挂载）的重试周期
+UNKNOWN_POLL_TIME = 2  # UNKNOWN 状态记录的轮询周期：检查调用者进程是否存活、记录是否被客户端修改（比较原始字节，不解析）
 
 RECORD_LENGTH = 512  # 每条记录长度
 
 PID_LENGTH = 8
 INDEX_LENGTH = 4
 TIMESTAMP_LENGTH = 8  # 时间戳长度
-RECORD_VERSION = "1"  # 记录版本号
+RECORD_VERSION = "1"  # 记录版本号：文本格式
+RECORD_VERSION_BINARY = "2"  # 记录版本号：二进制格式，见 RecordManipulate.binary_format
+WRITE_VERSION = RECORD_VERSION  # 新增记录使用的格式；所有客户端都能解析二进制格式后可改为 RECORD_VERSION_BINARY
 STATUS = [  # 状态域
     'n',  # STATUS_NOT_DELETE
     'y',  # STATUS_WAIT_DELETE
@@ -37,6 +44,16 @@ EMPTY_TIMESTAMP_STR = '0' * TIMESTAMP_LENGTH  # 空时间戳
 PARAM_STR_LIST = ["index", "version", "delete_timestamp", "create_timestamp", "status", "change_timestamp", "pid",
                   "pid_create_timestamp", "file_path", "caller_msg"]
 
+# 二进制记录：固定长度的头部 + file_path + caller_msg（均为 utf-8，长度记录在头部），其余用空字符填充，末尾为 '\n'
+# 头部：magic, version, status, 填充, index, pid, delete_timestamp, create_timestamp, change_timestamp,
+#       pid_create_timestamp, file_path 长度, caller_msg 长度；时间戳为 0 表示 EMPTY_TIMESTAMP_STR
+BINARY_HEADER = struct.Struct('<cBcxIIqqqqHH')
+BINARY_MAGIC = b'\x01'  # 首字节（状态位），不会与文本记录的首字符（16进制数字）或空记录的空字符混淆
+BINARY_STATUS_OFFSET = 2
+BINARY_DELETE_TIMESTAMP_OFFSET = 12
+BINARY_CHANGE_TIMESTAMP_OFFSET = 28
+BINARY_TIMESTAMP = struct.Struct('<q')
+
 
 class RecordManipulate(object):
     """字段解析器"""
@@ -45,9 +62,16 @@ class RecordManipulate(object):
     def hex2int(hex_str: str):
         return int(hex_str, 16)
 
+    @staticmethod
+    def is_binary(record: bytes) -> bool:
+        return record[0:1] == BINARY_MAGIC
+
     @staticmethod
     def record_parse(record: bytes) -> dict:
-        """将存储记录解析为字典格式"""
+        """将存储记录解析为字典格式，支持文本与二进制两种格式"""
+
+        if RecordManipulate.is_binary(record):
+            return RecordManipulate.binary_parse(record)
 
         record = record.decode('utf-8')
         str_list = record.split("|")
@@ -76,7 +100,11 @@ class RecordManipulate(object):
     @staticmethod
     def record_format(index, version, delete_timestamp, create_timestamp, status, change_timestamp, pid,
                       pid_create_timestamp, file_path, caller_msg) -> bytes:
-        """将参数格式化为存储格式"""
+        """将参数格式化为存储格式，version 为 RECORD_VERSION_BINARY 时使用二进制格式"""
+
+        if version == RECORD_VERSION_BINARY:
+            return RecordManipulate.binary_format(index, delete_timestamp, create_timestamp, status, change_timestamp,
+                                                  pid, pid_create_timestamp, file_path, caller_msg)
 
         pid = hex(int(pid))[2:].zfill(PID_LENGTH)
         index = hex(int(index))[2:].zfill(INDEX_LENGTH)
@@ -107,6 +135,68 @@ class RecordManipulate(object):
             params.append(record_dict[i])
         return RecordManipulate.record_format(*params)
 
+    @staticmethod
+    def binary_parse(record: bytes) -> dict:
+        """将二进制记录解析为字典格式"""
+
+        (_, _, status, index, pid, delete_timestamp, create_timestamp, change_timestamp, pid_create_timestamp,
+         file_path_length, caller_msg_length) = BINARY_HEADER.unpack_from(record)
+        file_path_end = BINARY_HEADER.size + file_path_length
+        return {
+            "status": status.decode('utf-8'),
+            "version": RECORD_VERSION_BINARY,
+            "pid": pid,
+            "index": index,
+            "create_timestamp": create_timestamp,
+            "file_path": bytes(record[BINARY_HEADER.size:file_path_end]).decode('utf-8'),
+            "caller_msg": bytes(record[file_path_end:file_path_end + caller_msg_length]).decode('utf-8'),
+            "pid_create_timestamp": pid_create_timestamp,
+            "delete_timestamp": delete_timestamp if delete_timestamp else EMPTY_TIMESTAMP_STR,
+            "change_timestamp": change_timestamp if change_timestamp else EMPTY_TIMESTAMP_STR,
+        }
+
+    @staticmethod
+    def binary_format(index, delete_timestamp, create_timestamp, status, change_timestamp, pid,
+                      pid_create_timestamp, file_path, caller_msg) -> bytes:
+        """将参数格式化为二进制记录，caller_msg 超长时截断"""
+
+        assert status in STATUS
+        assert len(file_path) <= FILE_PATH_MAX_LENGTH
+        file_path = file_path.encode('utf-8')
+        caller_msg = caller_msg.encode('utf-8')
+        caller_msg_max_length = RECORD_LENGTH - 1 - BINARY_HEADER.size - len(file_path)
+        if len(caller_msg) > caller_msg_max_length:
+            caller_msg = caller_msg[:caller_msg_max_length].decode('utf-8', 'ignore').encode('utf-8')
+
+        result = BINARY_HEADER.pack(
+            BINARY_MAGIC, int(RECORD_VERSION_BINARY), status.encode('utf-8'), int(index), int(pid),
+            RecordManipulate.binary_timestamp(delete_timestamp), RecordManipulate.binary_timestamp(create_timestamp),
+            RecordManipulate.binary_timestamp(change_timestamp), RecordManipulate.binary_timestamp(pid_create_timestamp),
+            len(file_path), len(caller_msg)) + file_path + caller_msg
+        return result + PLACE_HOLDER_CHAR.encode('utf-8') * (RECORD_LENGTH - 1 - len(result)) + b'\n'
+
+    @staticmethod
+    def record_patch(record: bytes, status, change_timestamp, delete_timestamp=None):
+        """生成修改状态与时间戳的原地补丁
+
+        :return: [(记录内偏移, 新字节), ...]，状态位在最后，应在其余补丁落盘后写入；文本记录返回 None，需整条重写
+        """
+
+        if not RecordManipulate.is_binary(record):
+            return None
+        assert status in STATUS
+        patches = [(BINARY_CHANGE_TIMESTAMP_OFFSET,
+                    BINARY_TIMESTAMP.pack(RecordManipulate.binary_timestamp(change_timestamp)))]
+        if delete_timestamp is not None:
+            patches.append((BINARY_DELETE_TIMESTAMP_OFFSET,
+                            BINARY_TIMESTAMP.pack(RecordManipulate.binary_timestamp(delete_timestamp))))
+        patches.append((BINARY_STATUS_OFFSET, status.encode('utf-8')))
+        return patches
+
+    @staticmethod
+    def binary_timestamp(timestamp) -> int:
+        return 0 if timestamp == EMPTY_TIMESTAMP_STR else int(timestamp)
+
     @staticmethod
     def timestamp_format(timestamp):
         """时间戳格式化，去掉16进制字符串 '0x' 字符"""
@@ -124,3 +214,75 @@ def calc_offset(index) -> (int, int):
     begin_offset = RECORD_LENGTH * (index - 1)
     end_offset = begin_offset + RECORD_LENGTH
     return begin_offset, end_offset
+
+
+def flush_range(mmap_handle, begin_offset, end_offset):
+    """仅将 [begin_offset, end_offset) 所在的页刷新到磁盘，而不是整个映射"""
+
+    page_begin = begin_offset - begin_offset % mmap.ALLOCATIONGRANULARITY
+    mmap_handle.flush(page_begin, end_offset - page_begin)
+
+
+class GroupFlusher(object):
+    """合并并发写者的刷新（group commit）
+
+    描述：
+        1、第一个请求刷新的写者成为本批次的组长，等待 window 秒收集其它写者的刷新范围后，一次刷新所有范围所在的页；
+           其它写者等待本批次刷新完成后返回
+        2、每个写者的 flush 返回时其范围已落盘，因此“先写其余字节并刷新，再写状态位并刷新”的顺序保证不变
+        3、各批次的刷新依次进行，上一批次刷新期间到达的写者自然合并到下一批次
+    """
+
+    def __init__(self, mmap_handle, window: float):
+        self.mmap_handle = mmap_handle
+        self.window = window
+        self._cond = threading.Condition()
+        self._flush_locker = threading.Lock()  # 保证批次按顺序完成
+        self._batch = 0  # 正在收集的批次号
+        self._collecting = False  # 当前批次是否已有组长
+        self._range = None  # 当前批次的 [begin_offset, end_offset)
+        self._done = -1  # 已完成的最大批次号
+        self._followers = 0  # 当前批次中等待组长刷新的写者数
+        self._errors = dict()  # 批次号 -> [刷新时的异常, 尚未取走异常的写者数]，全部取走后删除
+
+    def flush(self, begin_offset, end_offset):
+        with self._cond:
+            batch = self._batch
+            if self._range is None:
+                self._range = (begin_offset, end_offset)
+            else:
+                self._range = (min(self._range[0], begin_offset), max(self._range[1], end_offset))
+            if self._collecting:
+                self._followers += 1
+                while self._done < batch:
+                    self._cond.wait()
+                error = self._errors.get(batch)
+                if error is not None:
+                    error[1] -= 1
+                    if 0 == error[1]:
+                        del self._errors[batch]
+                    raise error[0]
+                return
+            self._collecting = True
+
+        if self.window > 0:
+            time.sleep(self.window)
+
+        with self._flush_locker:
+            with self._cond:
+                begin_offset, end_offset = self._range
+                followers, self._followers = self._followers, 0
+                self._range = None
+                self._collecting = False
+                self._batch += 1
+            try:
+                flush_range(self.mmap_handle, begin_offset, end_offset)
+            except Exception as e:
+                if followers:
+                    with self._cond:
+                        self._errors[batch] = [e, followers]
+                raise
+            finally:
+                with self._cond:
+                    self._done = batch
+                    self._cond.notify_all()
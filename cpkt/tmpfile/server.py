@@ -1,9 +1,11 @@
 # -*- coding: utf-8 -*-
+import heapq
 import mmap
 import os
 import threading
 import time
 
+from cpkt.core import bitmap
 from cpkt.core import rt
 from cpkt.core import xlogging as lg
 from cpkt.tmpfile import common
@@ -27,7 +29,11 @@ def init_server(persistence_file_path: str):
     background_thread.start()
 
 
-def init_persistence(persistence_file_path):
+def init_persistence(persistence_file_path, group_commit_window=None):
+    """初始化持久化管理器与空间分配器
+
+    :param group_commit_window: 不为 None 时开启刷新合并，见 common.GroupFlusher
+    """
     # 如果日志文件不存在,创建
     if not os.path.exists(persistence_file_path):
         _logger.info('persistence_file_path not exist : {}'.format(persistence_file_path))
@@ -39,7 +45,7 @@ def init_persistence(persistence_file_path):
     # 持久化管理器
     global persistence_manager
     assert persistence_manager is None
-    persistence_manager = PersistenceManager(persistence_file_path)
+    persistence_manager = PersistenceManager(persistence_file_path, group_commit_window)
 
     # 空间分配器
     global index_allocator
@@ -55,15 +61,27 @@ class PersistenceManager(object):
         2、构造时与任务日志文件建立mmap映射
         3、对外提供以下三种操作：
             1、擦除记录 fn：erase(index)
-            2、写入记录 fn：write(index)
+            2、写入记录 fn：write(index)、write_many(records)
             3、读取记录 fn：read(index)
+        4、在内存中维护记录占用位图 occupied（第 index - MIN_INDEX 位对应 index），构造时扫描状态位建立，
+           之后由 write/erase 更新；修改位图须持有 occupied_cond，记录被擦除时通知等待者
     """
 
-    def __init__(self, logfile_path):
+    def __init__(self, logfile_path, group_commit_window=None):
         self.logfile_path = logfile_path
         self.mmap_handle = None
         self.__create_mmap_handle()  # 初始化mmap映射
 
+        # 刷新：仅刷新记录所在页；group_commit_window 不为 None 时合并并发写者的刷新
+        self.flusher = (None if group_commit_window is None
+                        else common.GroupFlusher(self.mmap_handle, group_commit_window))
+
+        self.occupied_cond = threading.Condition()
+        self.occupied = bitmap.IndexedBitMap(bytearray((common.MAX_INDEX + 7) // 8), common.MAX_INDEX)
+        for idx in range(common.MIN_INDEX, common.MAX_INDEX + 1):
+            if not self.is_empty(idx):
+                self.occupied.set(idx - common.MIN_INDEX)
+
     def __del__(self):
         self.__destroy_mmap_handle()
 
@@ -84,9 +102,13 @@ class PersistenceManager(object):
         begin_offset, end_offset = common.calc_offset(index)
 
         self.mmap_handle[begin_offset] = common.ERASE_BINARY[0]
-        self.mmap_handle.flush()
+        self._flush(begin_offset, end_offset)
         self.mmap_handle[(begin_offset + 1): end_offset] = common.ERASE_BINARY[1:]
-        self.mmap_handle.flush()
+        self._flush(begin_offset, end_offset)
+
+        with self.occupied_cond:
+            self.occupied.reset(index - common.MIN_INDEX)
+            self.occupied_cond.notify_all()  # 等待者需要的空闲记录位数不同
 
     def write(self, index: int, new_record: bytes):
         """优先写入状态位(第0位字符)后面的字符"""
@@ -94,10 +116,43 @@ class PersistenceManager(object):
         begin_offset, end_offset = common.calc_offset(index)
         assert len(new_record) == common.RECORD_LENGTH
 
+        with self.occupied_cond:
+            self.occupied.set(index - common.MIN_INDEX)  # 已由 IndexAllocator 预留时不变
+
         self.mmap_handle[(begin_offset + 1):end_offset] = new_record[1:]
-        self.mmap_handle.flush()
+        self._flush(begin_offset, end_offset)
         self.mmap_handle[begin_offset] = new_record[0]
-        self.mmap_handle.flush()
+        self._flush(begin_offset, end_offset)
+
+    def write_many(self, records):
+        """写入多条记录：先写入所有记录状态位后面的字符并刷新一次，再写入所有状态位并刷新一次
+
+        :param records: [(index, record), ...]
+        """
+
+        if not records:
+            return
+        offsets = [common.calc_offset(index) for index, _ in records]
+        begin_offset = min(begin for begin, _ in offsets)
+        end_offset = max(end for _, end in offsets)
+
+        with self.occupied_cond:
+            for index, new_record in records:
+                assert len(new_record) == common.RECORD_LENGTH
+                self.occupied.set(index - common.MIN_INDEX)
+
+        for (begin, end), (_, new_record) in zip(offsets, records):
+            self.mmap_handle[(begin + 1):end] = new_record[1:]
+        self._flush(begin_offset, end_offset)
+        for (begin, _), (_, new_record) in zip(offsets, records):
+            self.mmap_handle[begin] = new_record[0]
+        self._flush(begin_offset, end_offset)
+
+    def _flush(self, begin_offset, end_offset):
+        if self.flusher is None:
+            common.flush_range(self.mmap_handle, begin_offset, end_offset)
+        else:
+            self.flusher.flush(begin_offset, end_offset)
 
     def read(self, index: int) -> bytes:
         """读取index对应记录"""
@@ -125,9 +180,10 @@ class IndexAllocator(object):
     """空间分配器,对外提供一个获取可用index的接口
 
     描述：
-        1、对外接口 fn：get_available_index
+        1、对外接口 fn：get_available_index、get_available_indexes
         2、工作原理：
-            当对外接口被调用，该空间分配器轮询任务日志表，直到获取到可用index，并返回该index
+            在持久化管理器的占用位图上，从 index 指针开始查找第一个空闲记录位，找到后立即在位图中预留，
+            之后由调用者写入记录；不再读取日志文件
     """
 
     class NotFindAvailableIndex(Exception):
@@ -135,47 +191,65 @@ class IndexAllocator(object):
 
     def __init__(self, pm: PersistenceManager):
         self.persistence_manager = pm
-        self.lock = threading.Lock()
+        self.lock = pm.occupied_cond
         self.pointer = common.MIN_INDEX  # index指针
 
-    def get_available_index(self) -> (int, PersistenceManager):
+    def get_available_index(self, timeout=0) -> (int, PersistenceManager):
         """获取可用空间 index
 
+        :param timeout: 没有可用 index 时等待记录被擦除的秒数，None 表示一直等待
         :raise:
-            IndexAllocator.NotFindEmpty 当搜索完毕所有记录位都无法找到可用 index 时抛出
+            IndexAllocator.NotFindAvailableIndex 所有记录位均被占用（且等待超时）时抛出
         :remark:
             index 的有效范围在 [MIN_INDEX, MAX_INDEX]
         """
 
-        count = 0  # 轮询计数指针
+        with self.lock:
+            self.__wait_free(1, timeout)
+            available_index = self.__reserve()
+            _logger.debug("找到可用index: {}".format(available_index))
+            return available_index, self.persistence_manager
+
+    def get_available_indexes(self, count: int, timeout=0) -> (list, PersistenceManager):
+        """一次获取 count 个可用空间 index，参数与异常同 get_available_index
+
+        等待直到同时有 count 个空闲记录位后一次全部预留，等待期间不持有部分预留
+        """
+
+        if count > common.MAX_INDEX - common.MIN_INDEX + 1:
+            raise ValueError('count {} exceeds the number of records {}'.format(
+                count, common.MAX_INDEX - common.MIN_INDEX + 1))
 
         with self.lock:
-            while True:
-                # 限定index指针扫描范围
-                if self.pointer > common.MAX_INDEX:
-                    self.pointer = common.MIN_INDEX
-
-                # 轮询计数器
-                count = self.__check_counter(count)
-
-                # 获取可用的index
-                if self.persistence_manager.is_empty(self.pointer):  # 如果当前pointer所在记录为空
-                    available_index = self.pointer
-                    self.pointer = self.pointer + 1
-                    _logger.debug("找到可用index: {}".format(available_index))
-                    return available_index, self.persistence_manager
-                else:
-                    self.pointer = self.pointer + 1
-
-    def __check_counter(self, count: int) -> int:
-        """轮询计数器，轮询数超过 MAX_COUNT_TIMES，抛出异常"""
-
-        max_scan_count_times = common.MAX_SCAN_TIMES * common.MAX_INDEX
-        if count > max_scan_count_times:
-            _logger.error('搜索完毕{}条记录位,没有找到可用 index'.format(max_scan_count_times))
-            raise self.NotFindAvailableIndex
-        else:
-            return count + 1
+            self.__wait_free(count, timeout)
+            return [self.__reserve() for _ in range(count)], self.persistence_manager
+
+    def __wait_free(self, count, timeout):
+        """持有 self.lock 时调用，等待至少 count 个空闲记录位"""
+
+        occupied = self.persistence_manager.occupied
+        while common.MAX_INDEX - common.MIN_INDEX + 1 - occupied.count() < count:
+            if timeout is not None and timeout <= 0:
+                _logger.error('{}条记录位中空闲的不足{}个,没有找到可用 index'.format(
+                    common.MAX_INDEX - common.MIN_INDEX + 1, count))
+                raise self.NotFindAvailableIndex
+            _logger.debug('没有足够的可用 index，等待记录被擦除')
+            begin = time.monotonic()
+            self.lock.wait(timeout)
+            if timeout is not None:
+                timeout -= time.monotonic() - begin
+
+    def __reserve(self):
+        """持有 self.lock 且确有空闲记录位时调用，从 index 指针开始查找并预留，避免在调用者写入记录前被再次分配"""
+
+        occupied = self.persistence_manager.occupied
+        pos = occupied.find_next_clear(self.pointer - common.MIN_INDEX)
+        if pos < 0:
+            pos = occupied.find_next_clear(0)
+        occupied.set(pos)
+        available_index = pos + common.MIN_INDEX
+        self.pointer = available_index + 1 if available_index < common.MAX_INDEX else common.MIN_INDEX
+        return available_index
 
 
 class Worker(object):
@@ -275,10 +349,11 @@ class ApiForClient(object):
 
     描述：
         1、工作原理：
-            1）获取可用的index（获取获取 index 的时间超出 WAITING_SECONDS 时，抛出异常）
+            1）获取可用的index（日志已满时抛出 IndexAllocator.NotFindAvailableIndex，不等待）
             2）调用字段解析器，将client端的参数格式化为record固定格式
             3）在任务日志文件中写入record
             4）向client端return：index，logfile_path
+        2、批量添加 fn：add_many，一次分配所有 index 并一次写入所有记录（两次刷新），向client端return：index列表，logfile_path
     """
 
     @staticmethod
@@ -288,52 +363,206 @@ class ApiForClient(object):
             delete_timestamp,
             pid_create_timestamp: int,
             status=common.STATUS_UNKNOWN,
-            version=common.RECORD_VERSION,
+            version=None,
             change_timestamp=common.EMPTY_TIMESTAMP_STR,
             ):
-        """添加任务记录"""
+        """添加任务记录
 
-        # 获取可用的index
-        while True:
-            try:
-                available_index, pm = index_allocator.get_available_index()
-                break
-            except IndexAllocator.NotFindAvailableIndex:
-                _logger.debug(r'will sleep {}s. because IndexAllocator.NotFindAvailableIndex'.format(common.SLEEP_TIME))
-                time.sleep(common.SLEEP_TIME)
-
-        # 格式化参数
-        record = common.RecordManipulate.record_format(available_index, version, delete_timestamp,
-                                                       int(time.time()), status, change_timestamp, pid,
-                                                       pid_create_timestamp, file_path, caller_msg)
-        # 写入
-        pm.write(available_index, record)
+        :param version: 记录格式，默认为 common.WRITE_VERSION
+        """
+
+        if version is None:
+            version = common.WRITE_VERSION
+
+        # 获取可用的index，日志已满时立即抛出 NotFindAvailableIndex，由调用者得知
+        available_index, pm = index_allocator.get_available_index(timeout=0)
+
+        try:
+            # 格式化参数
+            record = common.RecordManipulate.record_format(available_index, version, delete_timestamp,
+                                                           int(time.time()), status, change_timestamp, pid,
+                                                           pid_create_timestamp, file_path, caller_msg)
+            # 写入
+            pm.write(available_index, record)
+        except Exception:
+            pm.erase(available_index)  # 归还预留的 index
+            raise
+
+        if background_thread is not None:
+            background_thread.notify(available_index)
         _logger.debug("添加临时文件:{}".format(file_path))
 
         return available_index, index_allocator.persistence_manager.logfile_path
 
+    @staticmethod
+    def add_many(pid: int,
+                 file_paths: list,
+                 caller_msg: str,
+                 delete_timestamp,
+                 pid_create_timestamp: int,
+                 status=common.STATUS_UNKNOWN,
+                 version=None,
+                 change_timestamp=common.EMPTY_TIMESTAMP_STR,
+                 ):
+        """批量添加任务记录：一次分配所有 index，一次写入所有记录，参数同 add
+
+        :return: (与 file_paths 一一对应的 index 列表, logfile_path)
+        """
+
+        if version is None:
+            version = common.WRITE_VERSION
+
+        indexes, pm = index_allocator.get_available_indexes(len(file_paths), timeout=0)  # 空闲不足时立即失败
+
+        try:
+            create_timestamp = int(time.time())
+            records = [(index, common.RecordManipulate.record_format(index, version, delete_timestamp,
+                                                                     create_timestamp, status, change_timestamp,
+                                                                     pid, pid_create_timestamp, file_path,
+                                                                     caller_msg))
+                       for index, file_path in zip(indexes, file_paths)]
+            pm.write_many(records)
+        except Exception:
+            for index in indexes:
+                pm.erase(index)  # 归还预留的 index
+            raise
+
+        if background_thread is not None:
+            for index in indexes:
+                background_thread.notify(index)
+        _logger.debug("批量添加临时文件:{}个".format(len(file_paths)))
+
+        return indexes, index_allocator.persistence_manager.logfile_path
+
 
 class DelayDelWorker(threading.Thread):
-    """后台工作器"""
+    """后台工作器
+
+    描述：
+        1、启动时扫描一次所有已占用的记录，之后只处理有变化或到期的记录：
+            1）WAIT_DELETE 记录按删除时间放入最小堆，到期时处理
+            2）UNKNOWN 记录按调用者进程 (pid, pid_create_timestamp) 索引，每 UNKNOWN_POLL_TIME 秒检查一次进程是否存活，
+               并与缓存的记录原始字节比较，发现客户端（经由 mmap 直接修改）的修改；只解析有变化的记录
+            3）新增记录由 ApiForClient.add 通过 notify 通知
+            4）处理后仍未擦除的记录（如挂载目录未挂载），SLEEP_TIME 秒后重试
+        2、没有待处理的记录时一直休眠，直到被通知
+    """
 
     def __init__(self, pm: PersistenceManager):
         super(DelayDelWorker, self).__init__(name='DelayDelWorker', daemon=True)
         self.persistence_manager = pm
+        self._cond = threading.Condition()
+        self._pending = set()  # 新增的 idx，由 _cond 保护
+        self._stopped = False
+        # 以下仅由工作线程访问
+        self._heap = list()  # [(处理时间戳, idx), ...]
+        self._scheduled = dict()  # idx -> 处理时间戳，用于识别堆中过期的项
+        self._unknown = dict()  # (pid, pid_create_timestamp) -> set(idx)
+        self._unknown_key = dict()  # idx -> (pid, pid_create_timestamp)
+        self._unknown_record = dict()  # idx -> 记录原始字节
+        self._next_poll = 0
+
+    def notify(self, idx: int):
+        """通知记录 idx 已新增或变化"""
+
+        with self._cond:
+            self._pending.add(idx)
+            self._cond.notify()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
 
     def run(self):
-        """轮询任务日志表，依次处理每一条记录，轮询周期:2分钟"""
+        _logger.debug("!!!!! {} 启动扫描!!!!!".format(self.name))
+        with self._cond:
+            self._pending.update(pos + common.MIN_INDEX for pos in self.persistence_manager.occupied.enum_nonzero())
 
         while True:
-            _logger.debug("!!!!! {} 启动扫描!!!!!".format(self.name))
-
-            for idx in range(common.MIN_INDEX, common.MAX_INDEX + 1):
-                try:
-                    record = self.persistence_manager.read(idx)
-                    if record[0] != common.PLACE_HOLDER_BINARY:
-                        Worker(idx, record, self.persistence_manager).work()
-                except Exception as e:
-                    _logger.error(lg.format_exception(e))  # 捕获所有异常，保证线程不会退出
-
-            # 扫完一轮，休眠2分钟，重头开始扫
-            _logger.debug("日志文件已扫描完一轮，扫描周期为{}秒".format(common.SLEEP_TIME))
-            time.sleep(common.SLEEP_TIME)
+            with self._cond:
+                if not self._pending and not self._stopped:
+                    self._cond.wait(self._wait_seconds())
+                if self._stopped:
+                    return
+                pending, self._pending = self._pending, set()
+
+            try:
+                for idx in sorted(pending):
+                    self._check(idx)
+                self._check_due()
+                if self._unknown and time.monotonic() >= self._next_poll:
+                    self._next_poll = time.monotonic() + common.UNKNOWN_POLL_TIME
+                    self._poll_unknown()
+            except Exception as e:
+                _logger.error(lg.format_exception(e))  # 捕获所有异常，保证线程不会退出
+
+    def _wait_seconds(self):
+        """距离下一次需要处理的时间，None 表示无需定时醒来"""
+
+        waits = list()
+        if self._heap:
+            waits.append(self._heap[0][0] - time.time())
+        if self._unknown:
+            waits.append(self._next_poll - time.monotonic())
+        return max(0, min(waits)) if waits else None
+
+    def _schedule(self, idx: int, timestamp: int):
+        if self._scheduled.get(idx) != timestamp:
+            self._scheduled[idx] = timestamp
+            heapq.heappush(self._heap, (timestamp, idx))
+
+    def _check_due(self):
+        now = time.time()
+        while self._heap and self._heap[0][0] <= now:
+            timestamp, idx = heapq.heappop(self._heap)
+            if self._scheduled.get(idx) == timestamp:
+                self._check(idx)
+
+    def _poll_unknown(self):
+        for key, indexes in list(self._unknown.items()):
+            caller_alive = rt.PidReplier.is_pid_exists(*key)
+            for idx in list(indexes):
+                if not caller_alive or self.persistence_manager.read(idx) != self._unknown_record[idx]:
+                    self._check(idx)
+
+    def _forget(self, idx: int):
+        self._scheduled.pop(idx, None)
+        self._unknown_record.pop(idx, None)
+        key = self._unknown_key.pop(idx, None)
+        if key is not None:
+            self._unknown[key].discard(idx)
+            if not self._unknown[key]:
+                del self._unknown[key]
+
+    def _check(self, idx: int):
+        """读取记录 idx，按状态处理、放入最小堆或按调用者进程索引；出现异常时稍后重试"""
+
+        self._forget(idx)
+        try:
+            self.__check(idx)
+        except Exception as e:
+            _logger.error(lg.format_exception(e))
+            self._schedule(idx, int(time.time()) + common.SLEEP_TIME)
+
+    def __check(self, idx: int):
+        record = self.persistence_manager.read(idx)
+        if record[0] == common.PLACE_HOLDER_BINARY:
+            return  # 已擦除，或已分配但尚未写入（写入后会被通知）
+
+        worker = Worker(idx, record, self.persistence_manager)
+        if worker.status == common.STATUS_UNKNOWN and rt.PidReplier.is_pid_exists(
+                worker.pid, worker.pid_create_timestamp):
+            key = (worker.pid, worker.pid_create_timestamp)
+            self._unknown.setdefault(key, set()).add(idx)
+            self._unknown_key[idx] = key
+            self._unknown_record[idx] = record
+            return
+        if (worker.status == common.STATUS_WAIT_DELETE and isinstance(worker.delete_timestamp, int)
+                and worker.delete_timestamp > time.time()):
+            self._schedule(idx, worker.delete_timestamp)
+            return
+
+        worker.work()
+        if not self.persistence_manager.is_empty(idx):
+            self._schedule(idx, int(time.time()) + common.SLEEP_TIME)  # 未能处理，稍后重试
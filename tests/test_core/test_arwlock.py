@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import random
+
+import pytest
+
+from cpkt.core import arwlock
+
+ALL_LOCKS = [arwlock.AsyncRWLockRead, arwlock.AsyncRWLockWrite, arwlock.AsyncRWLockFair]
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+@pytest.mark.parametrize('lock_class', ALL_LOCKS)
+def test_exclusion(lock_class):
+    """测试读者之间共享、读写互斥、写者之间互斥、超时与非阻塞获取"""
+
+    async def main():
+        lock = lock_class()
+        r1, r2, w = lock.gen_rlock(), lock.gen_rlock(), lock.gen_wlock()
+
+        assert await r1.acquire() and await r2.acquire(blocking=False)
+        assert not await w.acquire(blocking=False)
+        assert not await w.acquire(timeout=0.01)
+        r1.release()
+        r2.release()
+
+        assert await w.acquire(timeout=1)
+        assert not await lock.gen_rlock().acquire(timeout=0.01)
+        assert not await lock.gen_wlock().acquire(blocking=False)
+        w.release()
+        with pytest.raises(RuntimeError):
+            w.release()
+
+        async with r1:
+            assert r1.locked()
+        assert not r1.locked()
+        assert not lock.c_waiters and 0 == lock.v_read_count and not lock.v_writer
+
+    run(main())
+
+
+@pytest.mark.parametrize('lock_class', ALL_LOCKS)
+def test_many_tasks_no_lost_wakeup(lock_class):
+    """测试数千个并发任务全部完成（无丢失唤醒），且读写数据一致"""
+
+    async def main():
+        lock = lock_class()
+        state = {'a': 0, 'b': 0, 'readers': 0, 'writers': 0}
+        errors = list()
+        rnd = random.Random(1)
+
+        async def writer():
+            async with lock.gen_wlock():
+                if state['readers'] or state['writers']:
+                    errors.append(dict(state))
+                state['writers'] += 1
+                state['a'] += 1
+                await asyncio.sleep(0)
+                state['b'] += 1
+                state['writers'] -= 1
+
+        async def reader():
+            async with lock.gen_rlock():
+                state['readers'] += 1
+                await asyncio.sleep(0)
+                if state['a'] != state['b'] or state['writers']:
+                    errors.append(dict(state))
+                state['readers'] -= 1
+
+        async def timed_reader():
+            r = lock.gen_rlock()
+            if await r.acquire(timeout=rnd.random() * 0.001):
+                r.release()
+
+        tasks = [rnd.choice([writer, reader, reader, timed_reader])() for _ in range(3000)]
+        await asyncio.wait_for(asyncio.gather(*tasks), 60)
+        assert not errors
+        assert state['a'] == state['b']
+        assert not lock.c_waiters and 0 == lock.v_read_count and not lock.v_writer and 0 == lock.v_write_waiting
+
+    run(main())
+
+
+def _grant_order(lock_class):
+    """持有写锁时依次排队 r1、w1、r2，返回各任务获得锁的顺序"""
+
+    async def main():
+        lock = lock_class()
+        order = list()
+        w = lock.gen_wlock()
+        await w.acquire()
+
+        async def take(name, gen_lock):
+            async with gen_lock():
+                order.append(name)
+                await asyncio.sleep(0.01)
+
+        tasks = list()
+        for name, gen_lock in [('r1', lock.gen_rlock), ('w1', lock.gen_wlock), ('r2', lock.gen_rlock)]:
+            tasks.append(asyncio.ensure_future(take(name, gen_lock)))
+            await asyncio.sleep(0)
+        w.release()
+        await asyncio.gather(*tasks)
+        return order
+
+    return run(main())
+
+
+def test_policies():
+    """测试公平锁按到达顺序授予、写优先锁先授予写者、读优先锁先授予所有读者"""
+
+    assert _grant_order(arwlock.AsyncRWLockFair) == ['r1', 'w1', 'r2']
+    assert _grant_order(arwlock.AsyncRWLockWrite) == ['w1', 'r1', 'r2']
+    assert _grant_order(arwlock.AsyncRWLockRead) == ['r1', 'r2', 'w1']
+
+
+def test_abstract_base():
+    """测试基类未实现授予策略，不能直接实例化"""
+
+    with pytest.raises(TypeError):
+        arwlock._AsyncRWLockBase()
+
+
+@pytest.mark.parametrize('lock_class', [arwlock.AsyncRWLockWrite, arwlock.AsyncRWLockFair])
+def test_waiting_writer_timeout_releases_readers(lock_class):
+    """测试等待中的写者阻止新读者进入；写者超时或被取消后，排在其后的读者被唤醒"""
+
+    async def main():
+        lock = lock_class()
+        r = lock.gen_rlock()
+        await r.acquire()
+
+        writer = asyncio.ensure_future(lock.gen_wlock().acquire(timeout=0.05))
+        await asyncio.sleep(0)
+        reader = lock.gen_rlock()
+        assert await reader.acquire(timeout=1)
+        assert not await writer
+        reader.release()
+
+        writer = asyncio.ensure_future(lock.gen_wlock().acquire())
+        await asyncio.sleep(0)
+        reader = asyncio.ensure_future(lock.gen_rlock().acquire())
+        await asyncio.sleep(0.01)
+        assert not reader.done()
+        writer.cancel()
+        assert await asyncio.wait_for(reader, 1)
+        r.release()
+
+    run(main())
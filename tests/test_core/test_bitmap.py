@@ -0,0 +1,345 @@
+# -*- coding: utf-8 -*-
+import os
+import random
+import threading
+
+import pytest
+
+from cpkt.core import bitmap
+
+
+def _random_bitmap(byte_num, density, max_bit_num=None):
+    data = bytearray(byte_num)
+    for i in range(byte_num):
+        if random.random() < density:
+            data[i] = random.getrandbits(8)
+    return bitmap.BitMap(data, max_bit_num)
+
+
+def _reference_bits(b: bitmap.BitMap) -> list:
+    """逐位读取的参考结果"""
+    return [i for i in range(b.max_bit_num) if b.test(i)]
+
+
+@pytest.mark.parametrize('byte_num', [1, 7, 8, 9, bitmap.CHUNK_BYTES + 3])
+@pytest.mark.parametrize('density', [0, 0.001, 0.5, 1])
+def test_enum_nonzero(byte_num, density):
+    """测试批量枚举与逐位读取结果一致，且不超出 max_bit_num"""
+
+    b = _random_bitmap(byte_num, density, byte_num * 8 - 3)
+    b.set(b.max_bit_num)  # 超出有效范围的位不应被枚举
+    assert list(b.enum_nonzero()) == _reference_bits(b)
+
+
+@pytest.mark.parametrize('byte_num', [1, 8, bitmap.CHUNK_BYTES * 2])
+def test_any_none_all(byte_num):
+    """测试 any/none/all 对末尾不完整字节的处理"""
+
+    b = bitmap.BitMap(bytearray(byte_num), byte_num * 8 - 5)
+    assert b.none() and not b.any() and not b.all()
+
+    b.set(b.max_bit_num + 1)  # 无效位
+    assert b.none() and not b.any()
+
+    b.set(b.max_bit_num - 1)
+    assert b.any() and not b.none() and not b.all()
+
+    b = bitmap.BitMap(bytearray(b'\xff' * (byte_num - 1)) + b'\x07', byte_num * 8 - 5)
+    assert b.all()
+    b.reset(0)
+    assert not b.all()
+
+
+def test_bytes_backend():
+    """测试只读的 bytes 作为底层存储"""
+
+    b = bitmap.BitMap(b'\x00\xF1\x8F', 19)
+    assert list(b.enum_nonzero()) == [8, 12, 13, 14, 15, 16, 17, 18]
+    assert b.any()
+
+
+@pytest.mark.parametrize('byte_num', [1, 8, bitmap.CHUNK_BYTES + 8])
+@pytest.mark.parametrize('tail_bits', [0, 1, 5, 7])
+def test_count(byte_num, tail_bits):
+    """测试计数，末尾不完整字节中的无效位不计入"""
+
+    b = _random_bitmap(byte_num, 0.3, byte_num * 8 - tail_bits)
+    b.bitmap[-1] = 0xFF
+    assert b.count() == len(_reference_bits(b))
+
+
+def _reference_runs(b: bitmap.BitMap, lo: int, hi: int, value: bool) -> list:
+    """逐位读取得到的 run 参考结果"""
+    runs = list()
+    for i in range(max(lo, 0), min(hi, b.max_bit_num)):
+        if b.test(i) != value:
+            continue
+        if runs and runs[-1][0] + runs[-1][1] == i:
+            runs[-1] = (runs[-1][0], runs[-1][1] + 1)
+        else:
+            runs.append((i, 1))
+    return runs
+
+
+@pytest.mark.parametrize('value', [True, False])
+@pytest.mark.parametrize('density', [0, 0.01, 0.5, 1])
+def test_enum_runs(value, density):
+    """测试 run 枚举与逐位读取结果一致"""
+
+    b = _random_bitmap(bitmap.CHUNK_BYTES + 5, density, (bitmap.CHUNK_BYTES + 5) * 8 - 3)
+    for i in range(0, b.max_bytes_num, 4096):  # 插入跨越字、块边界的整段
+        b.bitmap[i:i + 100] = b'\xff' * len(b.bitmap[i:i + 100])
+    assert list(b.enum_runs(value)) == _reference_runs(b, 0, b.max_bit_num, value)
+
+
+@pytest.mark.parametrize('lo, hi', [(0, 1), (3, 61), (5, 8 * 70), (-5, 10 ** 9), (100, 100)])
+def test_enum_runs_between(lo, hi):
+    """测试区间 run 枚举对边界的裁剪"""
+
+    b = _random_bitmap(80, 0.5)
+    for value in (True, False):
+        assert list(b.enum_runs_between(lo, hi, value)) == _reference_runs(b, lo, hi, value)
+
+
+def test_set_algebra():
+    """测试集合运算：长度不同、末尾不完整字节中的无效位不参与计算"""
+
+    a = _random_bitmap(bitmap.CHUNK_BYTES + 9, 0.5, (bitmap.CHUNK_BYTES + 9) * 8 - 3)
+    b = _random_bitmap(13, 0.5, 13 * 8 - 5)
+    b.set(b.max_bit_num + 2)  # 无效位
+    bits_a, bits_b = set(_reference_bits(a)), set(_reference_bits(b))
+
+    assert set(_reference_bits(a & b)) == bits_a & bits_b
+    assert set(_reference_bits(a | b)) == bits_a | bits_b
+    assert set(_reference_bits(b ^ a)) == bits_a ^ bits_b
+    assert set(_reference_bits(a.difference(b))) == bits_a - bits_b
+    assert set(_reference_bits(b.difference(a))) == bits_b - bits_a
+    assert (b | a).max_bit_num == a.max_bit_num
+
+
+def test_set_algebra_in_place():
+    """测试原地集合运算只修改自身有效范围"""
+
+    a = _random_bitmap(9, 0.5, 9 * 8 - 3)
+    b = _random_bitmap(20, 0.5)
+    bits_a, bits_b = set(_reference_bits(a)), set(_reference_bits(b))
+    valid = set(range(a.max_bit_num))
+
+    c = bitmap.BitMap(bytearray(a.bitmap), a.max_bit_num)
+    c |= b
+    assert set(_reference_bits(c)) == (bits_a | bits_b) & valid
+    c &= a
+    assert set(_reference_bits(c)) == bits_a
+    c ^= b
+    assert set(_reference_bits(c)) == (bits_a ^ bits_b) & valid
+    c.difference_update(c)
+    assert c.none()
+
+
+@pytest.mark.parametrize('start, count', [(0, 1), (3, 4), (3, 5), (8, 8), (5, 200), (1, 8 * 90 - 2), (7, 0)])
+def test_range_operations(start, count):
+    """测试区间置位/复位/查询与逐位操作结果一致"""
+
+    b = _random_bitmap(91, 0.5)
+    bits = _reference_bits(b)
+    in_range = [i for i in bits if start <= i < start + count]
+    assert b.count_range(start, count) == len(in_range)
+    assert b.test_range_any(start, count) == bool(in_range)
+    assert b.test_range_all(start, count) == (len(in_range) == count)
+
+    b.set_range(start, count)
+    assert _reference_bits(b) == sorted(set(bits) | set(range(start, start + count)))
+    assert b.test_range_all(start, count)
+
+    b.reset_range(start, count)
+    assert _reference_bits(b) == sorted(set(bits) - set(range(start, start + count)))
+    assert not b.test_range_any(start, count)
+
+
+def test_open_mmap(tmp_path):
+    """测试基于 mmap 的 BitMap：文件补齐、修改落盘、只读映射"""
+
+    path = str(tmp_path / 'bitmap.bin')
+    open(path, 'wb').close()
+
+    b = bitmap.BitMap.open_mmap(path, 8 * 10000, writable=True)
+    b.set_range(3, 5000)
+    b.set(8 * 10000 - 1)
+    b.flush()
+    b.close()
+    assert os.path.getsize(path) == 10000
+
+    b = bitmap.BitMap.open_mmap(path, 8 * 10000)
+    assert list(b.enum_runs()) == [(3, 5000), (8 * 10000 - 1, 1)]
+    with pytest.raises(TypeError):
+        b.set(0)
+    b.close()
+
+    with pytest.raises(ValueError):
+        bitmap.BitMap.open_mmap(path, 8 * 10001)
+
+
+def test_roaring_bitmap():
+    """测试压缩位图：单点操作、容器转换、与平坦格式互转"""
+
+    r = bitmap.RoaringBitMap(bitmap.CONTAINER_BITS * 3 + 17)
+    expected = set()
+    for pos in range(0, bitmap.ARRAY_MAX_SIZE * 2 + 2, 2):  # 超过 ARRAY_MAX_SIZE 转为位集容器
+        r.set(pos)
+        expected.add(pos)
+    for pos in range(bitmap.CONTAINER_BITS * 2, bitmap.CONTAINER_BITS * 3 + 17):  # 长 run
+        r[pos] = True
+        expected.add(pos)
+    r.optimize()
+    for pos in (0, 2, bitmap.CONTAINER_BITS * 2 + 5, 7):
+        r.reset(pos)
+        expected.discard(pos)
+
+    assert r.count() == len(expected)
+    assert list(r.enum_nonzero()) == sorted(expected)
+    assert r.test(4) and not r.test(2) and not r[bitmap.CONTAINER_BITS]
+
+    flat = r.to_bitmap()
+    assert list(flat.enum_nonzero()) == sorted(expected)
+    back = bitmap.RoaringBitMap.from_bitmap(flat)
+    assert list(back.enum_runs()) == list(flat.enum_runs())
+    assert back.nbytes() < flat.max_bytes_num
+
+
+def test_roaring_bitmap_sparse_memory():
+    """测试稀疏位图的压缩效果"""
+
+    flat = bitmap.BitMap(bytearray(bitmap.CONTAINER_BYTES * 64))
+    for i in range(0, flat.max_bit_num, 100000):
+        flat.set_range(i, 1000)
+    r = bitmap.RoaringBitMap.from_bitmap(flat)
+    assert r.count() == len(_reference_bits(flat))
+    assert r.nbytes() * 100 < flat.max_bytes_num
+
+
+@pytest.mark.parametrize('cls', [bitmap.BitMap, bitmap.IndexedBitMap])
+def test_find_next_prev(cls):
+    """测试查找下一个置位/清零位与上一个置位"""
+
+    block_bits = bitmap.SUMMARY_BLOCK_BITS
+    b = cls(bytearray(bitmap.SUMMARY_BLOCK_BYTES * 4), block_bits * 4 - 3)
+    assert b.find_next_set(0) == -1 and b.find_prev_set(b.max_bit_num) == -1
+    assert b.find_next_clear(5) == 5
+
+    b.set(block_bits * 2 + 9)
+    b.set_range(block_bits - 4, 8)
+    assert b.find_next_set(0) == block_bits - 4
+    assert b.find_next_set(block_bits + 4) == block_bits * 2 + 9
+    assert b.find_next_set(block_bits * 2 + 10) == -1
+    assert b.find_prev_set(block_bits * 3) == block_bits * 2 + 9
+    assert b.find_prev_set(block_bits * 2) == block_bits + 3
+    assert b.find_next_clear(block_bits - 4) == block_bits + 4
+
+    b.set_range(0, b.max_bit_num)
+    assert b.find_next_clear(0) == -1 and b.all()
+    b.reset(b.max_bit_num - 1)
+    assert b.find_next_clear(0) == b.max_bit_num - 1
+
+
+def test_indexed_bitmap_summary():
+    """测试摘要随各类修改操作同步更新"""
+
+    block_bits = bitmap.SUMMARY_BLOCK_BITS
+    b = bitmap.IndexedBitMap(bytearray(bitmap.SUMMARY_BLOCK_BYTES * 3))
+    b.set(block_bits + 1)
+    b.flip(block_bits * 2)
+    b[5] = True
+    assert list(b._nonzero_blocks) == [1, 1, 1]
+    b.reset_range(0, block_bits * 2)
+    b.flip(block_bits * 2)
+    assert b.none() and b.find_next_set(0) == -1
+
+    other = bitmap.BitMap(bytearray(bitmap.SUMMARY_BLOCK_BYTES * 3))
+    other.set(block_bits * 2 + 7)
+    b |= other
+    assert b.find_next_set(0) == block_bits * 2 + 7
+    assert (b & other).find_prev_set(b.max_bit_num) == block_bits * 2 + 7
+
+    b.bitmap[0] = 1  # 绕过本对象的修改需重建摘要
+    b.rebuild_summary()
+    assert b.find_next_set(0) == 0
+
+
+@pytest.mark.parametrize('encoding', bitmap.ENCODINGS)
+def test_serialization(encoding):
+    """测试各编码的序列化往返、无效位清零与损坏检测"""
+
+    b = bitmap.BitMap(bytearray(bitmap.CONTAINER_BYTES * 2 + 3), (bitmap.CONTAINER_BYTES * 2 + 3) * 8 - 5)
+    b.set_range(7, 100000)
+    for pos in range(150000, b.max_bit_num, 997):
+        b.set(pos)
+    b.bitmap[-1] |= 0xFF  # 无效位不应被序列化
+
+    data = b.to_bytes(encoding)
+    restored = bitmap.BitMap.from_bytes(data)
+    assert restored.max_bit_num == b.max_bit_num
+    assert list(restored.enum_runs()) == list(b.enum_runs())
+    assert restored.bitmap[-1] == b.bitmap[-1] & 0x07
+
+    corrupted = bytearray(data)
+    corrupted[bitmap._SERIAL_HEADER.size + 8] ^= 0x01  # 首帧数据
+    with pytest.raises(ValueError):
+        bitmap.BitMap.from_bytes(bytes(corrupted))
+    with pytest.raises(ValueError):
+        bitmap.BitMap.from_bytes(data[:len(data) // 2])
+
+
+def test_serialization_stream(tmp_path):
+    """测试通过文件对象流式读写"""
+
+    b = bitmap.BitMap(bytearray(bitmap.CHUNK_BYTES * 3))
+    b.set_range(100, 1000)
+    path = str(tmp_path / 'bitmap.cbmp')
+    with open(path, 'wb') as f:
+        b.write_to(f, 'zlib')
+    with open(path, 'rb') as f:
+        assert list(bitmap.BitMap.read_from(f).enum_runs()) == [(100, 1000)]
+    assert len(b.to_bytes('rle')) < 64
+    with pytest.raises(ValueError):
+        b.to_bytes('gzip')
+
+
+@pytest.mark.parametrize('workers', [1, 3])
+def test_parallel_count_and_reduce(workers, monkeypatch):
+    """测试多进程计数与归约的结果与单进程一致"""
+
+    monkeypatch.setattr(bitmap, 'PARALLEL_MIN_BYTES', 0)
+    maps = [_random_bitmap(bitmap.CHUNK_BYTES * 3 + 5, 0.01, (bitmap.CHUNK_BYTES * 3 + 5) * 8 - 2),
+            _random_bitmap(bitmap.CHUNK_BYTES * 2, 0.01),
+            _random_bitmap(bitmap.CHUNK_BYTES * 4 + 1, 0.01)]
+
+    for b in maps:
+        assert bitmap.parallel_count(b, workers) == b.count()
+
+    expected = {'or': maps[0] | maps[1] | maps[2], 'and': maps[0] & maps[1] & maps[2],
+                'xor': maps[0] ^ maps[1] ^ maps[2], 'andnot': maps[0].difference(maps[1]).difference(maps[2])}
+    for op, e in expected.items():
+        result = bitmap.parallel_reduce(maps, op, workers)
+        assert result.max_bit_num == e.max_bit_num
+        assert result.bitmap[:] == bytes(e.bitmap)
+
+    with pytest.raises(ValueError):
+        bitmap.parallel_reduce(maps, 'nand')
+
+
+def test_parallel_from_threads(monkeypatch):
+    """测试多个线程同时并行计数（子进程不由多线程的调用进程 fork，调用之间不互相等待）"""
+
+    monkeypatch.setattr(bitmap, 'PARALLEL_MIN_BYTES', 0)
+    maps = [_random_bitmap(bitmap.CHUNK_BYTES * 4, 0.01) for _ in range(3)]
+    results = dict()
+
+    def _count(i):
+        results[i] = bitmap.parallel_count(maps[i], 2)
+
+    threads = [threading.Thread(target=_count, args=(i,)) for i in range(len(maps))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(60)
+    assert results == dict((i, b.count()) for i, b in enumerate(maps))
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+import fcntl
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from cpkt.core import filelockv2
+
+
+@pytest.fixture
+def lock_path(tmpdir):
+    return os.path.join(str(tmpdir), 'test.lock')
+
+
+def _handoff_latency(lock_path, wait_mode):
+    """持有者 0.1 秒后释放，返回等待者在释放后多久获得锁"""
+
+    holder = filelockv2.FileExLockV2(lock_path, wait_mode)
+    assert holder.acquire(timeout=0)
+    released = list()
+    acquired = list()
+
+    def waiter():
+        with filelockv2.FileExLockV2(lock_path, wait_mode):
+            acquired.append(time.monotonic())
+
+    t = threading.Thread(target=waiter)
+    t.start()
+    time.sleep(0.1)
+    released.append(time.monotonic())
+    holder.release()
+    t.join()
+    return acquired[0] - released[0]
+
+
+@pytest.mark.parametrize('wait_mode', [filelockv2.FileExLockV2.WAIT_BLOCK, filelockv2.FileExLockV2.WAIT_BACKOFF])
+def test_handoff(lock_path, wait_mode):
+    """测试阻塞/退避模式下释放后等待者很快获得锁（轮询模式需约 1 秒）"""
+
+    assert _handoff_latency(lock_path, wait_mode) < 0.5
+
+
+class _OtherProcessHolder(object):
+    """在子进程中持有文件的排它锁，关闭其标准输入时释放"""
+
+    SCRIPT = ('import fcntl, os, sys\n'
+              'fd = os.open(sys.argv[1], os.O_RDWR | os.O_CREAT)\n'
+              'fcntl.flock(fd, fcntl.LOCK_EX)\n'
+              'print("locked", flush=True)\n'
+              'sys.stdin.read()\n')
+
+    def __init__(self, lock_path):
+        self.proc = subprocess.Popen([sys.executable, '-c', self.SCRIPT, lock_path],
+                                     stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        assert self.proc.stdout.readline().strip() == b'locked'
+
+    def release(self):
+        self.proc.stdin.close()
+        self.proc.wait()
+        self.proc.stdout.close()
+
+
+@pytest.mark.parametrize('wait_mode', filelockv2.FileExLockV2.WAIT_MODES)
+def test_timeout(lock_path, wait_mode):
+    """测试其它进程持有锁时超时返回 False，持有者释放后放弃等待的一方不会残留锁"""
+
+    holder = _OtherProcessHolder(lock_path)
+    threads, fds = threading.active_count(), len(os.listdir('/proc/self/fd'))
+    for _ in range(3):
+        begin = time.monotonic()
+        assert not filelockv2.FileExLockV2(lock_path, wait_mode).acquire(timeout=0.1)
+        assert 0.1 <= time.monotonic() - begin < 1
+    assert not filelockv2.FileExLockV2(lock_path, wait_mode).try_lock()
+    assert threading.active_count() == threads  # 超时返回后不残留等待线程和 fd
+    assert len(os.listdir('/proc/self/fd')) == fds
+    holder.release()
+
+    other = filelockv2.FileExLockV2(lock_path, wait_mode)
+    assert other.acquire(timeout=2)
+    other.release()
+    assert not filelockv2._inodes
+
+    with pytest.raises(ValueError):
+        filelockv2.FileExLockV2(lock_path, 'spin')
+
+
+def test_reentrant_and_threads(lock_path):
+    """测试同一线程嵌套获取同一文件不死锁，其它线程在进程内等待，全部释放后内核锁被释放"""
+
+    with filelockv2.FileExLockV2(lock_path, filelockv2.FileExLockV2.WAIT_BLOCK):
+        with filelockv2.FileExLockV2(lock_path):
+            with filelockv2.FileExLockV2(lock_path, exclusive=False):
+                pass
+        result = list()
+        t = threading.Thread(target=lambda: result.append(filelockv2.FileExLockV2(lock_path).acquire(timeout=0.05)))
+        t.start()
+        t.join()
+        assert result == [False]
+        assert len(filelockv2._inodes) == 1
+
+    assert not filelockv2._inodes
+    fd = os.open(lock_path, os.O_RDWR)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)  # 内核锁已释放
+    finally:
+        os.close(fd)
+
+    shared = filelockv2.FileExLockV2(lock_path, exclusive=False)
+    assert shared.acquire()
+    with pytest.raises(RuntimeError):
+        filelockv2.FileExLockV2(lock_path).acquire()
+    shared.release()
+    assert not filelockv2._inodes
+
+
+def test_shared(lock_path):
+    """测试共享锁：其它进程的共享锁可同时持有，排它锁被阻挡"""
+
+    reader = filelockv2.FileExLockV2(lock_path, filelockv2.FileExLockV2.WAIT_BLOCK, exclusive=False)
+    assert reader.acquire(timeout=0)
+    nested = filelockv2.FileExLockV2(lock_path, exclusive=False)
+    assert nested.acquire(timeout=0)
+    assert filelockv2._inodes[tuple(os.stat(lock_path)[i] for i in (2, 1))].count == 2
+
+    def other_process(operation):
+        fd = os.open(lock_path, os.O_RDWR)
+        try:
+            fcntl.flock(fd, operation | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+        finally:
+            os.close(fd)
+
+    assert other_process(fcntl.LOCK_SH)
+    assert not other_process(fcntl.LOCK_EX)
+    nested.release()
+    reader.release()
+    assert other_process(fcntl.LOCK_EX)
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+import threading
+
+import pytest
+
+from cpkt.core import keyedlock
+
+
+def _try_in_thread(lock):
+    result = list()
+
+    def try_lock():
+        ok = lock.acquire(timeout=0.05)
+        if ok:
+            lock.release()
+        result.append(ok)
+
+    t = threading.Thread(target=try_lock)
+    t.start()
+    t.join()
+    return result[0]
+
+
+def test_stripes():
+    """测试条带模式：相同 key 返回同一把锁，不同条带的 key 可并行"""
+
+    locks = keyedlock.KeyedLocks(4)
+    assert locks.lock_for('disk1') is locks.lock_for('disk1')
+    assert len(set(id(locks.lock_for(i)) for i in range(100))) == 4
+    with locks.lock_for(0):
+        assert not _try_in_thread(locks.lock_for(0))
+        assert _try_in_thread(locks.lock_for(1))
+
+    with pytest.raises(ValueError):
+        keyedlock.KeyedLocks(kind='spin')
+
+
+@pytest.mark.parametrize('exact', [False, True])
+def test_rw(exact):
+    """测试读写锁：相同 key 的读者共享、读写互斥，不同 key 互不影响"""
+
+    locks = keyedlock.KeyedLocks(8, kind='rw', exact=exact)
+    with locks.lock_for(1).gen_rlock():
+        assert _try_in_thread(locks.lock_for(1).gen_rlock())
+        assert not _try_in_thread(locks.lock_for(1).gen_wlock())
+        assert _try_in_thread(locks.lock_for(2).gen_wlock())
+
+
+def test_exact_refcount():
+    """测试精确模式：不同 key 互不影响，锁在空闲时被释放"""
+
+    locks = keyedlock.KeyedLocks(kind='mutex', exact=True)
+    lock = locks.lock_for('a')
+    with lock:
+        assert lock.locked()
+        assert not _try_in_thread(locks.lock_for('a'))
+        assert _try_in_thread(locks.lock_for('b'))
+        assert locks.active_keys() == ['a']
+    assert not lock.locked()
+    assert locks.active_keys() == []
+    with pytest.raises(RuntimeError):
+        lock.release()
+
+
+@pytest.mark.parametrize('kind', keyedlock.KINDS)
+def test_keyed_lock_decorator(kind):
+    """测试装饰器：相同 key 的调用互斥，计数不丢失"""
+
+    locks = keyedlock.KeyedLocks(4, kind=kind, exact=(kind == 'mutex'))
+    counters = dict((key, 0) for key in range(8))
+
+    @locks.keyed_lock(lambda key: key)
+    def incr(key):
+        value = counters[key]
+        threading.Event().wait(0.0001)
+        counters[key] = value + 1
+
+    def worker():
+        for i in range(200):
+            incr(i % 8)
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert counters == dict((key, 100) for key in range(8))
+    assert locks.active_keys() == []
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import time
+
+import pytest
+
+from cpkt.core import leaselock
+
+
+@pytest.fixture
+def lease_path(tmpdir):
+    return os.path.join(str(tmpdir), 'task.lease')
+
+
+def test_exclusion_and_renew(lease_path):
+    """测试租约在续约期间不可被抢占，释放后其它节点立即可获得"""
+
+    a = leaselock.LeaseLock(lease_path, ttl=0.3, node_id='node_a')
+    b = leaselock.LeaseLock(lease_path, ttl=0.3, node_id='node_b')
+    assert a.acquire(timeout=0)
+    assert a.holder()['node'] == 'node_a'
+    assert not b.acquire(timeout=0.6)  # 超过 ttl，但 a 一直在续约
+    assert a.is_held()
+    with pytest.raises(RuntimeError):
+        a.acquire()
+
+    a.release()
+    assert a.holder() is None
+    with b:
+        assert b.is_held()
+        assert b.holder()['node'] == 'node_b'
+    assert not b.is_held()
+
+
+def test_steal(lease_path):
+    """测试抢占：其它节点的过期租约、同一节点上已退出进程的租约"""
+
+    def write_record(**kv):
+        record = {'node': 'node_x', 'pid': os.getpid(), 'pid_ts': 0, 'expire': time.time() + 60, 'token': 'x'}
+        record.update(kv)
+        with open(lease_path, 'w') as f:
+            json.dump(record, f)
+
+    lease = leaselock.LeaseLock(lease_path, ttl=0.3, node_id='node_a')
+    write_record()
+    assert not lease.acquire(timeout=0)
+    write_record(expire=time.time() + 0.2)
+    begin = time.monotonic()
+    assert lease.acquire(timeout=2)
+    assert time.monotonic() - begin < 1
+    lease.release()
+
+    write_record(node='node_a')  # pid_ts 与当前进程不符，视为进程已退出
+    assert lease.acquire(timeout=0)
+
+    write_record()  # 被其它节点抢占，续约时发现
+    time.sleep(0.3)
+    assert not lease.is_held()
+    lease.release()
+    assert lease.holder()['token'] == 'x'  # 不删除别人的记录
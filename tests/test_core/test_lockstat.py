@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+import io
+import threading
+import time
+from unittest.mock import patch
+
+from cpkt.core import lockstat
+from cpkt.core import rt
+from cpkt.core import rwlock
+
+
+def test_rwlock_disabled_by_default():
+    """测试未开启统计时生成的是原始锁对象"""
+
+    lock = rwlock.RWLockWrite()
+    assert isinstance(lock.gen_rlock(), rwlock.RWLockWrite._aReader)
+    assert isinstance(rwlock.RWLockFairC().gen_wlock(), rwlock._RWLockCondBase._aWriter)
+
+
+def test_rwlock_stat():
+    """测试读写锁的获取次数、超时次数、持有者与直方图"""
+
+    lock = rwlock.RWLockFairC()
+    stat = lockstat.instrument(lock, 'test_rwlock_stat')
+    try:
+        r = lock.gen_rlock()
+        with r:
+            holders = stat.snapshot()['holders']
+            assert [(mode, name) for mode, name, _ in holders] == [('r', threading.current_thread().name)]
+            assert not lock.gen_wlock().acquire(timeout=0.01)
+        with lock.gen_wlock():
+            pass
+
+        snapshot = stat.snapshot()
+        assert not snapshot['holders']
+        assert snapshot['modes']['r']['acquires'] == 1
+        assert snapshot['modes']['w']['acquires'] == 1
+        assert snapshot['modes']['w']['timeouts'] == 1
+        assert sum(snapshot['modes']['w']['wait_hist']) == 2
+        assert sum(snapshot['modes']['r']['hold_hist']) == 1
+        assert snapshot['modes']['w']['wait_total'] >= 0.01
+
+        w = io.StringIO()
+        lockstat.dump(w)
+        assert 'lock test_rwlock_stat' in w.getvalue()
+    finally:
+        lockstat.uninstrument(lock)
+        lockstat.unregister('test_rwlock_stat')
+    assert isinstance(lock.gen_rlock(), rwlock._RWLockCondBase._aReader)
+
+
+def test_instrumented_lock_decorator():
+    """测试普通锁包装后配合 LockDecorator 使用，RLock 重入只统计最外层"""
+
+    locker = lockstat.InstrumentedLock(threading.RLock(), 'test_instrumented_lock')
+    try:
+        @rt.LockDecorator(locker)
+        def inner():
+            return 1
+
+        @rt.LockDecorator(locker)
+        def outer():
+            return inner() + 1
+
+        threads = [threading.Thread(target=outer) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert outer() == 2
+
+        snapshot = locker._stat.snapshot()
+        assert snapshot['modes']['x']['acquires'] == 5
+        assert not snapshot['holders']
+    finally:
+        lockstat.unregister('test_instrumented_lock')
+
+
+def test_reentrant_rwlock_stat():
+    """测试开启统计后 RWLockReentrant 的重入、升级与降级"""
+
+    lock = rwlock.RWLockReentrant()
+    stat = lockstat.instrument(lock, 'test_reentrant_rwlock_stat')
+    try:
+        r = lock.gen_rlock()
+        with r as x:
+            assert x is None
+            with r:
+                assert len(stat.snapshot()['holders']) == 2
+            assert len(stat.snapshot()['holders']) == 1
+        assert not stat.snapshot()['holders']
+
+        w = lock.gen_wlock()
+        with w:
+            reader = w.downgrade()
+            assert not w.locked() and reader.locked()
+            assert [mode for mode, _, _ in stat.snapshot()['holders']] == ['r']
+            reader.release()
+
+        u = lock.gen_ulock()
+        with u:
+            assert u.upgrade()
+            u.downgrade()
+            assert u.upgrade()
+        assert not lock.gen_wlock().locked()
+
+        snapshot = stat.snapshot()
+        assert not snapshot['holders']
+        assert snapshot['modes']['r']['acquires'] == 3
+        assert snapshot['modes']['w']['acquires'] == 1
+        assert snapshot['modes']['u']['acquires'] == 1
+        assert sum(snapshot['modes']['r']['hold_hist']) == 3
+    finally:
+        lockstat.uninstrument(lock)
+        lockstat.unregister('test_reentrant_rwlock_stat')
+
+
+def test_instrumented_lock_concurrent():
+    """测试多线程争用时统计不出错：释放时先更新统计再释放底层锁"""
+
+    locker = lockstat.InstrumentedLock(threading.Lock(), 'test_instrumented_lock_concurrent')
+    on_release = lockstat.LockStat.on_release
+    errors = list()
+
+    def _slow_on_release(self, key):
+        time.sleep(0.0005)  # 放大释放统计与释放底层锁之间的窗口
+        on_release(self, key)
+
+    @rt.LockDecorator(locker)
+    def fn():
+        pass
+
+    def _worker():
+        try:
+            for _ in range(50):
+                fn()
+        except Exception as e:
+            errors.append(e)
+
+    try:
+        with patch.object(lockstat.LockStat, 'on_release', _slow_on_release):
+            threads = [threading.Thread(target=_worker) for _ in range(4)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        assert not errors
+        snapshot = locker._stat.snapshot()
+        assert not snapshot['holders']
+        assert snapshot['modes']['x']['acquires'] == 200
+    finally:
+        lockstat.unregister('test_instrumented_lock_concurrent')
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+import threading
+
+import pytest
+
+from cpkt.core import published
+
+
+def test_snapshot_is_immutable():
+    """测试快照只读，发布后修改原值或副本不影响已发布的快照"""
+
+    source = {'a': 1}
+    p = published.Published(source)
+    snapshot = p.get()
+    source['a'] = 2
+    assert snapshot['a'] == 1
+    with pytest.raises(TypeError):
+        snapshot['a'] = 3
+
+    new_snapshot = p.update(lambda cfg: cfg.update(b=2))
+    assert dict(snapshot) == {'a': 1}
+    assert dict(new_snapshot) == {'a': 1, 'b': 2}
+    assert p.get() is new_snapshot
+    assert p.version == 1
+
+    assert p.publish([1, 2]) == (1, 2)
+    assert p.update(lambda value: value + [3]) == (1, 2, 3)
+    assert p.publish(None) is None
+    assert p.get_with_version() == (4, None)
+
+
+def test_update_failure_keeps_snapshot():
+    """测试 fn 抛出异常时不发布"""
+
+    p = published.Published({'a': 1})
+
+    def fail(cfg):
+        cfg['a'] = 2
+        raise ValueError()
+
+    with pytest.raises(ValueError):
+        p.update(fail)
+    assert p.get()['a'] == 1 and p.version == 0
+
+
+def test_concurrent_updates():
+    """测试多个写者并发更新不丢失，读者看到的快照总是一致的"""
+
+    p = published.Published({'a': 0, 'b': 0})
+    errors = list()
+    stop = threading.Event()
+
+    def writer():
+        for _ in range(500):
+            p.update(lambda cfg: cfg.update(a=cfg['a'] + 1, b=cfg['b'] + 1))
+
+    def reader():
+        while not stop.is_set():
+            snapshot = p.get()
+            if snapshot['a'] != snapshot['b']:
+                errors.append(dict(snapshot))
+
+    readers = [threading.Thread(target=reader) for _ in range(2)]
+    writers = [threading.Thread(target=writer) for _ in range(4)]
+    for t in readers + writers:
+        t.start()
+    for t in writers:
+        t.join()
+    stop.set()
+    for t in readers:
+        t.join()
+    assert not errors
+    assert p.get()['a'] == 2000 and p.version == 2000
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from cpkt.core import rangelock
+
+RECORD = 512
+
+
+@pytest.fixture
+def lock_path(tmpdir):
+    return os.path.join(str(tmpdir), 'test.log')
+
+
+def _other_process_try(lock_path, offset, length, shared=False):
+    """在子进程中尝试非阻塞锁定区间"""
+
+    script = ('import sys\n'
+              'from cpkt.core import rangelock\n'
+              'locker = rangelock.RangeLock(sys.argv[1])\n'
+              'print(locker.acquire(int(sys.argv[2]), int(sys.argv[3]), shared=sys.argv[4] == "1", timeout=0))\n')
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(os.path.dirname(rangelock.__file__))))
+    out = subprocess.check_output([sys.executable, '-c', script, lock_path, str(offset), str(length),
+                                   '1' if shared else '0'], env=env)
+    return out.strip() == b'True'
+
+
+def test_records_across_processes(lock_path):
+    """测试不同记录可被不同进程同时锁定，相同记录互斥，共享锁之间不互斥"""
+
+    with rangelock.RangeLock(lock_path) as locker:
+        assert locker.acquire(0, RECORD)
+        assert locker.acquire(2 * RECORD, RECORD, shared=True)
+
+        assert _other_process_try(lock_path, RECORD, RECORD)
+        assert not _other_process_try(lock_path, 0, RECORD)
+        assert not _other_process_try(lock_path, RECORD - 1, 2)
+        assert _other_process_try(lock_path, 2 * RECORD, RECORD, shared=True)
+        assert not _other_process_try(lock_path, 2 * RECORD, RECORD)
+
+        locker.release(0, RECORD)
+        assert _other_process_try(lock_path, 0, RECORD)
+
+    assert _other_process_try(lock_path, 0, 0)  # 关闭后全部释放
+
+    with pytest.raises(ValueError):
+        rangelock.RangeLock(lock_path).acquire(-1, RECORD)
+
+
+@pytest.mark.skipif(not rangelock._ofd_supported(), reason='OFD locks not supported')
+def test_ofd_in_process(lock_path):
+    """测试 OFD 锁：同一进程内不同 RangeLock 对象之间同样互斥，超时返回 False"""
+
+    a = rangelock.RangeLock(lock_path)
+    fd = os.open(lock_path, os.O_RDWR)
+    b = rangelock.RangeLock(fd)
+    try:
+        assert a.ofd
+        with a.range(RECORD, RECORD):
+            begin = time.monotonic()
+            assert not b.acquire(RECORD, RECORD, timeout=0.05)
+            assert time.monotonic() - begin >= 0.05
+            assert b.acquire(0, RECORD, timeout=0)
+        assert b.acquire(RECORD, RECORD, timeout=0)
+        b.close()  # 不关闭调用者传入的 fd
+        os.fstat(fd)
+    finally:
+        os.close(fd)
+        a.close()
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+import pytest
+
+from cpkt.core import rwlock
+
+ALL_LOCKS = [rwlock.RWLockRead, rwlock.RWLockWrite, rwlock.RWLockFair,
+             rwlock.RWLockReadC, rwlock.RWLockWriteC, rwlock.RWLockFairC]
+
+
+@pytest.mark.parametrize('lock_class', ALL_LOCKS)
+def test_exclusion(lock_class):
+    """测试读者之间共享、读写互斥、写者之间互斥"""
+
+    lock = lock_class()
+    r1, r2, w = lock.gen_rlock(), lock.gen_rlock(), lock.gen_wlock()
+
+    assert r1.acquire() and r2.acquire(blocking=False)
+    assert not w.acquire(blocking=False)
+    assert not w.acquire(timeout=0.05)
+    r1.release()
+    r2.release()
+
+    assert w.acquire(timeout=1)
+    assert not lock.gen_rlock().acquire(timeout=0.05)
+    assert not lock.gen_wlock().acquire(blocking=False)
+    w.release()
+    with pytest.raises(RuntimeError):
+        w.release()
+
+    with r1:
+        assert r1.locked()
+    assert not r1.locked()
+
+
+@pytest.mark.parametrize('lock_class', ALL_LOCKS + [rwlock.RWLockReentrant])
+def test_counter_consistency(lock_class):
+    """测试多线程读写下数据一致"""
+
+    lock = lock_class()
+    state = {'a': 0, 'b': 0}
+    errors = list()
+
+    def writer():
+        for _ in range(300):
+            with lock.gen_wlock():
+                state['a'] += 1
+                state['b'] += 1
+
+    def reader():
+        for _ in range(300):
+            with lock.gen_rlock():
+                if state['a'] != state['b']:
+                    errors.append((state['a'], state['b']))
+
+    threads = [threading.Thread(target=fn) for fn in [writer, reader] * 4]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors
+    assert state['a'] == 1200
+
+
+@pytest.mark.parametrize('lock_class', [rwlock.RWLockWrite, rwlock.RWLockWriteC,
+                                        rwlock.RWLockFair, rwlock.RWLockFairC])
+def test_waiting_writer_blocks_new_readers(lock_class):
+    """测试写优先/公平锁：等待中的写者阻止新读者进入；写者超时后读者可进入"""
+
+    lock = lock_class()
+    r = lock.gen_rlock()
+    r.acquire()
+
+    writer_result = list()
+    t = threading.Thread(target=lambda: writer_result.append(lock.gen_wlock().acquire(timeout=0.3)))
+    t.start()
+    time.sleep(0.1)
+    assert not lock.gen_rlock().acquire(timeout=0.05)
+    t.join()
+    assert writer_result == [False]
+    assert lock.gen_rlock().acquire(timeout=0.1)
+    r.release()
+
+
+@pytest.mark.parametrize('lock_class', [rwlock.RWLockRead, rwlock.RWLockReadC])
+def test_reader_preference(lock_class):
+    """测试读优先锁：有写者等待时新读者仍可进入"""
+
+    lock = lock_class()
+    r = lock.gen_rlock()
+    r.acquire()
+    t = threading.Thread(target=lambda: lock.gen_wlock().acquire(timeout=0.3))
+    t.start()
+    time.sleep(0.1)
+    assert lock.gen_rlock().acquire(timeout=0.05)
+    t.join()
+
+
+def _in_thread(gen_lock):
+    """在另一线程中尝试获取锁并立即释放，返回是否获取成功"""
+
+    def try_lock():
+        lock = gen_lock()
+        ok = lock.acquire(timeout=0.05)
+        if ok:
+            lock.release()
+        result.append(ok)
+
+    result = list()
+    t = threading.Thread(target=try_lock)
+    t.start()
+    t.join()
+    return result[0]
+
+
+def test_reentrant():
+    """测试同一线程可重入读锁/写锁，写者可再取读锁，持读锁取写锁报错"""
+
+    lock = rwlock.RWLockReentrant()
+    r, w = lock.gen_rlock(), lock.gen_wlock()
+
+    with r:
+        with r:
+            with lock.gen_rlock():
+                assert not _in_thread(lock.gen_wlock)
+        with pytest.raises(RuntimeError):
+            w.acquire()
+    assert not r.locked()
+
+    with w:
+        with w:
+            with r:
+                assert not _in_thread(lock.gen_rlock)
+        assert not _in_thread(lock.gen_rlock)
+    assert _in_thread(lock.gen_wlock)
+
+
+def test_upgrade_downgrade():
+    """测试可升级读锁与读者共存、排斥其它可升级读者/写者，升级等待读者退出，降级原子完成"""
+
+    lock = rwlock.RWLockReentrant()
+    u = lock.gen_ulock()
+    u.acquire()
+    assert not _in_thread(lock.gen_ulock)
+    assert not _in_thread(lock.gen_wlock)
+    u.release()
+
+    lock = rwlock.RWLockReentrant()
+    u = lock.gen_ulock()
+    r = lock.gen_rlock()
+    other_reader = threading.Event()
+    release_reader = threading.Event()
+
+    def reader():
+        with r:
+            other_reader.set()
+            release_reader.wait()
+
+    t = threading.Thread(target=reader)
+    t.start()
+    other_reader.wait()
+    with u:
+        assert not u.upgrade(timeout=0.05)
+        threading.Timer(0.1, release_reader.set).start()
+        assert u.upgrade(timeout=1)
+        assert u.upgraded()
+        assert not _in_thread(lock.gen_rlock)
+        u.downgrade()
+        assert _in_thread(lock.gen_rlock)
+    t.join()
+
+    lock = rwlock.RWLockReentrant()
+    w = lock.gen_wlock()
+    w.acquire()
+    r = w.downgrade()
+    assert r.locked() and not w.locked()
+    assert not _in_thread(lock.gen_wlock)
+    assert _in_thread(lock.gen_rlock)
+    r.release()
+    with pytest.raises(RuntimeError):
+        r.release()
+    assert _in_thread(lock.gen_wlock)
+
+
+def test_abstract_base():
+    """测试基类未实现加锁策略，不能直接实例化"""
+
+    with pytest.raises(TypeError):
+        rwlock._RWLockCondBase()
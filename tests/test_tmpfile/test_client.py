@@ -1,3 +1,4 @@
+import gc
 import os
 from unittest.mock import patch
 
@@ -97,3 +98,67 @@ def test_confirm_delete():
     """测试:确认删除"""
 
     _test_box(OPERATIONS['Confirm'])
+
+
+@patch.object(target=client.TmpFile, attribute="_parse_server_return", new=get_server_return)
+@patch.object(target=common, attribute="WRITE_VERSION", new=common.RECORD_VERSION_BINARY)
+def test_binary_record():
+    """测试：二进制格式记录的取消删除、确认删除"""
+
+    _test_box(OPERATIONS['Cancel'])
+    _test_box(OPERATIONS['Confirm'])
+
+
+# mock 函数, 批量添加时获取 server 返回值
+def get_server_return_many(*params):
+
+    _ = params
+    return server.ApiForClient().add_many(
+        file_paths=[tmp_file_path + str(i) for i in range(3)],
+        pid=client.pid,
+        caller_msg='',
+        pid_create_timestamp=client.pid_create_timestamp,
+        delete_timestamp=common.EMPTY_TIMESTAMP_STR
+    )
+
+
+@patch.object(target=client.TmpFile, attribute="_parse_server_return_many", new=get_server_return_many)
+def test_create_many():
+    """测试：批量添加，批量取消删除，未修改的任务退出时自动设置删除"""
+
+    file_paths = [tmp_file_path + str(i) for i in range(3)]
+    with client.TmpFile.create_many(file_paths, 0) as tasks:
+        assert [task.file_path for task in tasks] == file_paths
+        assert len(set(task.index for task in tasks)) == 3
+        for task in tasks:
+            assert get_record_dict_by_index(task.index)['status'] == common.STATUS_UNKNOWN
+        tasks[0].cancel_delete()
+    assert get_record_dict_by_index(tasks[0].index)['status'] == common.STATUS_NOT_DELETE
+    for task in tasks[1:]:
+        assert get_record_dict_by_index(task.index)['status'] == common.STATUS_WAIT_DELETE
+        assert get_record_dict_by_index(task.index)['delete_timestamp'] != common.EMPTY_TIMESTAMP_STR
+    assert tasks.mmap_handle is None and all(task.mmap_handle is None for task in tasks)
+
+    for task in tasks:
+        server.persistence_manager.erase(task.index)
+
+    with client.TmpFile.create_many(file_paths, 0) as tasks:
+        tasks.cancel_delete()
+    for task in tasks:
+        assert get_record_dict_by_index(task.index)['status'] == common.STATUS_NOT_DELETE
+        server.persistence_manager.erase(task.index)
+
+
+@patch.object(target=client.TmpFile, attribute="_parse_server_return_many", new=get_server_return_many)
+def test_create_many_keep_one():
+    """测试：只保留其中一个任务，TmpFileSet 被释放后共享的映射仍可用"""
+
+    task = client.TmpFile.create_many([tmp_file_path + str(i) for i in range(3)], 0)[0]
+    gc.collect()
+    task.confirm_delete()
+    assert get_record_dict_by_index(task.index)['status'] == common.STATUS_WAIT_DELETE
+
+    indexes = [t.index for t in task.owner]
+    del task
+    for index in indexes:
+        server.persistence_manager.erase(index)
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+from cpkt.tmpfile import common
+
+RECORD_PARAMS = dict(index=5, delete_timestamp=common.EMPTY_TIMESTAMP_STR, create_timestamp=1700000000,
+                     status=common.STATUS_UNKNOWN, change_timestamp=common.EMPTY_TIMESTAMP_STR, pid=1234,
+                     pid_create_timestamp=1690000000, file_path='/tmp/test_common.txt', caller_msg='caller')
+
+
+def test_text_and_binary_parse():
+    """测试：两种格式解析结果一致"""
+
+    text = common.RecordManipulate.record_format(version=common.RECORD_VERSION, **RECORD_PARAMS)
+    binary = common.RecordManipulate.record_format(version=common.RECORD_VERSION_BINARY, **RECORD_PARAMS)
+    assert len(text) == len(binary) == common.RECORD_LENGTH
+    assert binary[0:1] == common.BINARY_MAGIC and binary[-1:] == b'\n'
+
+    text_dict = common.RecordManipulate.record_parse(text)
+    binary_dict = common.RecordManipulate.record_parse(binary)
+    assert text_dict.pop('version') == common.RECORD_VERSION
+    assert binary_dict.pop('version') == common.RECORD_VERSION_BINARY
+    assert text_dict == binary_dict == dict(RECORD_PARAMS)
+
+
+def test_binary_patch():
+    """测试：原地补丁只修改状态与时间戳，状态位最后写入；文本记录不支持"""
+
+    text = common.RecordManipulate.record_format(version=common.RECORD_VERSION, **RECORD_PARAMS)
+    assert common.RecordManipulate.record_patch(text, common.STATUS_WAIT_DELETE, 1700000001) is None
+
+    binary = common.RecordManipulate.record_format(version=common.RECORD_VERSION_BINARY, **RECORD_PARAMS)
+    patches = common.RecordManipulate.record_patch(binary, common.STATUS_WAIT_DELETE, 1700000001, 1700000100)
+    assert patches[-1][0] == common.BINARY_STATUS_OFFSET
+    record = bytearray(binary)
+    for offset, data in patches:
+        record[offset:offset + len(data)] = data
+
+    expected = dict(RECORD_PARAMS, status=common.STATUS_WAIT_DELETE, change_timestamp=1700000001,
+                    delete_timestamp=1700000100)
+    expected = common.RecordManipulate.record_format(version=common.RECORD_VERSION_BINARY, **expected)
+    assert bytes(record) == expected
+
+
+def test_binary_caller_msg_truncate():
+    """测试：caller_msg 超长时截断，不截断多字节字符"""
+
+    params = dict(RECORD_PARAMS, file_path='/' + 'a' * (common.FILE_PATH_MAX_LENGTH - 1), caller_msg='调用者' * 100)
+    binary = common.RecordManipulate.record_format(version=common.RECORD_VERSION_BINARY, **params)
+    assert len(binary) == common.RECORD_LENGTH
+    caller_msg = common.RecordManipulate.record_parse(binary)['caller_msg']
+    assert caller_msg and params['caller_msg'].startswith(caller_msg)
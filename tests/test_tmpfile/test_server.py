@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
+import mmap
 import os
+import threading
 import time
 from unittest.mock import patch, MagicMock
 
@@ -170,3 +172,216 @@ def test_not_find_available_index():
             record = (common.RECORD_VERSION + common.ERASE_STR[1:]).encode('utf-8')
             server.persistence_manager.write(i, record)
         server.index_allocator.get_available_index()
+
+
+def test_wait_available_index():
+    """测试没有可用index时等待，记录被擦除后立即获得该index"""
+
+    record = (common.RECORD_VERSION + common.ERASE_STR[1:]).encode('utf-8')
+    for i in range(1, common.MAX_INDEX + 1):
+        server.persistence_manager.write(i, record)
+
+    with pytest.raises(server.index_allocator.NotFindAvailableIndex):
+        server.index_allocator.get_available_index(timeout=0.05)
+    with pytest.raises(server.index_allocator.NotFindAvailableIndex):  # 日志已满时添加记录立即失败
+        _add_task(client.pid, client.pid_create_timestamp, common.STATUS_UNKNOWN,
+                  os.path.join(DIR_FOR_TEST, 'test_log_full.txt'), common.EMPTY_TIMESTAMP_STR)
+    rt.delete_file(os.path.join(DIR_FOR_TEST, 'test_log_full.txt'))
+
+    result = list()
+    t = threading.Thread(target=lambda: result.append(server.index_allocator.get_available_index(timeout=5)[0]))
+    t.start()
+    time.sleep(0.1)
+    assert not result
+    server.persistence_manager.erase(7)
+    t.join()
+    assert result == [7]
+
+    for i in range(1, common.MAX_INDEX + 1):
+        server.persistence_manager.erase(i)
+    assert server.persistence_manager.occupied.none()
+    assert server.persistence_manager.is_logfile_empty()
+
+
+def test_delay_del_worker():
+    """测试后台工作器：启动时扫描已有记录，新增记录被通知后处理，到期后及时删除"""
+
+    # 启动前已有的记录：调用者进程已死
+    dead_path = os.path.join(DIR_FOR_TEST, 'test_worker_dead.txt')
+    dead_index, _ = _add_task(10000000, int(time.time()), common.STATUS_UNKNOWN, dead_path,
+                              common.EMPTY_TIMESTAMP_STR)
+
+    # 记录文件的删除时间
+    deleted_at = dict()
+    delete_file = rt.delete_file
+
+    def _delete_file(file_path):
+        deleted_at[file_path] = time.time()
+        return delete_file(file_path)
+
+    patcher = patch.object(rt, 'delete_file', side_effect=_delete_file)
+    patcher.start()
+    worker = server.DelayDelWorker(server.persistence_manager)
+    server.background_thread = worker
+    worker.start()
+    try:
+        # 1 秒后删除
+        wait_path = os.path.join(DIR_FOR_TEST, 'test_worker_wait.txt')
+        wait_delete_timestamp = int(time.time()) + 1
+        wait_index, _ = _add_task(client.pid, client.pid_create_timestamp, common.STATUS_WAIT_DELETE, wait_path,
+                                  wait_delete_timestamp)
+        # 调用者进程存活，由客户端取消删除
+        cancel_path = os.path.join(DIR_FOR_TEST, 'test_worker_cancel.txt')
+        cancel_index, _ = _add_task(client.pid, client.pid_create_timestamp, common.STATUS_UNKNOWN, cancel_path,
+                                    common.EMPTY_TIMESTAMP_STR)
+
+        deadline = time.time() + 5
+        while not _is_file_deleted(dead_path) and time.time() < deadline:
+            time.sleep(0.01)
+        assert _is_file_deleted(dead_path) and _is_record_erased(dead_index)
+
+        # 到期后才删除，且不必等待扫描周期
+        deadline = wait_delete_timestamp + 5
+        while not _is_file_deleted(wait_path) and time.time() < deadline:
+            time.sleep(0.01)
+        assert _is_file_deleted(wait_path) and _is_record_erased(wait_index)
+        assert deleted_at[wait_path] >= wait_delete_timestamp
+
+        record_dict = test_client.get_record_dict_by_index(cancel_index)
+        record_dict['status'] = common.STATUS_NOT_DELETE
+        server.persistence_manager.write(cancel_index, common.RecordManipulate.dict2record(record_dict))
+        deadline = time.time() + common.UNKNOWN_POLL_TIME + 5
+        while not _is_record_erased(cancel_index) and time.time() < deadline:
+            time.sleep(0.01)
+        assert _is_record_erased(cancel_index) and not _is_file_deleted(cancel_path)
+    finally:
+        worker.stop()
+        worker.join()
+        server.background_thread = None
+        patcher.stop()
+        rt.delete_file(cancel_path)
+
+
+def test_group_flusher():
+    """并发写者的刷新被合并，每个写者返回时其范围已刷新"""
+
+    class _FakeMmap(object):
+        def __init__(self):
+            self.flushed = list()
+
+        def flush(self, offset, size):
+            time.sleep(0.01)
+            self.flushed.append((offset, offset + size))
+
+    fake = _FakeMmap()
+    flusher = common.GroupFlusher(fake, 0.05)
+    covered = list()
+
+    def _writer(index):
+        begin = index * common.RECORD_LENGTH
+        flusher.flush(begin, begin + common.RECORD_LENGTH)
+        covered.append(any(b <= begin and begin + common.RECORD_LENGTH <= e for b, e in fake.flushed))
+
+    threads = [threading.Thread(target=_writer, args=(i,)) for i in range(16)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(covered) == 16 and all(covered)
+    assert len(fake.flushed) < 16
+    assert all(0 == b % mmap.ALLOCATIONGRANULARITY for b, _ in fake.flushed)
+
+
+def test_add_many():
+    """测试：批量添加记录；可用 index 不足时等待期间不预留，其它添加不受影响"""
+
+    file_paths = [os.path.join(DIR_FOR_TEST, 'test_add_many_{}.txt'.format(i)) for i in range(5)]
+    indexes, logfile_path = server.ApiForClient().add_many(
+        pid=client.pid, file_paths=file_paths, caller_msg='caller_msg', delete_timestamp=common.EMPTY_TIMESTAMP_STR,
+        pid_create_timestamp=client.pid_create_timestamp)
+    assert logfile_path == server.persistence_manager.logfile_path
+    assert len(set(indexes)) == len(file_paths)
+    for index, file_path in zip(indexes, file_paths):
+        record_dict = test_client.get_record_dict_by_index(index)
+        assert record_dict['index'] == index and record_dict['file_path'] == file_path
+        assert record_dict['status'] == common.STATUS_UNKNOWN
+        server.persistence_manager.erase(index)
+
+    occupied = server.persistence_manager.occupied
+    reserved_index, _ = server.index_allocator.get_available_index()
+    used = occupied.count()
+    free = common.MAX_INDEX - common.MIN_INDEX + 1 - used
+    with pytest.raises(server.IndexAllocator.NotFindAvailableIndex):
+        server.index_allocator.get_available_indexes(free + 1, timeout=0.1)
+    assert occupied.count() == used
+
+    result = list()
+    t = threading.Thread(target=lambda: result.append(server.index_allocator.get_available_indexes(free + 1, 5)[0]))
+    t.start()
+    time.sleep(0.1)
+    assert not result and occupied.count() == used  # 等待期间不持有部分预留
+    other_index, _ = server.index_allocator.get_available_index()
+    server.persistence_manager.erase(reserved_index)
+    server.persistence_manager.erase(other_index)
+    t.join()
+    assert len(result) == 1 and len(set(result[0])) == free + 1
+    for index in result[0]:
+        server.persistence_manager.erase(index)
+    assert occupied.count() == used - 1
+
+
+def test_poll_unknown_parse_count():
+    """测试：轮询 UNKNOWN 记录时只解析被修改的记录"""
+
+    worker = server.DelayDelWorker(server.persistence_manager)
+    file_paths = [os.path.join(DIR_FOR_TEST, 'test_poll_{}.txt'.format(i)) for i in range(20)]
+    indexes, _ = server.ApiForClient().add_many(
+        pid=client.pid, file_paths=file_paths, caller_msg='caller_msg', delete_timestamp=common.EMPTY_TIMESTAMP_STR,
+        pid_create_timestamp=client.pid_create_timestamp)
+    try:
+        for index in indexes:
+            worker._check(index)
+
+        record_dict = test_client.get_record_dict_by_index(indexes[0])
+        record_dict['status'] = common.STATUS_NOT_DELETE
+        record_parse = common.RecordManipulate.record_parse
+        with patch.object(common.RecordManipulate, 'record_parse', side_effect=record_parse) as parse:
+            worker._poll_unknown()
+            assert parse.call_count == 0
+
+            server.persistence_manager.write(indexes[0], common.RecordManipulate.dict2record(record_dict))
+            worker._poll_unknown()
+            assert parse.call_count == 1
+        assert _is_record_erased(indexes[0])
+    finally:
+        for index in indexes:
+            server.persistence_manager.erase(index)
+
+
+def test_group_flusher_error():
+    """测试：刷新失败时本批次所有写者都收到异常，异常被取走后不再保留"""
+
+    class _FailingMmap(object):
+        def flush(self, offset, size):
+            time.sleep(0.01)
+            raise OSError('flush failed')
+
+    flusher = common.GroupFlusher(_FailingMmap(), 0.05)
+    errors = list()
+
+    def _writer(index):
+        begin = index * common.RECORD_LENGTH
+        try:
+            flusher.flush(begin, begin + common.RECORD_LENGTH)
+        except OSError as e:
+            errors.append(e)
+
+    for _ in range(3):
+        threads = [threading.Thread(target=_writer, args=(i,)) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    assert len(errors) == 24
+    assert not flusher._errors